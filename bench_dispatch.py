@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""bench_dispatch.py — Microbenchmark of the input_engine.py injection hot path.
+
+Compares the original decoder (struct.unpack_from loop + if/elif chain with
+ecodes.* lookups) against the current one (Struct.iter_unpack +
+InjectionEngine dispatch table) on a fake device, so no /dev/uinput is
+needed. Both write the same SYN_REPORT frames, so only decode and dispatch
+cost is compared, not framing.
+
+Usage:
+    python3 bench_dispatch.py                    # 20000 datagrams, 5 events each
+    python3 bench_dispatch.py --datagrams 50000 --events 10
+"""
+
+import argparse
+import os
+import random
+import struct
+import time
+
+from evdev import ecodes
+
+import input_engine
+from input_engine import (EVENT_FMT, EVENT_SIZE, EVT_MOUSE_MOVE, EVT_MOUSE_DOWN,
+                          EVT_MOUSE_UP, EVT_KEY_DOWN, EVT_KEY_UP, NullDevice)
+
+
+class DevNullUInput:
+    """Stand-in for python-evdev UInput whose fd points at /dev/null."""
+
+    def __init__(self):
+        self.fd = os.open(os.devnull, os.O_WRONLY)
+
+    def close(self):
+        os.close(self.fd)
+
+
+# ---------------------------------------------------------------------------
+# Baseline: the decoder as it was before the dispatch table. The original
+# sent a SYN_REPORT after every event; here it frames like InjectionEngine
+# (a new frame only when a slot or key repeats) so both write the same frames.
+# ---------------------------------------------------------------------------
+legacy_active_slots = set()
+legacy_frame_slots = set()
+legacy_frame_keys = set()
+
+
+def legacy_syn(dev):
+    dev.syn()
+    legacy_frame_slots.clear()
+    legacy_frame_keys.clear()
+
+
+def legacy_handle_event(dev, evt_type, arg1, arg2, arg3, arg4):
+    slot = max(0, min(9, arg3))
+
+    if evt_type == EVT_MOUSE_MOVE:
+        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_SLOT, slot)
+        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_X, arg1)
+        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_Y, arg2)
+        if slot == 0:
+            dev.write(ecodes.EV_ABS, ecodes.ABS_X, arg1)
+            dev.write(ecodes.EV_ABS, ecodes.ABS_Y, arg2)
+
+    elif evt_type == EVT_MOUSE_DOWN:
+        if slot in legacy_frame_slots:
+            legacy_syn(dev)
+        legacy_frame_slots.add(slot)
+        legacy_active_slots.add(slot)
+        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_SLOT, slot)
+        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_TRACKING_ID, slot)
+        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_X, arg1)
+        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_Y, arg2)
+        if len(legacy_active_slots) == 1:
+            dev.write(ecodes.EV_KEY, ecodes.BTN_TOUCH, 1)
+        if slot == 0:
+            dev.write(ecodes.EV_ABS, ecodes.ABS_X, arg1)
+            dev.write(ecodes.EV_ABS, ecodes.ABS_Y, arg2)
+
+    elif evt_type == EVT_MOUSE_UP:
+        if slot in legacy_frame_slots:
+            legacy_syn(dev)
+        legacy_frame_slots.add(slot)
+        legacy_active_slots.discard(slot)
+        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_SLOT, slot)
+        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_TRACKING_ID, -1)
+        if not legacy_active_slots:
+            dev.write(ecodes.EV_KEY, ecodes.BTN_TOUCH, 0)
+
+    elif evt_type == EVT_KEY_DOWN:
+        if arg1 in legacy_frame_keys:
+            legacy_syn(dev)
+        legacy_frame_keys.add(arg1)
+        dev.write(ecodes.EV_KEY, arg1, 1)
+
+    elif evt_type == EVT_KEY_UP:
+        if arg1 in legacy_frame_keys:
+            legacy_syn(dev)
+        legacy_frame_keys.add(arg1)
+        dev.write(ecodes.EV_KEY, arg1, 0)
+
+
+def run_legacy(dev, datagrams):
+    for data in datagrams:
+        offset = 0
+        while offset + EVENT_SIZE <= len(data):
+            evt_type, ts, arg1, arg2, arg3, arg4 = struct.unpack_from(
+                EVENT_FMT, data, offset
+            )
+            offset += EVENT_SIZE
+            legacy_handle_event(dev, evt_type, arg1, arg2, arg3, arg4)
+        legacy_syn(dev)
+
+
+def run_dispatch(dev, datagrams):
+    decode_events = input_engine.decode_events
+    engine = input_engine.InjectionEngine(dev)
+    dispatch = engine.dispatch
+    flush_frame = engine.flush_frame
+    for data in datagrams:
+        events = []
+        decode_events(memoryview(data), events)
+        for evt in events:
+            dispatch[evt[0]](evt)
+        flush_frame()
+
+
+# ---------------------------------------------------------------------------
+# Workload
+# ---------------------------------------------------------------------------
+def make_datagrams(count, per_datagram, slots, seed=1):
+    """Synthetic multi-finger traffic: mostly moves, some taps and keys."""
+    rng = random.Random(seed)
+    down = set()
+    datagrams = []
+    for _ in range(count):
+        parts = []
+        for _ in range(per_datagram):
+            r = rng.random()
+            slot = rng.randrange(slots)
+            x, y = rng.randrange(1280), rng.randrange(720)
+            if r < 0.05:
+                key = rng.choice((30, 31, 32, 57))
+                parts.append(struct.pack(EVENT_FMT, EVT_KEY_DOWN, 0, key, 0, 0, 0))
+                parts.append(struct.pack(EVENT_FMT, EVT_KEY_UP, 0, key, 0, 0, 0))
+            elif slot not in down:
+                down.add(slot)
+                parts.append(struct.pack(EVENT_FMT, EVT_MOUSE_DOWN, 0, x, y, slot, 0))
+            elif r < 0.10:
+                down.discard(slot)
+                parts.append(struct.pack(EVENT_FMT, EVT_MOUSE_UP, 0, x, y, slot, 0))
+            else:
+                parts.append(struct.pack(EVENT_FMT, EVT_MOUSE_MOVE, 0, x, y, slot, 0))
+        datagrams.append(b"".join(parts))
+    return datagrams
+
+
+def bench(name, fn, dev, datagrams, repeat):
+    n_events = sum(len(d) // EVENT_SIZE for d in datagrams)
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(dev, datagrams)
+        best = min(best, time.perf_counter() - t0)
+    rate = n_events / best
+    print(f"  {name:<28} {rate / 1000:9.1f} k events/s  "
+          f"({best * 1e9 / n_events:6.0f} ns/event)")
+    return rate
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark input event decode + dispatch")
+    ap.add_argument("--datagrams", type=int, default=20000,
+                    help="Datagrams per run (default: 20000)")
+    ap.add_argument("--events", type=int, default=5,
+                    help="Events per datagram (default: 5)")
+    ap.add_argument("--slots", type=int, default=5,
+                    help="Touch slots in use (default: 5)")
+    ap.add_argument("--repeat", type=int, default=5,
+                    help="Runs per variant, best is reported (default: 5)")
+    args = ap.parse_args()
+
+    datagrams = make_datagrams(args.datagrams, args.events, args.slots)
+    print(f"{args.datagrams} datagrams x {args.events} events, "
+          f"{args.slots} slots, best of {args.repeat}")
+
+    print("Null device:")
+    before = bench("unpack_from + if/elif", run_legacy, NullDevice(),
+                   datagrams, args.repeat)
+    after = bench("iter_unpack + dispatch table", run_dispatch, NullDevice(),
+                  datagrams, args.repeat)
+    print(f"  speedup: {after / before:.2f}x")
+
+    print("RawFrameWriter -> /dev/null:")
+    raw = input_engine.RawFrameWriter(DevNullUInput())
+    before = bench("unpack_from + if/elif", run_legacy, raw, datagrams, args.repeat)
+    after = bench("iter_unpack + dispatch table", run_dispatch, raw, datagrams, args.repeat)
+    print(f"  speedup: {after / before:.2f}x")
+    raw.close()
+
+
+if __name__ == "__main__":
+    main()
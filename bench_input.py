@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""bench_input.py — Synthetic touch-storm benchmark for input_server.py.
+
+Runs the input_server.py receive/inject path in-process on a loopback UDP
+port: an event loop thread reading through add_datagram_transport(), as
+serve_async() sets it up, with a latency-recording fake device instead of
+/dev/uinput. A separate sender process then fires synthetic multi-finger
+traffic at it.
+
+Every touch event carries its sequence number in the x/y coordinates, so the
+sink can match each injected position to the moment it was sent. Latency is
+measured from sendto() in the sender to the SYN_REPORT that closes the frame.
+It covers socket queueing, decode, coalescing and dispatch. Moves that were
+coalesced away are counted separately, not as drops.
+
+Usage:
+    python3 bench_input.py                              # 10 fingers @ 120 Hz, 5 s
+    python3 bench_input.py --pattern burst --burst 8    # Wi-Fi style bursts
+    python3 bench_input.py --rate 0 --slots 10          # as fast as possible
+    python3 bench_input.py --ingest single              # compare ingest modes
+    python3 bench_input.py --hog 4 --rt-priority 50     # under CPU load, SCHED_FIFO
+    python3 bench_input.py --spin-us 100                # poll on after each batch
+
+bench_jitter.py runs the scheduling modes with and without --hog side by side.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import struct
+import threading
+import time
+
+import input_server
+from input_engine import (EVENT_FMT, EVT_MOUSE_MOVE, EVT_MOUSE_DOWN,
+                          EVT_MOUSE_UP, STREAM_WIDTH, STREAM_HEIGHT,
+                          EV_ABS, ABS_MT_POSITION_X, ABS_MT_POSITION_Y)
+
+MAX_SEQ = STREAM_WIDTH * STREAM_HEIGHT
+
+
+def seq_to_xy(seq):
+    return seq % STREAM_WIDTH, seq // STREAM_WIDTH
+
+
+class LatencySink:
+    """Fake device that timestamps every injected touch position."""
+
+    def __init__(self):
+        self.x = 0
+        self.frame = []      # sequence numbers positioned in the current frame
+        self.injected = []   # (seq, inject_ns)
+
+    def write(self, etype, code, value):
+        if etype == EV_ABS:
+            if code == ABS_MT_POSITION_X:
+                self.x = value
+            elif code == ABS_MT_POSITION_Y:
+                self.frame.append(value * STREAM_WIDTH + self.x)
+
+    def syn(self):
+        now = time.monotonic_ns()
+        self.injected.extend((seq, now) for seq in self.frame)
+        self.frame.clear()
+
+    def close(self):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Sender process
+# ---------------------------------------------------------------------------
+def sender(addr, args, conn):
+    """Send the touch storm and report (packets, send times) back over conn."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(addr)
+    send = sock.send
+    send_ns = []
+    packets = 0
+    seq = 0
+
+    def event(evt_type, slot):
+        nonlocal seq
+        x, y = seq_to_xy(seq)
+        seq += 1
+        return struct.pack(EVENT_FMT, evt_type, 0, x, y, slot, 0)
+
+    def flush(pending):
+        nonlocal packets
+        per = args.events_per_packet
+        for i in range(0, len(pending), per):
+            chunk = pending[i:i + per]
+            send_ns.extend([time.monotonic_ns()] * len(chunk))
+            send(b"".join(chunk))
+            packets += 1
+
+    ticks = int(args.duration * args.rate) if args.rate else args.ticks
+    interval = 1.0 / args.rate if args.rate else 0.0
+    burst = args.burst if args.pattern == "burst" else 1
+
+    flush([event(EVT_MOUSE_DOWN, s) for s in range(args.slots)])
+    pending = []
+    start = time.monotonic()
+    for tick in range(1, ticks + 1):
+        pending.extend(event(EVT_MOUSE_MOVE, s) for s in range(args.slots))
+        if tick % burst == 0 or tick == ticks:
+            flush(pending)
+            pending = []
+        if interval:
+            delay = start + tick * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    flush([event(EVT_MOUSE_UP, s) for s in range(args.slots)])
+
+    conn.send((packets, send_ns))
+    conn.close()
+    sock.close()
+
+
+# ---------------------------------------------------------------------------
+# Background load
+# ---------------------------------------------------------------------------
+def hog():
+    """Burn one CPU at normal priority, like an encoder thread."""
+    x = 0
+    while True:
+        x = (x * 31 + 7) & 0xFFFF
+
+
+def start_hogs(count):
+    procs = [multiprocessing.Process(target=hog, daemon=True) for _ in range(count)]
+    for proc in procs:
+        proc.start()
+    return procs
+
+
+def stop_hogs(procs):
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        proc.join()
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+def percentile(sorted_vals, pct):
+    if not sorted_vals:
+        return 0
+    idx = min(len(sorted_vals) - 1, int(len(sorted_vals) * pct / 100))
+    return sorted_vals[idx]
+
+
+def add_arguments(ap):
+    """Workload and server options, shared with bench_jitter.py."""
+    ap.add_argument("--slots", type=int, default=10,
+                    help="Simultaneous fingers (default: 10)")
+    ap.add_argument("--rate", type=float, default=120,
+                    help="Move ticks per second, 0 = as fast as possible "
+                         "(default: 120)")
+    ap.add_argument("--duration", type=float, default=5.0,
+                    help="Seconds of traffic when --rate > 0 (default: 5)")
+    ap.add_argument("--ticks", type=int, default=20000,
+                    help="Move ticks when --rate 0 (default: 20000)")
+    ap.add_argument("--pattern", choices=["steady", "burst"], default="steady",
+                    help="steady: send every tick; burst: hold --burst ticks "
+                         "and send them back-to-back (default: steady)")
+    ap.add_argument("--burst", type=int, default=8,
+                    help="Ticks per burst with --pattern burst (default: 8)")
+    ap.add_argument("--events-per-packet", type=int, default=1,
+                    help="Events packed into one datagram (default: 1)")
+    ap.add_argument("--ingest", choices=sorted(input_server.INGEST_MODES),
+                    default="mmsg", help="input_server ingest mode (default: mmsg)")
+    ap.add_argument("--batch", type=int, default=64,
+                    help="Max datagrams per wakeup (default: 64)")
+    ap.add_argument("--hog", type=int, default=0, metavar="N",
+                    help="Run N CPU-burning processes during the test "
+                         "(default: 0)")
+    ap.add_argument("--rt-priority", type=int, default=0,
+                    help="SCHED_FIFO priority of the server thread "
+                         "(default: 0 = normal scheduling)")
+    ap.add_argument("--cpus", type=input_server.parse_cpus, default=None,
+                    metavar="LIST", help="Pin the server thread to these CPUs "
+                                         "(default: any)")
+    ap.add_argument("--spin-us", type=int, default=0,
+                    help="Poll the socket this many us after each batch, as "
+                         "input_server.py --spin-us (default: 0 = off)")
+    ap.add_argument("--busy-poll-us", type=int, default=0,
+                    help="SO_BUSY_POLL on the server socket; no effect on "
+                         "loopback (default: 0 = off)")
+
+
+def check_arguments(ap, args):
+    args.slots = max(1, min(10, args.slots))
+    args.events_per_packet = max(1, args.events_per_packet)
+    ticks = int(args.duration * args.rate) if args.rate else args.ticks
+    if (ticks + 2) * args.slots >= MAX_SEQ:
+        ap.error("too many events to encode sequence numbers in x/y")
+
+
+def run(args):
+    """Run one benchmark; returns (stats, packets, send_ns, latencies_us, span_s, send_s)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    addr = sock.getsockname()
+    if args.busy_poll_us:
+        input_server.set_busy_poll(sock, args.busy_poll_us)
+
+    sink = LatencySink()
+    stats = input_server.InputStats()
+    loop = asyncio.new_event_loop()
+
+    def server_main():
+        input_server.configure_realtime(args.rt_priority, args.cpus)
+        injector = input_server.Injector(sink, stats, report_every=0)
+        input_server.add_datagram_transport(loop, injector, sock, "udp", args.ingest,
+                                            max(1, args.batch), False,
+                                            max(0, args.spin_us) / 1e6)
+        loop.run_forever()
+
+    hogs = start_hogs(args.hog)
+    server = threading.Thread(target=server_main, daemon=True)
+    server.start()
+
+    parent, child = multiprocessing.Pipe()
+    proc = multiprocessing.Process(target=sender, args=(addr, args, child))
+    t0 = time.monotonic()
+    proc.start()
+    packets, send_ns = parent.recv()
+    proc.join()
+    send_time = time.monotonic() - t0
+
+    # Let the server drain, then stop its loop
+    time.sleep(0.2)
+    loop.call_soon_threadsafe(loop.stop)
+    server.join(timeout=2)
+    loop.close()
+    sock.close()
+    stop_hogs(hogs)
+
+    latencies = sorted((inject - send_ns[seq]) / 1000
+                       for seq, inject in sink.injected if seq < len(send_ns))
+    if sink.injected:
+        span = (sink.injected[-1][1] - sink.injected[0][1]) / 1e9
+    else:
+        span = 0.0
+    return stats, packets, send_ns, latencies, span, send_time
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Touch-storm benchmark for input_server.py")
+    add_arguments(ap)
+    args = ap.parse_args()
+    check_arguments(ap, args)
+
+    print(f"{args.slots} slots, {args.rate or 'max'} Hz, {args.pattern} pattern, "
+          f"{args.events_per_packet} event(s)/packet, ingest={args.ingest}, "
+          f"{args.hog} hog(s)")
+    stats, packets, send_ns, latencies, span, send_time = run(args)
+
+    dropped = packets - stats.datagrams
+    print(f"Sent:      {len(send_ns)} events in {packets} packets ({send_time:.2f}s)")
+    print(f"Received:  {stats.datagrams} packets, {dropped} dropped")
+    print(f"Injected:  {stats.events} events, {stats.coalesced} moves coalesced, "
+          f"{stats.errors} errors")
+    if span > 0:
+        print(f"Rate:      {stats.events / span:,.0f} events/s injected")
+    print(f"Latency:   p50 {percentile(latencies, 50):.0f} us | "
+          f"p99 {percentile(latencies, 99):.0f} us | "
+          f"max {latencies[-1] if latencies else 0:.0f} us (send -> inject)")
+    print(f"Wakeups:   {input_server.format_histogram(stats.wakeup_hist)} "
+          f"(events per wakeup)")
+
+
+if __name__ == "__main__":
+    main()
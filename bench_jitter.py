@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""bench_jitter.py — Input latency jitter per scheduling mode, idle vs loaded.
+
+Runs the bench_input.py touch storm once for every receive mode of
+input_server.py (plain event loop, polling on after each batch, SCHED_FIFO,
+SCHED_FIFO plus polling, SO_BUSY_POLL), first on an idle machine and then
+with CPU hogs standing in for the encoder and weston, and prints the
+send -> inject latency distribution of each run side by side.
+
+SCHED_FIFO needs root or CAP_SYS_NICE; without it those rows run with
+normal scheduling (a warning is logged). SO_BUSY_POLL does nothing on
+loopback, so its row only matters when --host traffic crosses a real NIC;
+here it shows the cost of the extra setsockopt and nothing else.
+
+Usage:
+    python3 bench_jitter.py                        # hogs = CPU count
+    python3 bench_jitter.py --hog 8 --duration 10
+    python3 bench_jitter.py --modes default,rt --cpus 0
+"""
+
+import argparse
+import os
+import statistics
+
+import bench_input
+
+MODES = {
+    # name: (rt_priority, spin_us, busy_poll_us)
+    "default": (0, 0, 0),
+    "spin": (0, None, 0),
+    "rt": (None, 0, 0),
+    "rt+spin": (None, None, 0),
+    "busy-poll": (0, 0, None),
+}
+
+
+def summarize(latencies):
+    """p50/p99/p99.9/max and standard deviation, in us."""
+    pct = bench_input.percentile
+    return (pct(latencies, 50), pct(latencies, 99), pct(latencies, 99.9),
+            latencies[-1] if latencies else 0,
+            statistics.pstdev(latencies) if latencies else 0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Input latency jitter per scheduling mode")
+    bench_input.add_arguments(ap)
+    ap.add_argument("--modes", default=",".join(MODES),
+                    help=f"Comma-separated modes to run (default: {','.join(MODES)})")
+    ap.add_argument("--priority", type=int, default=50,
+                    help="SCHED_FIFO priority of the rt modes (default: 50)")
+    ap.add_argument("--spin", type=int, default=100,
+                    help="Spin window of the spin modes in us (default: 100)")
+    ap.add_argument("--busy-poll", type=int, default=50,
+                    help="SO_BUSY_POLL of the busy-poll mode in us (default: 50)")
+    args = ap.parse_args()
+    bench_input.check_arguments(ap, args)
+
+    modes = [m for m in args.modes.split(",") if m]
+    for mode in modes:
+        if mode not in MODES:
+            ap.error(f"unknown mode {mode!r}, choose from {', '.join(MODES)}")
+    hogs = args.hog or os.cpu_count() or 1
+
+    print(f"{args.slots} slots, {args.rate or 'max'} Hz, {args.duration:g} s per run, "
+          f"loaded runs with {hogs} CPU hog(s); latency in us (send -> inject)")
+    rows = []
+    for load in (0, hogs):
+        for mode in modes:
+            priority, spin, busy_poll = MODES[mode]
+            args.hog = load
+            args.rt_priority = args.priority if priority is None else priority
+            args.spin_us = args.spin if spin is None else spin
+            args.busy_poll_us = args.busy_poll if busy_poll is None else busy_poll
+            stats, packets, _, latencies, _, _ = bench_input.run(args)
+            dropped = packets - stats.datagrams
+            rows.append((mode, "loaded" if load else "idle", dropped)
+                        + summarize(latencies))
+
+    print(f"{'mode':<10} {'load':<7} {'p50':>7} {'p99':>7} {'p99.9':>7} "
+          f"{'max':>7} {'stdev':>7} {'drops':>6}")
+    for mode, load, dropped, p50, p99, p999, worst, stdev in rows:
+        print(f"{mode:<10} {load:<7} {p50:7.0f} {p99:7.0f} {p999:7.0f} "
+              f"{worst:7.0f} {stdev:7.0f} {dropped:6d}")
+
+
+if __name__ == "__main__":
+    main()
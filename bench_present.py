@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""bench_present.py — Compare receiver.py frame presentation and decode paths.
+
+Decodes the same H.264 clip once per --present mode and --decoder of
+receiver.py, with the exact ffmpeg command the receiver runs or in-process
+with its PyAV decoder, and pushes every frame through the receiver's
+presenter: RGB24 blitted (and scaled) by pygame, or 4:2:0 planes uploaded to
+an SDL2 YUV texture and scaled by the renderer.
+
+The decoder is fed as fast as it can go, so the numbers are costs, not a
+frame rate: CPU time per frame of ffmpeg (decode plus any pixel format
+conversion) and of the receiver (pipe reads plus presentation), pipe bytes
+per frame, and per-frame latency from the first byte of a frame leaving the
+pipe to present() returning (read and present split out). With pyav there
+is no ffmpeg process or pipe: decoding is in the receiver's CPU time and in
+"read", which then runs from asking for a frame to its planes being copied
+into the presenter's buffer (counted in copy MB).
+
+Without a display, run with SDL_VIDEODRIVER=offscreen (or dummy). The
+renderer then runs on the CPU (software or llvmpipe), which converts YUV to
+RGB itself, so the YUV rows only show their real cost on a GPU renderer;
+the renderer in use is logged. --no-display leaves pygame out and measures
+the pipe side only.
+
+Usage:
+    python3 bench_present.py                          # 10 s 720p test clip
+    python3 bench_present.py --window 1920x1080       # include scaling
+    python3 bench_present.py --input game.ts --modes rgb,yuv420p
+    python3 bench_present.py --input game.ts --decoders pyav --decode-threads 2
+    SDL_VIDEODRIVER=offscreen python3 bench_present.py
+"""
+
+import argparse
+import importlib.util
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+
+import receiver
+from receiver import STREAM_WIDTH, STREAM_HEIGHT, PRESENT_MODES
+
+
+def make_clip(path, seconds, fps):
+    """Encode a moving 720p test pattern the way the sender streams it."""
+    subprocess.run([
+        "ffmpeg", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc2=size={STREAM_WIDTH}x{STREAM_HEIGHT}:rate={fps}",
+        "-t", str(seconds),
+        "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency",
+        "-pix_fmt", "yuv420p", "-f", "mpegts", path,
+    ], check=True)
+
+
+class PipeOnly:
+    """Stand-in presenter for --no-display: keeps the frame buffer only."""
+
+    def __init__(self, mode):
+        self.pix_fmt = "rgb24" if mode == "rgb" else mode
+        size = STREAM_WIDTH * STREAM_HEIGHT
+        self.bufs = [bytearray(size * 3 if mode == "rgb" else size * 3 // 2)]
+        self.views = [memoryview(self.bufs[0])]
+
+    def present(self, index, overlay=None):
+        return 0
+
+
+def percentile(sorted_vals, pct):
+    if not sorted_vals:
+        return 0
+    idx = min(len(sorted_vals) - 1, int(len(sorted_vals) * pct / 100))
+    return sorted_vals[idx]
+
+
+def read_ffmpeg(proc, view):
+    """Frames from the ffmpeg pipe: yields (read start, bytes copied) per frame."""
+    size = len(view)
+    offset = 0
+    while True:
+        if offset == 0:
+            t0 = time.perf_counter()
+        n = proc.stdout.readinto(view[offset:])
+        if not n:
+            return
+        offset += n
+        if offset == size:
+            yield t0, 0
+            offset = 0
+
+
+def read_pyav(decoder, clip, buf):
+    """Frames decoded in-process, copied into buf like the receiver does."""
+    dest = decoder.plane_views(buf)
+    running = threading.Event()
+    running.set()
+    # Only read(), like the TCP stream: PyAV must not seek back
+    frames = decoder.frames(types.SimpleNamespace(read=clip.read), running)
+    while True:
+        t0 = time.perf_counter()
+        frame = next(frames, None)
+        if frame is None:
+            return
+        decoder.copy_frame(frame, dest)
+        yield t0, len(buf)
+
+
+def run(mode, decoder, args):
+    """Decode and present the clip once; returns a result row."""
+    if args.no_display:
+        presenter = PipeOnly(mode)
+    else:
+        import pygame
+        presenter = receiver.make_presenter(mode)
+        if args.window:
+            if isinstance(presenter, receiver.TexturePresenter):
+                presenter.window.size = args.window
+            else:
+                presenter.screen = pygame.display.set_mode(args.window, pygame.RESIZABLE)
+    if mode != "rgb" and presenter.pix_fmt == "rgb24":
+        return None  # fell back, nothing new to measure
+
+    children0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu0 = time.process_time()
+    clip = open(args.input, "rb")
+    proc = None
+    if decoder == "pyav":
+        size = 0
+        frames = read_pyav(receiver.PyAVDecoder(presenter.pix_fmt, args.decode_threads),
+                           clip, presenter.bufs[0])
+    else:
+        proc = subprocess.Popen(receiver.build_ffmpeg_decode_cmd(presenter.pix_fmt),
+                                stdin=clip, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+        size = len(presenter.views[0])
+        frames = read_ffmpeg(proc, presenter.views[0])
+    reads = []
+    presents = []
+    totals = []
+    copied = 0
+    for t0, read_copied in frames:
+        t1 = time.perf_counter()
+        copied += read_copied + presenter.present(0)
+        t2 = time.perf_counter()
+        reads.append((t1 - t0) * 1000)
+        presents.append((t2 - t1) * 1000)
+        totals.append((t2 - t0) * 1000)
+        if not args.no_display:
+            import pygame
+            pygame.event.pump()
+    if proc is not None:
+        proc.stdout.close()
+        proc.wait()
+    clip.close()
+    cpu = time.process_time() - cpu0
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    ffmpeg_cpu = (children.ru_utime - children0.ru_utime
+                  + children.ru_stime - children0.ru_stime)
+    if not args.no_display and isinstance(presenter, receiver.TexturePresenter):
+        presenter.window.destroy()
+
+    frames = len(totals)
+    if not frames:
+        sys.exit(f"[bench_present] {mode}/{decoder}: no frames decoded")
+    for samples in (reads, presents, totals):
+        samples.sort()
+    return (mode, decoder, frames,
+            ffmpeg_cpu * 1000 / frames,
+            cpu * 1000 / frames,
+            size / 1e6, copied / frames / 1e6,
+            percentile(reads, 50), percentile(presents, 50),
+            percentile(totals, 50), percentile(totals, 99))
+
+
+def parse_size(text):
+    try:
+        w, h = (int(v) for v in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    return w, h
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare receiver.py presentation paths")
+    ap.add_argument("--input", default=None,
+                    help="MPEG-TS/H.264 clip to decode (default: generate a "
+                         "test pattern with ffmpeg)")
+    ap.add_argument("--seconds", type=float, default=10,
+                    help="Length of the generated clip (default: 10)")
+    ap.add_argument("--fps", type=int, default=30,
+                    help="Frame rate of the generated clip (default: 30)")
+    ap.add_argument("--modes", default=",".join(PRESENT_MODES),
+                    help=f"Comma-separated --present modes (default: {','.join(PRESENT_MODES)})")
+    ap.add_argument("--decoders", default="ffmpeg,pyav",
+                    help="Comma-separated --decoder backends; pyav is skipped "
+                         "if PyAV is not installed (default: ffmpeg,pyav)")
+    ap.add_argument("--decode-threads", type=int, default=0,
+                    help="PyAV slice decoding threads, 0 = one per CPU (default: 0)")
+    ap.add_argument("--window", type=parse_size, default=None, metavar="WxH",
+                    help="Window size, to include scaling (default: stream size)")
+    ap.add_argument("--no-display", action="store_true",
+                    help="Read frames without presenting them (no pygame needed)")
+    args = ap.parse_args()
+
+    modes = [m for m in args.modes.split(",") if m]
+    for mode in modes:
+        if mode not in PRESENT_MODES:
+            ap.error(f"unknown mode {mode!r}, choose from {', '.join(PRESENT_MODES)}")
+    decoders = [d for d in args.decoders.split(",") if d]
+    for decoder in decoders:
+        if decoder not in ("ffmpeg", "pyav"):
+            ap.error(f"unknown decoder {decoder!r}, choose from ffmpeg, pyav")
+    if "pyav" in decoders and importlib.util.find_spec("av") is None:
+        print("[bench_present] PyAV not installed, skipping pyav (pip install av)")
+        decoders.remove("pyav")
+    if not args.no_display:
+        import pygame
+        pygame.init()
+
+    tmp = None
+    if args.input is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".ts", delete=False)
+        tmp.close()
+        make_clip(tmp.name, args.seconds, args.fps)
+        args.input = tmp.name
+    try:
+        rows = [row for row in (run(mode, decoder, args)
+                                for mode in modes for decoder in decoders) if row]
+    finally:
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+    window = args.window or (STREAM_WIDTH, STREAM_HEIGHT)
+    print(f"{STREAM_WIDTH}x{STREAM_HEIGHT} frames, window {window[0]}x{window[1]}"
+          + (", no display" if args.no_display else "")
+          + "; CPU in ms/frame, latency in ms (pipe read -> present done)")
+    print(f"{'mode':<8} {'decoder':<7} {'frames':>6} {'ffmpeg':>7} {'recv':>7} "
+          f"{'pipe MB':>8} {'copy MB':>8} {'read':>6} {'present':>7} {'p50':>6} {'p99':>6}")
+    for (mode, decoder, frames, ffmpeg_cpu, recv_cpu, pipe, copy, read, present,
+         p50, p99) in rows:
+        print(f"{mode:<8} {decoder:<7} {frames:6d} {ffmpeg_cpu:7.2f} {recv_cpu:7.2f} "
+              f"{pipe:8.2f} {copy:8.2f} {read:6.2f} {present:7.2f} {p50:6.2f} {p99:6.2f}")
+    print("Max frames/s the receiver side could present: " + ", ".join(
+        f"{r[0]}/{r[1]} {1000 / r[4]:.0f}" for r in rows if r[4]))
+    print("Total CPU ms/frame, ffmpeg + receiver: " + ", ".join(
+        f"{r[0]}/{r[1]} {r[3] + r[4]:.2f}" for r in rows))
+
+
+if __name__ == "__main__":
+    main()
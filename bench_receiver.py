@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""bench_receiver.py — receiver.py in one process vs with --decode-process.
+
+Streams the same H.264 clip to receiver.py's receive_and_decode() over a
+loopback TCP connection, from a separate sender process, once per mode:
+everything in the viewer process (decode in an ffmpeg subprocess fed and
+read by viewer threads, or a PyAV thread with --decoder pyav), or TCP ingest
+and decoding in a decode process that hands frames over in shared memory.
+Mouse clicks are posted to pygame throughout, so input dispatch competes
+for the viewer process as it does in use.
+
+By default the clip is sent as fast as the receiver takes it, so each row
+shows the most it sustains: frames presented and decoded per second,
+frames skipped (replaced before they were shown), CPU ms per presented
+frame in the viewer process and in its children (decode process, ffmpeg),
+and input dispatch latency. --mbps paces the sender at a stream bitrate
+instead.
+
+The split only pays off with a spare core for the decode process; on a
+single CPU it shows the cost of the extra process. Without a display, run
+with SDL_VIDEODRIVER=offscreen.
+
+Usage:
+    python3 bench_receiver.py                          # 10 s 720p test clip
+    python3 bench_receiver.py --input game.ts --mbps 8
+    python3 bench_receiver.py --decoder pyav --present nv12
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import receiver
+from bench_present import make_clip, percentile
+from receiver import PRESENT_MODES
+
+MODES = ("single", "process")
+
+
+def send_clip(addr, path, mbps):
+    """Sender process: stream the clip over TCP, paced at mbps if set."""
+    sock = socket.create_connection(addr)
+    start = time.monotonic()
+    sent = 0
+    with open(path, "rb") as clip:
+        while True:
+            chunk = clip.read(16384)
+            if not chunk:
+                break
+            sock.sendall(chunk)
+            sent += len(chunk)
+            if mbps:
+                delay = start + sent * 8 / (mbps * 1e6) - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+    sock.close()
+
+
+def click(running, rate):
+    """Post left clicks to pygame, as receiver.py would get from the mouse."""
+    import pygame
+    pos = (receiver.STREAM_WIDTH // 2, receiver.STREAM_HEIGHT // 2)
+    while running.is_set():
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=1))
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP, pos=pos, button=1))
+        time.sleep(1 / rate)
+
+
+def run(mode, presenter, decoder, args):
+    """Stream the clip once; returns a result row."""
+    srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    srv.bind(("127.0.0.1", 0))
+    srv.listen(1)
+    sender = multiprocessing.Process(target=send_clip,
+                                     args=(srv.getsockname(), args.input, args.mbps))
+    sender.start()
+    conn, _ = srv.accept()
+    first = conn.recv(65536)
+
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+    input_link = receiver.InputLink(socket.socket(socket.AF_INET, socket.SOCK_DGRAM),
+                                    sink.getsockname())
+
+    children0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu0 = time.process_time()
+    t0 = time.monotonic()
+    ffmpeg_proc = None
+    if decoder is None and mode == "single":
+        ffmpeg_proc = subprocess.Popen(receiver.build_ffmpeg_decode_cmd(presenter.pix_fmt),
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                       stderr=subprocess.DEVNULL)
+        ffmpeg_proc.stdin.write(first)
+        first = b""
+
+    running = threading.Event()
+    running.set()
+    clicking = threading.Event()
+    clicking.set()
+    threading.Thread(target=click, args=(clicking, args.click_rate), daemon=True).start()
+    stats = receiver.DisplayStats()
+    receiver.receive_and_decode(conn, None, ffmpeg_proc, presenter, running, input_link,
+                                {}, False, decoder, first, mode == "process", stats)
+    clicking.clear()
+    if ffmpeg_proc is not None:
+        ffmpeg_proc.kill()
+        ffmpeg_proc.wait()
+        ffmpeg_proc.stdin.close()
+        ffmpeg_proc.stdout.close()
+    elapsed = time.monotonic() - t0
+    cpu = time.process_time() - cpu0
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    child_cpu = (children.ru_utime - children0.ru_utime
+                 + children.ru_stime - children0.ru_stime)
+    sender.join()
+    conn.close()
+    srv.close()
+    sink.close()
+
+    if not stats.shown:
+        sys.exit(f"[bench_receiver] {mode}: no frames presented")
+    dispatch = sorted(stats.dispatch_ms)
+    return (mode, stats.shown / elapsed, (stats.shown + stats.skipped) / elapsed,
+            stats.skipped, cpu * 1000 / stats.shown, child_cpu * 1000 / stats.shown,
+            percentile(dispatch, 50), percentile(dispatch, 99))
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Compare receiver.py single-process and --decode-process modes")
+    ap.add_argument("--input", default=None,
+                    help="MPEG-TS/H.264 clip to stream (default: generate a "
+                         "test pattern with ffmpeg)")
+    ap.add_argument("--seconds", type=float, default=10,
+                    help="Length of the generated clip (default: 10)")
+    ap.add_argument("--fps", type=int, default=30,
+                    help="Frame rate of the generated clip (default: 30)")
+    ap.add_argument("--mbps", type=float, default=0,
+                    help="Send at this bitrate, 0 = as fast as the receiver "
+                         "reads (default: 0)")
+    ap.add_argument("--modes", default=",".join(MODES),
+                    help=f"Comma-separated modes (default: {','.join(MODES)})")
+    ap.add_argument("--decoder", choices=["ffmpeg", "pyav"], default="ffmpeg",
+                    help="receiver.py --decoder (default: ffmpeg)")
+    ap.add_argument("--present", choices=PRESENT_MODES, default="rgb",
+                    help="receiver.py --present (default: rgb)")
+    ap.add_argument("--click-rate", type=float, default=100,
+                    help="Mouse clicks posted per second (default: 100)")
+    args = ap.parse_args()
+
+    modes = [m for m in args.modes.split(",") if m]
+    for mode in modes:
+        if mode not in MODES:
+            ap.error(f"unknown mode {mode!r}, choose from {', '.join(MODES)}")
+
+    import pygame
+    pygame.init()
+    presenter = receiver.make_presenter(args.present)
+    decoder = None
+    if args.decoder == "pyav":
+        try:
+            decoder = receiver.PyAVDecoder(presenter.pix_fmt)
+        except ImportError:
+            sys.exit("[bench_receiver] PyAV not installed (pip install av)")
+
+    tmp = None
+    if args.input is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".ts", delete=False)
+        tmp.close()
+        make_clip(tmp.name, args.seconds, args.fps)
+        args.input = tmp.name
+    try:
+        rows = [run(mode, presenter, decoder, args) for mode in modes]
+    finally:
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+    pace = f"{args.mbps:g} Mbps" if args.mbps else "as fast as received"
+    print(f"{args.present} via {args.decoder}, sent {pace}, {os.cpu_count()} CPU(s); "
+          "CPU in ms per presented frame, input dispatch in ms")
+    print(f"{'mode':<8} {'shown/s':>8} {'decoded/s':>9} {'skipped':>7} "
+          f"{'viewer':>7} {'children':>8} {'in p50':>7} {'in p99':>7}")
+    for mode, shown, decoded, skipped, cpu, child, p50, p99 in rows:
+        print(f"{mode:<8} {shown:8.1f} {decoded:9.1f} {skipped:7d} "
+              f"{cpu:7.2f} {child:8.2f} {p50:7.2f} {p99:7.2f}")
+
+
+if __name__ == "__main__":
+    main()
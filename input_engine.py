@@ -0,0 +1,603 @@
+#!/usr/bin/env python3
+"""input_engine.py — uinput injection engine shared by the input paths.
+
+Turns decoded 13-byte protocol events into multi-touch type B frames on a
+virtual touchscreen. input_server.py (UDP, Unix socket, WebSocket) and
+webrtc_stream.py (WebRTC data channel) both inject through an
+InjectionEngine, so the device capabilities, the per-slot touch state, the
+frame batching and the counters exist exactly once. Both decode datagrams
+with decode_datagram(), which applies the protocol v2 sequencing and
+redundancy rules.
+
+Device backends only need write(type, code, value), syn() and close():
+    RawFrameWriter   one os.write() per frame on a python-evdev UInput fd
+    UInput           python-evdev per-event writes
+    NullDevice       discards events, counting them (no /dev/uinput needed)
+    RecordingDevice  captures the exact (type, code, value) stream
+
+Requires:
+  - pip install evdev
+"""
+
+import os
+import struct
+
+from evdev import UInput, AbsInfo, ecodes
+
+# Binary event protocol: 13 bytes per event, little-endian
+# | type(u8) | timestamp(u32) | arg1(i16) | arg2(i16) | arg3(i16) | arg4(i16) |
+EVENT_FMT = "<BIhhhh"
+EVENT_SIZE = struct.calcsize(EVENT_FMT)
+EVENT_STRUCT = struct.Struct(EVENT_FMT)
+
+# Event type constants (must match input_link.py)
+EVT_MOUSE_MOVE = 0
+EVT_MOUSE_DOWN = 1
+EVT_MOUSE_UP = 2
+EVT_KEY_DOWN = 3
+EVT_KEY_UP = 4
+
+# Events whose loss changes state on the device, repeated by redundant senders
+STATE_EVENTS = frozenset((EVT_MOUSE_DOWN, EVT_MOUSE_UP, EVT_KEY_DOWN, EVT_KEY_UP))
+
+# Protocol v2: a 13-byte header in front of up to 255 events. Legacy senders
+# keep sending bare events; the magic cannot be mistaken for an event type.
+# | magic "WI" | version(u8)=2 | flags(u8) | sender_id(u32) | seq(u32) | count(u8) |
+V2_MAGIC = b"WI"
+V2_VERSION = 2
+V2_HEADER = struct.Struct("<2sBBIIB")
+V2_HEADER_SIZE = V2_HEADER.size
+
+# A packet further behind than this is a sender that restarted with the same
+# id, not a late one
+V2_REORDER_WINDOW = 1024
+
+# flags bit: a redundancy trailer follows the events, repeating the sender's
+# last state-changing events (down/up/key) so a lost packet cannot leave a
+# finger stuck. State events are numbered per sender; trailer events carry
+# state_seq base..base+n-1 and the packet's own state events follow on.
+# | base_state_seq(u32) | n(u8) | n x event |
+V2_FLAG_REDUNDANT = 0x01
+V2_TRAILER = struct.Struct("<IB")
+
+# flags bit: touch and gesture coordinates are normalized to 0..65535 (sent
+# as the bit pattern of the i16 fields) instead of client_size pixels
+V2_FLAG_NORMALIZED = 0x02
+
+# Other messages on the input port carry no events: input_server.py clock
+# sync and screen size announcements
+CLOCK_MAGIC = b"WC"
+SIZE_MAGIC = b"WS"
+
+# Touch slots on the uinput device (ABS_MT_SLOT 0..9)
+MAX_TOUCH_SLOTS = 10
+
+# Default screen size of the device (must match input_link.py)
+STREAM_WIDTH = 1280
+STREAM_HEIGHT = 720
+
+# evdev constants pre-bound for the injection hot path
+EV_SYN = ecodes.EV_SYN
+EV_KEY = ecodes.EV_KEY
+EV_ABS = ecodes.EV_ABS
+SYN_REPORT = ecodes.SYN_REPORT
+BTN_TOUCH = ecodes.BTN_TOUCH
+ABS_X = ecodes.ABS_X
+ABS_Y = ecodes.ABS_Y
+ABS_MT_SLOT = ecodes.ABS_MT_SLOT
+ABS_MT_TRACKING_ID = ecodes.ABS_MT_TRACKING_ID
+ABS_MT_POSITION_X = ecodes.ABS_MT_POSITION_X
+ABS_MT_POSITION_Y = ecodes.ABS_MT_POSITION_Y
+
+# Common keyboard keys to register with UInput
+KEYBOARD_KEYS = [
+    ecodes.KEY_ESC, ecodes.KEY_1, ecodes.KEY_2, ecodes.KEY_3, ecodes.KEY_4,
+    ecodes.KEY_5, ecodes.KEY_6, ecodes.KEY_7, ecodes.KEY_8, ecodes.KEY_9,
+    ecodes.KEY_0, ecodes.KEY_MINUS, ecodes.KEY_EQUAL, ecodes.KEY_BACKSPACE,
+    ecodes.KEY_TAB, ecodes.KEY_Q, ecodes.KEY_W, ecodes.KEY_E, ecodes.KEY_R,
+    ecodes.KEY_T, ecodes.KEY_Y, ecodes.KEY_U, ecodes.KEY_I, ecodes.KEY_O,
+    ecodes.KEY_P, ecodes.KEY_LEFTBRACE, ecodes.KEY_RIGHTBRACE, ecodes.KEY_ENTER,
+    ecodes.KEY_LEFTCTRL, ecodes.KEY_A, ecodes.KEY_S, ecodes.KEY_D, ecodes.KEY_F,
+    ecodes.KEY_G, ecodes.KEY_H, ecodes.KEY_J, ecodes.KEY_K, ecodes.KEY_L,
+    ecodes.KEY_SEMICOLON, ecodes.KEY_APOSTROPHE, ecodes.KEY_GRAVE,
+    ecodes.KEY_LEFTSHIFT, ecodes.KEY_BACKSLASH, ecodes.KEY_Z, ecodes.KEY_X,
+    ecodes.KEY_C, ecodes.KEY_V, ecodes.KEY_B, ecodes.KEY_N, ecodes.KEY_M,
+    ecodes.KEY_COMMA, ecodes.KEY_DOT, ecodes.KEY_SLASH, ecodes.KEY_RIGHTSHIFT,
+    ecodes.KEY_LEFTALT, ecodes.KEY_SPACE, ecodes.KEY_RIGHTCTRL,
+    ecodes.KEY_RIGHTALT, ecodes.KEY_UP, ecodes.KEY_DOWN, ecodes.KEY_LEFT,
+    ecodes.KEY_RIGHT, ecodes.KEY_DELETE, ecodes.KEY_HOME, ecodes.KEY_END,
+    ecodes.KEY_PAGEUP, ecodes.KEY_PAGEDOWN,
+    ecodes.KEY_F1, ecodes.KEY_F2, ecodes.KEY_F3, ecodes.KEY_F4,
+    ecodes.KEY_F5, ecodes.KEY_F6, ecodes.KEY_F7, ecodes.KEY_F8,
+    ecodes.KEY_F9, ecodes.KEY_F10, ecodes.KEY_F11, ecodes.KEY_F12,
+]
+
+# Printable ASCII (plus \n, \t, \b) on a US layout: char -> (keycode, shift)
+SHIFT_KEY = ecodes.KEY_LEFTSHIFT
+ASCII_KEYMAP = {" ": (ecodes.KEY_SPACE, False), "\n": (ecodes.KEY_ENTER, False),
+                "\t": (ecodes.KEY_TAB, False), "\b": (ecodes.KEY_BACKSPACE, False)}
+for _c in "abcdefghijklmnopqrstuvwxyz":
+    ASCII_KEYMAP[_c] = (ecodes.ecodes["KEY_" + _c.upper()], False)
+    ASCII_KEYMAP[_c.upper()] = (ecodes.ecodes["KEY_" + _c.upper()], True)
+for _plain, _shifted, _name in (
+        ("1", "!", "1"), ("2", "@", "2"), ("3", "#", "3"), ("4", "$", "4"),
+        ("5", "%", "5"), ("6", "^", "6"), ("7", "&", "7"), ("8", "*", "8"),
+        ("9", "(", "9"), ("0", ")", "0"), ("-", "_", "MINUS"),
+        ("=", "+", "EQUAL"), ("[", "{", "LEFTBRACE"), ("]", "}", "RIGHTBRACE"),
+        ("\\", "|", "BACKSLASH"), (";", ":", "SEMICOLON"),
+        ("'", '"', "APOSTROPHE"), ("`", "~", "GRAVE"), (",", "<", "COMMA"),
+        (".", ">", "DOT"), ("/", "?", "SLASH")):
+    ASCII_KEYMAP[_plain] = (ecodes.ecodes["KEY_" + _name], False)
+    ASCII_KEYMAP[_shifted] = (ecodes.ecodes["KEY_" + _name], True)
+del _c, _plain, _shifted, _name
+
+
+def log(msg):
+    print(f"[input_engine] {msg}", flush=True)
+
+
+# ---------------------------------------------------------------------------
+# Device backends
+# ---------------------------------------------------------------------------
+def create_uinput_device(width=STREAM_WIDTH, height=STREAM_HEIGHT,
+                         name="waydroid-stream-touch"):
+    """Create a virtual touchscreen device (INPUT_PROP_DIRECT + MT type B)."""
+    capabilities = {
+        ecodes.EV_ABS: [
+            (ecodes.ABS_X, AbsInfo(value=0, min=0, max=width - 1,
+                                   fuzz=0, flat=0, resolution=0)),
+            (ecodes.ABS_Y, AbsInfo(value=0, min=0, max=height - 1,
+                                   fuzz=0, flat=0, resolution=0)),
+            (ecodes.ABS_MT_SLOT, AbsInfo(value=0, min=0, max=MAX_TOUCH_SLOTS - 1,
+                                         fuzz=0, flat=0, resolution=0)),
+            (ecodes.ABS_MT_TRACKING_ID, AbsInfo(value=0, min=-1,
+                                                 max=MAX_TOUCH_SLOTS - 1,
+                                                 fuzz=0, flat=0, resolution=0)),
+            (ecodes.ABS_MT_POSITION_X, AbsInfo(value=0, min=0, max=width - 1,
+                                                fuzz=0, flat=0, resolution=0)),
+            (ecodes.ABS_MT_POSITION_Y, AbsInfo(value=0, min=0, max=height - 1,
+                                                fuzz=0, flat=0, resolution=0)),
+        ],
+        ecodes.EV_KEY: [
+            ecodes.BTN_TOUCH,
+        ] + KEYBOARD_KEYS,
+    }
+
+    dev = UInput(events=capabilities, name=name,
+                 vendor=0x1234, product=0x5678,
+                 input_props=[ecodes.INPUT_PROP_DIRECT])
+    log(f"Created virtual touchscreen: {dev.device.path} ({width}x{height})")
+    return dev
+
+
+# struct input_event: timeval (two native longs), type u16, code u16, value s32
+INPUT_EVENT = struct.Struct("@llHHi")
+
+
+class RawFrameWriter:
+    """Write whole input frames to the uinput fd with a single os.write().
+
+    Wraps a python-evdev UInput, which still creates and owns the device,
+    and offers the same write()/syn() calls. Events are packed into a
+    preallocated struct input_event buffer and submitted on SYN_REPORT
+    instead of costing one write syscall each.
+    """
+
+    def __init__(self, uinput, capacity=256):
+        self.uinput = uinput
+        self.fd = uinput.fd
+        self.buf = bytearray(capacity * INPUT_EVENT.size)
+        self.view = memoryview(self.buf)
+        self.offset = 0
+
+    def write(self, etype, code, value):
+        if self.offset == len(self.buf):
+            self._submit()  # oversized frame: the kernel only reports on SYN
+        INPUT_EVENT.pack_into(self.buf, self.offset, 0, 0, etype, code, value)
+        self.offset += INPUT_EVENT.size
+
+    def syn(self):
+        self.write(EV_SYN, SYN_REPORT, 0)
+        self._submit()
+
+    def _submit(self):
+        try:
+            view = self.view[:self.offset]
+            while view:
+                view = view[os.write(self.fd, view):]
+        finally:
+            self.offset = 0
+
+    def close(self):
+        self.uinput.close()
+
+
+class NullDevice:
+    """Device backend that discards every event, only counting them.
+
+    Lets the whole receive/inject path run without /dev/uinput.
+    """
+
+    def __init__(self):
+        self.events = 0
+        self.frames = 0
+
+    def write(self, etype, code, value):
+        self.events += 1
+
+    def syn(self):
+        self.frames += 1
+
+    def close(self):
+        log(f"Null device: {self.events} events in {self.frames} frames")
+
+
+class RecordingDevice:
+    """Device backend that captures the exact (type, code, value) stream.
+
+    With a path, every event (SYN_REPORT included) is appended to the file
+    as a "type code value" line; otherwise events are kept in self.events.
+    """
+
+    def __init__(self, path=None):
+        self.events = []
+        self.file = open(path, "w") if path else None
+
+    def write(self, etype, code, value):
+        if self.file is not None:
+            self.file.write(f"{etype} {code} {value}\n")
+        else:
+            self.events.append((etype, code, value))
+
+    def syn(self):
+        self.write(EV_SYN, SYN_REPORT, 0)
+
+    def close(self):
+        if self.file is not None:
+            log(f"Recorded events: {self.file.name}")
+            self.file.close()
+
+
+DEVICE_BACKENDS = ("uinput", "null", "record")
+
+
+def create_device(backend, writer="raw", record_file=None,
+                  width=STREAM_WIDTH, height=STREAM_HEIGHT,
+                  name="waydroid-stream-touch"):
+    """Create the injection backend: a real uinput device, null, or record."""
+    if backend == "null":
+        log("Device backend: null (events are discarded)")
+        return NullDevice()
+    if backend == "record":
+        log("Device backend: record")
+        return RecordingDevice(record_file)
+    dev = create_uinput_device(width, height, name)
+    if writer == "raw":
+        dev = RawFrameWriter(dev)
+    log(f"uinput writer: {writer}")
+    return dev
+
+
+# ---------------------------------------------------------------------------
+# Decoding and coalescing
+# ---------------------------------------------------------------------------
+def decode_events(data, out):
+    """Append every complete event in a datagram to out.
+
+    Events are the raw (type, ts, arg1, arg2, arg3, arg4) tuples; a trailing
+    partial event is ignored.
+    """
+    end = len(data) - len(data) % EVENT_SIZE
+    out.extend(EVENT_STRUCT.iter_unpack(data[:end]))
+
+
+class SenderTable:
+    """Per-sender v2 sequencing state: [last packet seq, last state_seq].
+
+    Duplicates and packets older than the newest one seen are rejected, so a
+    reordered MOVE cannot teleport a finger backwards and a repeated DOWN
+    cannot corrupt active_slots. Sequence numbers wrap at 2**32.
+    """
+
+    def __init__(self, max_senders=64):
+        self.max_senders = max_senders
+        self.senders = {}
+
+    def accept(self, sender_id, seq, stats):
+        """Return the sender's state entry if the packet is new, else None."""
+        entry = self.senders.get(sender_id)
+        if entry is not None:
+            diff = (seq - entry[0]) & 0xFFFFFFFF
+            if diff == 0:
+                stats.duplicates += 1
+                return None
+            if diff & 0x80000000:
+                if 0x100000000 - diff <= V2_REORDER_WINDOW:
+                    stats.late += 1
+                    return None
+                entry[1] = None  # far behind: the sender restarted, resync
+            else:
+                stats.seq_gaps += diff - 1
+            entry[0] = seq
+            return entry
+        if len(self.senders) >= self.max_senders:
+            del self.senders[next(iter(self.senders))]  # forget the oldest
+        entry = self.senders[sender_id] = [seq, None]
+        return entry
+
+
+def decode_datagram(data, out, senders, stats):
+    """Append the events of a v2 or legacy datagram to out.
+
+    v2 packets that are duplicated or arrive after a newer packet from the
+    same sender are dropped whole. State events from a redundancy trailer
+    that were never seen are recovered in front of the packet's own events.
+
+    Returns (v2 sender id, v2 flags), or (None, 0) for legacy datagrams.
+    """
+    head = data[:2]
+    if head != V2_MAGIC:
+        if head != CLOCK_MAGIC and head != SIZE_MAGIC:
+            if len(data) % EVENT_SIZE:
+                stats.short += 1
+            decode_events(data, out)
+        return None, 0
+    size = len(data)
+    if size < V2_HEADER_SIZE:
+        stats.malformed += 1
+        return None, 0
+    _, version, flags, sender_id, seq, count = V2_HEADER.unpack_from(data)
+    if version != V2_VERSION:
+        stats.malformed += 1
+        return sender_id, 0
+    stats.v2_packets += 1
+    entry = senders.accept(sender_id, seq, stats)
+    if entry is None:
+        return sender_id, flags
+    end = V2_HEADER_SIZE + count * EVENT_SIZE
+    if end > size:
+        stats.short += 1
+        end = size - (size - V2_HEADER_SIZE) % EVENT_SIZE
+    events = EVENT_STRUCT.iter_unpack(data[V2_HEADER_SIZE:end])
+    if not flags & V2_FLAG_REDUNDANT:
+        out.extend(events)
+        return sender_id, flags
+
+    if end + V2_TRAILER.size > size:
+        stats.malformed += 1
+        out.extend(events)
+        return sender_id, flags
+    base, n = V2_TRAILER.unpack_from(data, end)
+    start = end + V2_TRAILER.size
+    n = min(n, (size - start) // EVENT_SIZE)
+    last = entry[1]
+    # On the first packet from a sender the trailer is history, not loss
+    if last is not None:
+        trailer = EVENT_STRUCT.iter_unpack(data[start:start + n * EVENT_SIZE])
+        for i, evt in enumerate(trailer):
+            if 0 < (base + i - last) & 0xFFFFFFFF < 0x80000000:
+                out.append(evt)
+                stats.recovered += 1
+    # State events older than the trailer are gone for good; resync to it
+    last = (base + n - 1) & 0xFFFFFFFF
+    for evt in events:
+        out.append(evt)
+        if evt[0] in STATE_EVENTS:
+            last = (last + 1) & 0xFFFFFFFF
+    entry[1] = last
+    return sender_id, flags
+
+
+def coalesce_moves(events):
+    """Drop touch moves that are superseded by a newer move of the same slot.
+
+    Moves are only collapsed between the down/up events of their slot, so
+    the DOWN/UP sequence and every key event keep their original order.
+    Returns the surviving events and the number of moves dropped.
+    """
+    last_move = {}
+    keep = None
+    for i, evt in enumerate(events):
+        evt_type = evt[0]
+        if evt_type == EVT_MOUSE_MOVE:
+            slot = max(0, min(MAX_TOUCH_SLOTS - 1, evt[4]))
+            prev = last_move.get(slot)
+            if prev is not None:
+                if keep is None:
+                    keep = [True] * len(events)
+                keep[prev] = False
+            last_move[slot] = i
+        elif evt_type == EVT_MOUSE_DOWN or evt_type == EVT_MOUSE_UP:
+            last_move.pop(max(0, min(MAX_TOUCH_SLOTS - 1, evt[4])), None)
+
+    if keep is None:
+        return events, 0
+    kept = [evt for evt, k in zip(events, keep) if k]
+    return kept, len(events) - len(kept)
+
+
+# ---------------------------------------------------------------------------
+# Injection engine
+# ---------------------------------------------------------------------------
+class EngineStats:
+    """Counters kept by an InjectionEngine."""
+
+    def __init__(self):
+        self.events = 0     # events written to the device
+        self.frames = 0     # SYN_REPORTs
+        self.coalesced = 0  # stale moves dropped before injection
+        self.unknown = 0    # events of a type no handler knows, not written
+        self.errors = 0
+        # Events per inject() batch in power-of-two buckets: 1, 2-3, ... 512+
+        self.wakeup_hist = [0] * 10
+        self.batched = 0    # events in all inject() batches, before coalescing
+
+
+class ProtocolStats(EngineStats):
+    """Engine counters plus the ones decode_datagram() keeps."""
+
+    def __init__(self):
+        super().__init__()
+        self.malformed = 0
+        self.short = 0             # datagrams cut off inside an event
+        # Protocol v2 sequencing
+        self.v2_packets = 0
+        self.duplicates = 0
+        self.late = 0
+        self.seq_gaps = 0
+        self.recovered = 0
+
+
+class InjectionEngine:
+    """Injects batches of decoded events as multi-touch frames.
+
+    Each inject() call is one batch: stale moves are coalesced, every event
+    is added to the current frame and the frame is closed with a single
+    SYN_REPORT. The engine tracks which slots are touching, so BTN_TOUCH
+    follows the first down and the last up. Not thread-safe: callers
+    serialise inject().
+    """
+
+    def __init__(self, dev, stats=None):
+        self.dev = dev
+        self.stats = stats if stats is not None else EngineStats()
+        self.active_slots = set()
+        # Slots and keys whose state already changed in the frame being
+        # built. A second down/up for the same slot (or key) must go into a
+        # new frame, otherwise the kernel would collapse a quick tap.
+        self.frame_slots = set()
+        self.frame_keys = set()
+        # One entry per possible u8 event type, no bounds check needed
+        self.dispatch = [self._on_unknown] * 256
+        self.dispatch[EVT_MOUSE_MOVE] = self._on_mouse_move
+        self.dispatch[EVT_MOUSE_DOWN] = self._on_mouse_down
+        self.dispatch[EVT_MOUSE_UP] = self._on_mouse_up
+        self.dispatch[EVT_KEY_DOWN] = self._on_key_down
+        self.dispatch[EVT_KEY_UP] = self._on_key_up
+
+    def inject(self, events):
+        """Inject events as one frame; returns the number handled."""
+        if not events:
+            return 0
+        stats = self.stats
+        wakeup_hist = stats.wakeup_hist
+        wakeup_hist[min(len(events).bit_length(), len(wakeup_hist)) - 1] += 1
+        stats.batched += len(events)
+
+        # A batch drains everything already queued, so a Wi-Fi burst is
+        # injected as one frame with only the newest position of each finger
+        events, coalesced = coalesce_moves(events)
+        stats.coalesced += coalesced
+
+        dispatch = self.dispatch
+        handled = 0
+        unknown = stats.unknown
+        for evt in events:
+            try:
+                dispatch[evt[0]](evt)
+                handled += 1
+            except Exception as e:
+                stats.errors += 1
+                log(f"Event injection error: {e}")
+        handled -= stats.unknown - unknown
+
+        if handled:
+            try:
+                self.flush_frame()
+            except Exception as e:
+                stats.errors += 1
+                log(f"Event injection error: {e}")
+        stats.events += handled
+        return handled
+
+    def flush_frame(self):
+        """Terminate the current multi-touch frame with a single SYN_REPORT."""
+        self.dev.syn()
+        self.stats.frames += 1
+        self.frame_slots.clear()
+        self.frame_keys.clear()
+
+    def set_device(self, dev):
+        """Switch to a new device; its slots all start lifted."""
+        self.dev = dev
+        self.active_slots.clear()
+        self.frame_slots.clear()
+        self.frame_keys.clear()
+
+    def close(self):
+        self.dev.close()
+
+    # -- Event handlers, indexed by event type through self.dispatch --
+    # Each one adds its event to the current frame; no SYN_REPORT is written
+    # here. evt is the raw (type, ts, arg1, arg2, arg3, arg4) tuple; arg3
+    # carries the touch slot ID (0-9), single-touch senders send slot 0.
+
+    def _on_mouse_move(self, evt):
+        # arg1=abs_x, arg2=abs_y — finger drag (only sent while touching)
+        _, _, x, y, slot, _ = evt
+        slot = 0 if slot < 0 else MAX_TOUCH_SLOTS - 1 if slot >= MAX_TOUCH_SLOTS else slot
+        write = self.dev.write
+        write(EV_ABS, ABS_MT_SLOT, slot)
+        write(EV_ABS, ABS_MT_POSITION_X, x)
+        write(EV_ABS, ABS_MT_POSITION_Y, y)
+        if slot == 0:
+            write(EV_ABS, ABS_X, x)
+            write(EV_ABS, ABS_Y, y)
+
+    def _on_mouse_down(self, evt):
+        # arg1=abs_x, arg2=abs_y — finger touch down
+        _, _, x, y, slot, _ = evt
+        slot = 0 if slot < 0 else MAX_TOUCH_SLOTS - 1 if slot >= MAX_TOUCH_SLOTS else slot
+        if slot in self.frame_slots:
+            self.flush_frame()
+        self.frame_slots.add(slot)
+        active_slots = self.active_slots
+        active_slots.add(slot)
+        write = self.dev.write
+        write(EV_ABS, ABS_MT_SLOT, slot)
+        write(EV_ABS, ABS_MT_TRACKING_ID, slot)
+        write(EV_ABS, ABS_MT_POSITION_X, x)
+        write(EV_ABS, ABS_MT_POSITION_Y, y)
+        if len(active_slots) == 1:
+            write(EV_KEY, BTN_TOUCH, 1)
+        if slot == 0:
+            write(EV_ABS, ABS_X, x)
+            write(EV_ABS, ABS_Y, y)
+
+    def _on_mouse_up(self, evt):
+        # finger lift
+        slot = evt[4]
+        slot = 0 if slot < 0 else MAX_TOUCH_SLOTS - 1 if slot >= MAX_TOUCH_SLOTS else slot
+        if slot in self.frame_slots:
+            self.flush_frame()
+        self.frame_slots.add(slot)
+        active_slots = self.active_slots
+        active_slots.discard(slot)
+        write = self.dev.write
+        write(EV_ABS, ABS_MT_SLOT, slot)
+        write(EV_ABS, ABS_MT_TRACKING_ID, -1)
+        if not active_slots:
+            write(EV_KEY, BTN_TOUCH, 0)
+
+    def _on_key_down(self, evt):
+        # arg1=evdev keycode
+        code = evt[2]
+        if code in self.frame_keys:
+            self.flush_frame()
+        self.frame_keys.add(code)
+        self.dev.write(EV_KEY, code, 1)
+
+    def _on_key_up(self, evt):
+        # arg1=evdev keycode
+        code = evt[2]
+        if code in self.frame_keys:
+            self.flush_frame()
+        self.frame_keys.add(code)
+        self.dev.write(EV_KEY, code, 0)
+
+    def _on_unknown(self, evt):
+        self.stats.unknown += 1
+
+    def handle_event(self, evt):
+        """Add a single decoded event to the current multi-touch frame."""
+        self.dispatch[evt[0]](evt)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""input_link.py — input sender shared by the receivers.
+
+receiver.py (pygame window) and web_receiver.py (browser relay) both send
+their input to input_server.py through an InputLink, so protocol v2
+framing, the redundancy trailer and the clock-sync answers exist exactly
+once on the sending side. The protocol constants below must match
+input_server.py.
+
+Needs only the standard library.
+"""
+
+import collections
+import random
+import struct
+import threading
+import time
+
+# Default input coordinate space: the stream resolution
+STREAM_WIDTH = 1280
+STREAM_HEIGHT = 720
+
+# Binary event protocol: 13 bytes per event, little-endian
+# | type(u8) | timestamp(u32) | arg1(i16) | arg2(i16) | arg3(i16) | arg4(i16) |
+EVENT_FMT = "<BIhhhh"
+EVENT_SIZE = struct.calcsize(EVENT_FMT)
+
+# Event type constants
+EVT_MOUSE_MOVE = 0
+EVT_MOUSE_DOWN = 1
+EVT_MOUSE_UP = 2
+EVT_KEY_DOWN = 3
+EVT_KEY_UP = 4
+
+STATE_EVENTS = frozenset((EVT_MOUSE_DOWN, EVT_MOUSE_UP, EVT_KEY_DOWN, EVT_KEY_UP))
+
+# Protocol v2 header, prepended to every datagram
+# | magic "WI" | version(u8)=2 | flags(u8) | sender_id(u32) | seq(u32) | count(u8) |
+V2_MAGIC = b"WI"
+V2_VERSION = 2
+V2_HEADER_FMT = "<2sBBIIB"
+V2_HEADER_SIZE = struct.calcsize(V2_HEADER_FMT)
+
+# flags bit: a redundancy trailer repeating the last state-changing events
+# follows the events
+# | base_state_seq(u32) | n(u8) | n x event |
+V2_FLAG_REDUNDANT = 0x01
+V2_TRAILER_FMT = "<IB"
+
+# flags bit: touch coordinates are normalized to 0..65535 instead of stream
+# pixels, so input keeps working when the sender changes its screen size
+V2_FLAG_NORMALIZED = 0x02
+NORMALIZED_SPACE = (65536, 65536)
+
+# Clock sync: input_server.py --latency-stats pings the sender id, which
+# answers at once with its event ts clock
+# | magic "WC" | kind(u8)=1 | sender_id(u32) | ping_id(u32) |                   ping
+# | magic "WC" | kind(u8)=2 | sender_id(u32) | ping_id(u32) | client_ms(u32) |  pong
+CLOCK_MAGIC = b"WC"
+CLOCK_PING = 1
+CLOCK_PONG = 2
+CLOCK_PING_FMT = "<2sBII"
+CLOCK_PONG_FMT = "<2sBIII"
+
+# Largest datagram input_server.py accepts; longer ones are truncated
+MAX_DATAGRAM = 512
+
+# UTF-8 bytes per text command (8 per EVT_TEXT_DATA event), at most; fewer
+# when a redundancy trailer takes up room (see text_chunk_bytes())
+MAX_TEXT_BYTES = 192
+
+
+def log(msg):
+    print(f"[input_link] {msg}", flush=True)
+
+
+def text_chunk_bytes(version=V2_VERSION, redundancy=0):
+    """UTF-8 bytes one text command can carry so that its datagram, with the
+    v2 header and a full redundancy trailer, stays within MAX_DATAGRAM."""
+    room = MAX_DATAGRAM - EVENT_SIZE  # the EVT_TEXT header event
+    if version == V2_VERSION:
+        room -= V2_HEADER_SIZE
+        if redundancy:
+            room -= struct.calcsize(V2_TRAILER_FMT) + redundancy * EVENT_SIZE
+    return min(MAX_TEXT_BYTES, 8 * (room // EVENT_SIZE))
+
+
+class InputLink:
+    """UDP input sender that frames events as protocol v2 packets.
+
+    Each link picks a random sender id, so input_server.py can tell a
+    restarted receiver from a late packet. With version=1 the bare legacy
+    13-byte events are sent instead.
+
+    With redundancy=N every packet repeats the last N state-changing events
+    (down/up/key) in a trailer, and N trailer-only packets follow each state
+    change at REPEAT_INTERVAL spacing, so a single lost datagram never drops
+    a touch-up even when no further input follows it. Call tick() regularly
+    to send those follow-ups.
+
+    With normalized=True (v2 only) coordinates are sent in a 65536x65536
+    space that input_server.py scales to whatever screen it drives; map
+    positions into link.space.
+    """
+
+    REPEAT_INTERVAL = 0.015
+
+    def __init__(self, sock, addr, version=V2_VERSION, redundancy=0,
+                 normalized=False):
+        self.sock = sock
+        self.addr = addr
+        self.version = version
+        self.normalized = normalized and version == V2_VERSION
+        self.space = NORMALIZED_SPACE if self.normalized else (STREAM_WIDTH, STREAM_HEIGHT)
+        self.sender_id = random.getrandbits(32)
+        self.seq = 0
+        self.redundancy = redundancy if version == V2_VERSION else 0
+        self.history = collections.deque(maxlen=max(1, self.redundancy))
+        self.state_seq = 0       # state_seq of the next state-changing event
+        self.repeat_due = []     # monotonic deadlines of follow-up packets
+
+    def send(self, events):
+        """Send one or more packed events as a single datagram.
+
+        Returns True when state changed and follow-up packets were scheduled.
+        """
+        if self.version != V2_VERSION:
+            self.sock.sendto(events, self.addr)
+            return False
+
+        count = len(events) // EVENT_SIZE
+        flags = V2_FLAG_REDUNDANT if self.redundancy else 0
+        if self.normalized:
+            flags |= V2_FLAG_NORMALIZED
+        packet = struct.pack(V2_HEADER_FMT, V2_MAGIC, V2_VERSION, flags,
+                             self.sender_id, self.seq, count) + events
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+
+        changed = False
+        if self.redundancy:
+            history = self.history
+            base = (self.state_seq - len(history)) & 0xFFFFFFFF
+            packet += struct.pack(V2_TRAILER_FMT, base, len(history)) + b"".join(history)
+            for i in range(0, count * EVENT_SIZE, EVENT_SIZE):
+                if events[i] in STATE_EVENTS:
+                    history.append(events[i:i + EVENT_SIZE])
+                    self.state_seq = (self.state_seq + 1) & 0xFFFFFFFF
+                    changed = True
+            if changed:
+                now = time.monotonic()
+                self.repeat_due = [now + self.REPEAT_INTERVAL * k
+                                   for k in range(1, self.redundancy + 1)]
+
+        self.sock.sendto(packet, self.addr)
+        return changed
+
+    def tick(self):
+        """Send a trailer-only follow-up packet if one is due."""
+        now = time.monotonic() + 0.001  # timers may fire a hair early
+        if self.repeat_due and now >= self.repeat_due[0]:
+            self.repeat_due = [t for t in self.repeat_due if t > now]
+            self.send(b"")
+
+    def start_clock_responder(self):
+        """Answer input_server.py clock pings from a background thread."""
+        if self.version != V2_VERSION:
+            return
+        # Only Linux lets recvfrom() wait on a socket that no send() has
+        # bound yet; Windows fails it at once, so bind it here
+        try:
+            port = self.sock.getsockname()[1]
+        except OSError:
+            port = 0
+        if not port:
+            self.sock.bind(("", 0))
+        threading.Thread(target=self._clock_responder, daemon=True).start()
+
+    def _clock_responder(self):
+        size = struct.calcsize(CLOCK_PING_FMT)
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(64)
+            except ConnectionResetError:
+                continue  # Windows: ICMP port unreachable for an earlier send
+            except OSError as e:
+                log(f"Clock responder stopped: {e}")
+                return
+            if len(data) < size:
+                continue
+            magic, kind, sender_id, ping_id = struct.unpack_from(CLOCK_PING_FMT, data)
+            if magic != CLOCK_MAGIC or kind != CLOCK_PING or sender_id != self.sender_id:
+                continue
+            client_ms = int(time.monotonic() * 1000) & 0xFFFFFFFF
+            try:
+                self.sock.sendto(struct.pack(CLOCK_PONG_FMT, CLOCK_MAGIC, CLOCK_PONG,
+                                             sender_id, ping_id, client_ms), addr)
+            except OSError:
+                pass
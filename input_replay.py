@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""input_replay.py — Re-send an input_server.py journal with its original timing.
+
+Reads a journal written by `input_server.py --journal FILE` and sends every
+recorded datagram to an input server again: at the recorded pacing, sped up
+or slowed down with --speed, or back-to-back with --fast. Each recorded
+source gets its own socket, so the server sees the same set of clients.
+
+Clock-sync pongs are not replayed: they answered pings sent to the original
+clients. Neither are screen size messages, which would recreate the server's
+device at the recorded client's size. With --loop the journal is sent several
+times; v2 sender ids are changed on every pass so the server does not drop
+the repeats as duplicates.
+
+Usage:
+    python3 input_replay.py input.wj --info            # what is in the journal
+    python3 input_replay.py input.wj                   # original pacing, UDP :9001
+    python3 input_replay.py input.wj --speed 4         # 4x faster
+    python3 input_replay.py input.wj --fast --loop 10  # injection path load test
+    python3 input_replay.py input.wj --unix /run/waydroid-input.sock
+"""
+
+import argparse
+import collections
+import socket
+import sys
+import time
+
+from input_engine import CLOCK_MAGIC, SIZE_MAGIC, V2_MAGIC
+from input_server import JOURNAL_TRANSPORTS, read_journal, percentiles
+
+# Sleep until this close to a send time, then spin for the rest
+SPIN_WINDOW = 0.0005
+
+
+def log(msg):
+    print(f"[input_replay] {msg}", flush=True)
+
+
+def load(path):
+    """Journal records to replay: (arrival_ns, source, transport, datagram)."""
+    try:
+        return [r for r in read_journal(path)
+                if r[3][:2] != CLOCK_MAGIC and r[3][:2] != SIZE_MAGIC]
+    except (OSError, ValueError) as e:
+        sys.exit(f"[input_replay] {e}")
+
+
+def print_info(path, records):
+    if not records:
+        log(f"{path}: no input recorded")
+        return
+    span = (records[-1][0] - records[0][0]) / 1e9
+    start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(records[0][0] / 1e9))
+    log(f"{path}: {len(records)} datagrams, "
+        f"{sum(len(r[3]) for r in records)} bytes over {span:.1f}s from {start}")
+    per_source = collections.Counter((r[1], r[2]) for r in records)
+    for (source, transport), count in per_source.most_common():
+        log(f"  source {source:08x} ({JOURNAL_TRANSPORTS[transport]}): "
+            f"{count} datagrams")
+    gaps = [(b[0] - a[0]) / 1e6 for a, b in zip(records, records[1:])]
+    if gaps:
+        p50, p95, p99 = percentiles(gaps)
+        log(f"  inter-arrival: p50 {p50:.2f} p95 {p95:.2f} p99 {p99:.2f} "
+            f"max {max(gaps):.2f} ms")
+
+
+def with_sender_pass(data, n):
+    """Give a v2 packet a sender id unique to replay pass n."""
+    if n == 0 or data[:2] != V2_MAGIC or len(data) < 8:
+        return data
+    packet = bytearray(data)
+    sender_id = int.from_bytes(packet[4:8], "little")
+    packet[4:8] = ((sender_id + n * 0x9E3779B1) & 0xFFFFFFFF).to_bytes(4, "little")
+    return bytes(packet)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay an input_server.py journal")
+    ap.add_argument("journal", help="Journal file from input_server.py --journal")
+    ap.add_argument("--host", default="127.0.0.1",
+                    help="Input server address (default: 127.0.0.1)")
+    ap.add_argument("--port", type=int, default=9001,
+                    help="Input server UDP port (default: 9001)")
+    ap.add_argument("--unix", metavar="PATH", default=None,
+                    help="Send to the server's Unix socket instead of UDP")
+    ap.add_argument("--speed", type=float, default=1.0,
+                    help="Pacing multiplier, 2 = twice as fast (default: 1)")
+    ap.add_argument("--fast", action="store_true",
+                    help="Send back-to-back, ignoring the recorded pacing")
+    ap.add_argument("--loop", type=int, default=1,
+                    help="Replay the journal this many times (default: 1)")
+    ap.add_argument("--info", action="store_true",
+                    help="Describe the journal and exit")
+    args = ap.parse_args()
+
+    records = load(args.journal)
+    if args.info or not records:
+        print_info(args.journal, records)
+        return
+    if args.speed <= 0:
+        ap.error("--speed must be positive")
+
+    # One socket per recorded source, so sessions stay apart on the server
+    sockets = {}
+
+    def socket_for(source):
+        sock = sockets.get(source)
+        if sock is None:
+            if args.unix:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                sock.bind("")  # autobind, so each source has its own address
+                sock.connect(args.unix)
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.connect((args.host, args.port))
+            sockets[source] = sock
+        return sock
+
+    target = args.unix or f"{args.host}:{args.port}"
+    pacing = "as fast as possible" if args.fast else f"{args.speed:g}x speed"
+    log(f"Replaying {len(records)} datagrams x {max(1, args.loop)} to {target}, {pacing}")
+
+    first = records[0][0]
+    span = (records[-1][0] - first) / 1e9
+    lateness = []
+    sent = errors = 0
+    t0 = time.perf_counter()
+    try:
+        for n in range(max(1, args.loop)):
+            start = time.perf_counter()
+            for arrival_ns, source, _, data in records:
+                if not args.fast:
+                    due = start + (arrival_ns - first) / 1e9 / args.speed
+                    delay = due - time.perf_counter()
+                    if delay > SPIN_WINDOW:
+                        time.sleep(delay - SPIN_WINDOW)
+                    while time.perf_counter() < due:
+                        pass
+                    lateness.append((time.perf_counter() - due) * 1e6)
+                try:
+                    socket_for(source).send(with_sender_pass(data, n))
+                    sent += 1
+                except OSError as e:
+                    errors += 1
+                    if errors == 1:
+                        log(f"Send error: {e}")
+    except KeyboardInterrupt:
+        log("Interrupted.")
+    elapsed = time.perf_counter() - t0
+    for sock in sockets.values():
+        sock.close()
+
+    log(f"Sent {sent} datagrams ({errors} errors) from {len(sockets)} source(s) "
+        f"in {elapsed:.2f}s, {sent / elapsed:,.0f}/s; recorded span {span:.2f}s")
+    if lateness:
+        p50, p95, p99 = percentiles(lateness)
+        log(f"Pacing error: p50 {p50:.0f} p95 {p95:.0f} p99 {p99:.0f} "
+            f"max {max(lateness):.0f} us late")
+
+
+if __name__ == "__main__":
+    main()
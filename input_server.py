@@ -3,203 +3,2021 @@
 
 Listens for binary input events from the receiver (Windows) and injects
 them into the Linux kernel via python-evdev UInput. Weston/libinput picks
-them up and forwards to Waydroid.
+them up and forwards to Waydroid. Sequenced protocol v2 packets and legacy
+bare 13-byte events are both accepted.
+
+One asyncio loop serves every ingress into a single injector: UDP, an
+optional Unix datagram socket for processes on this host, and an optional
+WebSocket endpoint that browsers can send v2 packets to directly. The
+device side (frames, slots, backends) lives in input_engine.py, shared
+with webrtc_stream.py.
 
 Requires:
   - pip install evdev
+  - pip install websockets (only for --ws-port)
   - User must be in the 'input' group, or run as root, for /dev/uinput access
 
 Usage:
     python3 input_server.py                     # listen on 0.0.0.0:9001
     python3 input_server.py --port 9001         # explicit port
+    python3 input_server.py --unix /run/waydroid-input.sock --ws-port 9002
+    python3 input_server.py --ingest drain      # recvmsg drain, no ctypes
+    python3 input_server.py --writer evdev      # python-evdev per-event writes
+    python3 input_server.py --device null       # no /dev/uinput needed
+    python3 input_server.py --device record --record-file events.txt
+    python3 input_server.py --latency-stats     # per-client delay percentiles
+    python3 input_server.py --session-timeout 10  # hold quiet clients longer
+    python3 input_server.py --gesture-rate 240  # swipe/pinch samples per second
+    python3 input_server.py --type-rate 30      # slower typing of text commands
+    python3 input_server.py --resample-rate 120 --predict-ms 8
+    python3 input_server.py --rt-priority 50 --cpus 3 --spin-us 50
+    python3 input_server.py --rt-priority 50 --mlock  # no page-fault stalls
+    python3 input_server.py --journal input.wj  # replay with input_replay.py
+    python3 input_server.py --metrics-port 9101 # Prometheus /metrics
+    python3 input_server.py --size 1920x1080    # screen the device is made for
+    python3 input_server.py --announce-size 960x540  # tell the running server
 """
 
 import argparse
+import asyncio
+import collections
+import ctypes
+import errno
+import functools
+import mmap
+import os
 import signal
 import socket
 import struct
 import sys
+import time
+import zlib
+
+from input_engine import (EVENT_SIZE, EVENT_STRUCT, EVT_MOUSE_MOVE, EVT_MOUSE_DOWN,
+                          EVT_MOUSE_UP, EVT_KEY_DOWN, EVT_KEY_UP,
+                          MAX_TOUCH_SLOTS, STREAM_WIDTH, STREAM_HEIGHT,
+                          KEYBOARD_KEYS, ASCII_KEYMAP, SHIFT_KEY,
+                          V2_MAGIC, V2_HEADER, V2_HEADER_SIZE, V2_FLAG_NORMALIZED,
+                          CLOCK_MAGIC, SIZE_MAGIC,
+                          DEVICE_BACKENDS, InjectionEngine, ProtocolStats,
+                          SenderTable, create_device, decode_datagram)
+
+try:
+    import websockets
+except ImportError:
+    websockets = None  # only needed for --ws-port
+
+# Normalized coordinates (V2_FLAG_NORMALIZED) span 0..NORMALIZED_MAX, sent as
+# the bit pattern of the i16 fields
+NORMALIZED_MAX = 0xFFFF
+
+# Clock sync messages share the input port (CLOCK_MAGIC). With --latency-stats the server
+# pings every v2 sender about once a second; the sender answers at once with
+# the clock it stamps into event ts fields (ms, wrapping at 2**32).
+# | magic "WC" | kind(u8)=1 | sender_id(u32) | ping_id(u32) |                   ping
+# | magic "WC" | kind(u8)=2 | sender_id(u32) | ping_id(u32) | client_ms(u32) |  pong
+CLOCK_PING = 1
+CLOCK_PONG = 2
+CLOCK_PING_MSG = struct.Struct("<2sBII")
+CLOCK_PONG_MSG = struct.Struct("<2sBIII")
+
+# Screen size announcement from the capture side (Unix socket or loopback
+# only, SIZE_MAGIC). A new size recreates the touch device with matching axis
+# ranges.
+# | magic "WS" | width(u16) | height(u16) |
+SIZE_MSG = struct.Struct("<2sHH")
+LOOPBACK_HOSTS = ("127.0.0.1", "::1")
+
+# Largest datagram accepted; longer ones are truncated
+MAX_DATAGRAM = 512
+
+# Gesture commands, interpolated and injected locally at --gesture-rate.
+# A gesture is one EVT_GESTURE header followed by n EVT_GESTURE_POINT events
+# in the same datagram:
+# EVT_GESTURE:       arg1=kind, arg2=duration ms, arg3=slot, arg4=n points
+# EVT_GESTURE_POINT: arg1=x, arg2=y (arg3=x2, arg4=y2: second pinch finger)
+# The finger(s) go down at the first point, follow the path at constant speed
+# over the duration and lift at the last point. A pinch uses slot and slot+1.
+EVT_GESTURE = 5
+EVT_GESTURE_POINT = 6
+
+GESTURE_SWIPE = 1       # 2 points: A -> B
+GESTURE_PINCH = 2       # 2 points: both fingers' start -> end
+GESTURE_LONG_PRESS = 3  # 1 point, held for the duration
+GESTURE_DRAG = 4        # 2+ points: a path
+MAX_GESTURE_POINTS = 32
 
-from evdev import UInput, AbsInfo, ecodes
-
-# Binary event protocol: 13 bytes per event, little-endian
-# | type(u8) | timestamp(u32) | arg1(i16) | arg2(i16) | arg3(i16) | arg4(i16) |
-EVENT_FMT = "<BIhhhh"
-EVENT_SIZE = struct.calcsize(EVENT_FMT)
-
-# Event type constants (must match receiver.py)
-EVT_MOUSE_MOVE = 0
-EVT_MOUSE_DOWN = 1
-EVT_MOUSE_UP = 2
-EVT_KEY_DOWN = 3
-EVT_KEY_UP = 4
-
-# Stream resolution (must match receiver.py)
-STREAM_WIDTH = 1280
-STREAM_HEIGHT = 720
-
-# Common keyboard keys to register with UInput
-KEYBOARD_KEYS = [
-    ecodes.KEY_ESC, ecodes.KEY_1, ecodes.KEY_2, ecodes.KEY_3, ecodes.KEY_4,
-    ecodes.KEY_5, ecodes.KEY_6, ecodes.KEY_7, ecodes.KEY_8, ecodes.KEY_9,
-    ecodes.KEY_0, ecodes.KEY_MINUS, ecodes.KEY_EQUAL, ecodes.KEY_BACKSPACE,
-    ecodes.KEY_TAB, ecodes.KEY_Q, ecodes.KEY_W, ecodes.KEY_E, ecodes.KEY_R,
-    ecodes.KEY_T, ecodes.KEY_Y, ecodes.KEY_U, ecodes.KEY_I, ecodes.KEY_O,
-    ecodes.KEY_P, ecodes.KEY_LEFTBRACE, ecodes.KEY_RIGHTBRACE, ecodes.KEY_ENTER,
-    ecodes.KEY_LEFTCTRL, ecodes.KEY_A, ecodes.KEY_S, ecodes.KEY_D, ecodes.KEY_F,
-    ecodes.KEY_G, ecodes.KEY_H, ecodes.KEY_J, ecodes.KEY_K, ecodes.KEY_L,
-    ecodes.KEY_SEMICOLON, ecodes.KEY_APOSTROPHE, ecodes.KEY_GRAVE,
-    ecodes.KEY_LEFTSHIFT, ecodes.KEY_BACKSLASH, ecodes.KEY_Z, ecodes.KEY_X,
-    ecodes.KEY_C, ecodes.KEY_V, ecodes.KEY_B, ecodes.KEY_N, ecodes.KEY_M,
-    ecodes.KEY_COMMA, ecodes.KEY_DOT, ecodes.KEY_SLASH, ecodes.KEY_RIGHTSHIFT,
-    ecodes.KEY_LEFTALT, ecodes.KEY_SPACE, ecodes.KEY_RIGHTCTRL,
-    ecodes.KEY_RIGHTALT, ecodes.KEY_UP, ecodes.KEY_DOWN, ecodes.KEY_LEFT,
-    ecodes.KEY_RIGHT, ecodes.KEY_DELETE, ecodes.KEY_HOME, ecodes.KEY_END,
-    ecodes.KEY_PAGEUP, ecodes.KEY_PAGEDOWN,
-    ecodes.KEY_F1, ecodes.KEY_F2, ecodes.KEY_F3, ecodes.KEY_F4,
-    ecodes.KEY_F5, ecodes.KEY_F6, ecodes.KEY_F7, ecodes.KEY_F8,
-    ecodes.KEY_F9, ecodes.KEY_F10, ecodes.KEY_F11, ecodes.KEY_F12,
-]
+# Text commands, typed locally as timed key presses at --type-rate, so a
+# pasted string is one packet instead of a down/up pair per character.
+# One EVT_TEXT header followed by its EVT_TEXT_DATA events in the same datagram:
+# EVT_TEXT:      arg1=kind, arg2=ms per key (0 = --type-rate), arg3=length
+# EVT_TEXT_DATA: TEXT_UTF8:     8 bytes of the string in arg1..arg4 (LE)
+#                TEXT_KEYCODES: up to 4 evdev keycodes, TEXT_SHIFT = with shift
+# length counts bytes (TEXT_UTF8) or keycodes (TEXT_KEYCODES). Printable
+# ASCII, \n, \t and \b are typed on a US layout, shift included; other
+# characters are skipped and counted as untypable.
+EVT_TEXT = 7
+EVT_TEXT_DATA = 8
+
+TEXT_UTF8 = 1
+TEXT_KEYCODES = 2
+TEXT_SHIFT = 0x1000
+TEXT_DATA = struct.Struct("<hhhh")
+TYPABLE_KEYS = frozenset(KEYBOARD_KEYS)
+
+# Events routed to the gesture and typing engines instead of the device
+GESTURE_EVENTS = frozenset((EVT_GESTURE, EVT_GESTURE_POINT))
+TEXT_EVENTS = frozenset((EVT_TEXT, EVT_TEXT_DATA))
+COMMAND_EVENTS = GESTURE_EVENTS | TEXT_EVENTS
+
+# Coordinates are rescaled with 32.32 fixed-point factors (see scale_factor())
+SCALE_SHIFT = 32
+SCALE_ROUND = 1 << (SCALE_SHIFT - 1)
 
 
 def log(msg):
     print(f"[input_server] {msg}", flush=True)
 
 
-def create_uinput_device():
-    """Create a virtual touchscreen device (INPUT_PROP_DIRECT + MT type B)."""
-    capabilities = {
-        ecodes.EV_ABS: [
-            (ecodes.ABS_X, AbsInfo(value=0, min=0, max=STREAM_WIDTH - 1,
-                                   fuzz=0, flat=0, resolution=0)),
-            (ecodes.ABS_Y, AbsInfo(value=0, min=0, max=STREAM_HEIGHT - 1,
-                                   fuzz=0, flat=0, resolution=0)),
-            (ecodes.ABS_MT_SLOT, AbsInfo(value=0, min=0, max=9,
-                                         fuzz=0, flat=0, resolution=0)),
-            (ecodes.ABS_MT_TRACKING_ID, AbsInfo(value=0, min=-1, max=9,
-                                                 fuzz=0, flat=0, resolution=0)),
-            (ecodes.ABS_MT_POSITION_X, AbsInfo(value=0, min=0, max=STREAM_WIDTH - 1,
-                                                fuzz=0, flat=0, resolution=0)),
-            (ecodes.ABS_MT_POSITION_Y, AbsInfo(value=0, min=0, max=STREAM_HEIGHT - 1,
-                                                fuzz=0, flat=0, resolution=0)),
-        ],
-        ecodes.EV_KEY: [
-            ecodes.BTN_TOUCH,
-        ] + KEYBOARD_KEYS,
-    }
-
-    dev = UInput(events=capabilities, name="waydroid-stream-touch",
-                 vendor=0x1234, product=0x5678,
-                 input_props=[ecodes.INPUT_PROP_DIRECT])
-    log(f"Created virtual touchscreen: {dev.device.path}")
-    return dev
-
-
-# Track which touch slots are currently active
-active_slots = set()
-
-
-def handle_event(dev, evt_type, arg1, arg2, arg3, arg4):
-    """Inject a single input event into the virtual touchscreen.
-
-    arg3 carries the touch slot ID (0-9). Backward compatible: single-touch
-    senders send slot 0.
+def scale_factor(src_max, dst_max):
+    """Fixed-point factor f so that (v * f + SCALE_ROUND) >> SCALE_SHIFT maps
+    0..src_max onto 0..dst_max."""
+    return ((dst_max << SCALE_SHIFT) + src_max // 2) // src_max
+
+
+# ---------------------------------------------------------------------------
+# Client sessions
+# ---------------------------------------------------------------------------
+class Session:
+    """Touch slots and keys held by one client (a v2 sender id or a legacy address)."""
+
+    __slots__ = ("slots", "keys", "last_seen")
+
+    def __init__(self, now):
+        self.slots = {}     # client slot id -> device slot
+        self.keys = set()   # key codes held down
+        self.last_seen = now
+
+
+class SessionTable:
+    """Maps every client's own slot ids onto free device slots.
+
+    Each client numbers its fingers from 0, so two controllers would both
+    drive device slot 0 if slots were trusted. A touch-down takes the lowest
+    free device slot (slot 0 also drives the single-touch ABS_X/ABS_Y); its
+    moves and touch-up follow that mapping, and moves or ups for a slot the
+    client never put down are dropped. A client that stays silent for
+    timeout seconds has its touches and keys released.
+
+    Only the event loop thread uses the table, so nothing is locked.
     """
-    slot = max(0, min(9, arg3))
-
-    if evt_type == EVT_MOUSE_MOVE:
-        # arg1=abs_x, arg2=abs_y — finger drag (only sent while touching)
-        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_SLOT, slot)
-        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_X, arg1)
-        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_Y, arg2)
-        if slot == 0:
-            dev.write(ecodes.EV_ABS, ecodes.ABS_X, arg1)
-            dev.write(ecodes.EV_ABS, ecodes.ABS_Y, arg2)
-        dev.syn()
-
-    elif evt_type == EVT_MOUSE_DOWN:
-        # arg1=abs_x, arg2=abs_y — finger touch down
-        active_slots.add(slot)
-        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_SLOT, slot)
-        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_TRACKING_ID, slot)
-        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_X, arg1)
-        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_Y, arg2)
-        if len(active_slots) == 1:
-            dev.write(ecodes.EV_KEY, ecodes.BTN_TOUCH, 1)
-        if slot == 0:
-            dev.write(ecodes.EV_ABS, ecodes.ABS_X, arg1)
-            dev.write(ecodes.EV_ABS, ecodes.ABS_Y, arg2)
-        dev.syn()
-
-    elif evt_type == EVT_MOUSE_UP:
-        # finger lift
-        active_slots.discard(slot)
-        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_SLOT, slot)
-        dev.write(ecodes.EV_ABS, ecodes.ABS_MT_TRACKING_ID, -1)
-        if not active_slots:
-            dev.write(ecodes.EV_KEY, ecodes.BTN_TOUCH, 0)
-        dev.syn()
-
-    elif evt_type == EVT_KEY_DOWN:
-        # arg1=evdev keycode
-        dev.write(ecodes.EV_KEY, arg1, 1)
-        dev.syn()
-
-    elif evt_type == EVT_KEY_UP:
-        # arg1=evdev keycode
-        dev.write(ecodes.EV_KEY, arg1, 0)
-        dev.syn()
 
+    def __init__(self, timeout=5.0, max_slots=MAX_TOUCH_SLOTS):
+        self.timeout = timeout
+        self.sessions = {}
+        self.free = list(range(max_slots - 1, -1, -1))  # pop() -> lowest slot
+        self.next_expiry = float("inf")
 
-def main():
-    ap = argparse.ArgumentParser(description="UDP input event receiver + uinput injector")
-    ap.add_argument("--host", default="0.0.0.0", help="Bind address (default: 0.0.0.0)")
-    ap.add_argument("--port", type=int, default=9001, help="Listen port (default: 9001)")
-    args = ap.parse_args()
+    def map_events(self, key, events, start, now, stats, commands=None, scale=None):
+        """Rewrite events[start:] from key's slot ids to device slots, in place.
 
-    log("=== Input Server ===")
+        Gesture and text command events are moved to commands (dropped if
+        it is None).
+        Touch coordinates are rescaled to the device with scale, a
+        (mask, fx, fy) triple from Injector.scale_for() (None = unchanged).
+        """
+        session = self.sessions.get(key)
+        if session is None:
+            session = self.sessions[key] = Session(now)
+            self.next_expiry = min(self.next_expiry, now + self.timeout)
+        session.last_seen = now
 
-    dev = create_uinput_device()
+        slots = session.slots
+        out = start
+        for i in range(start, len(events)):
+            evt = events[i]
+            evt_type = evt[0]
+            if evt_type == EVT_MOUSE_MOVE:
+                slot = slots.get(evt[4])
+                if slot is None:
+                    stats.unmapped += 1
+                    continue
+            elif evt_type == EVT_MOUSE_DOWN:
+                slot = slots.get(evt[4])
+                if slot is None:
+                    if not self.free:
+                        stats.slots_exhausted += 1
+                        continue
+                    slot = slots[evt[4]] = self.free.pop()
+            elif evt_type == EVT_MOUSE_UP:
+                slot = slots.pop(evt[4], None)
+                if slot is None:
+                    stats.unmapped += 1
+                    continue
+                self._release_slot(slot)
+            else:
+                if evt_type == EVT_KEY_DOWN:
+                    session.keys.add(evt[2])
+                elif evt_type == EVT_KEY_UP:
+                    session.keys.discard(evt[2])
+                elif evt_type in COMMAND_EVENTS:
+                    if commands is not None:
+                        commands.append(evt)
+                    continue
+                events[out] = evt
+                out += 1
+                continue
+            if scale is None:
+                events[out] = (evt_type, evt[1], evt[2], evt[3], slot, evt[5])
+            else:
+                mask, fx, fy = scale
+                events[out] = (evt_type, evt[1],
+                               ((evt[2] & mask) * fx + SCALE_ROUND) >> SCALE_SHIFT,
+                               ((evt[3] & mask) * fy + SCALE_ROUND) >> SCALE_SHIFT,
+                               slot, evt[5])
+            out += 1
+        del events[out:]
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind((args.host, args.port))
-    log(f"Listening on {args.host}:{args.port}")
+    def _release_slot(self, slot):
+        self.free.append(slot)
+        self.free.sort(reverse=True)
+
+    def expire(self, now, out):
+        """Append up events for everything held by sessions idle past the timeout.
+
+        Returns the number of sessions that still held touches or keys.
+        """
+        if not self.timeout or now < self.next_expiry:
+            return 0
+        deadline = now - self.timeout
+        next_expiry = float("inf")
+        released = 0
+        for key, session in list(self.sessions.items()):
+            if session.last_seen > deadline:
+                next_expiry = min(next_expiry, session.last_seen + self.timeout)
+                continue
+            if session.slots or session.keys:
+                released += 1
+                log(f"Client {format_client(key)} went quiet, releasing "
+                    f"{len(session.slots)} touch(es), {len(session.keys)} key(s)")
+            self.release(key, out)
+        self.next_expiry = next_expiry
+        return released
+
+    def release(self, key, out):
+        """Drop a session, appending up events for its touches and keys."""
+        session = self.sessions.pop(key, None)
+        if session is None:
+            return
+        for slot in session.slots.values():
+            out.append((EVT_MOUSE_UP, 0, 0, 0, slot, 0))
+            self._release_slot(slot)
+        for code in session.keys:
+            out.append((EVT_KEY_UP, 0, code, 0, 0, 0))
+
+
+def format_client(key):
+    """Session key for logs: hex v2 sender id, host:port or socket path."""
+    if isinstance(key, int):
+        return f"{key:08x}"
+    if isinstance(key, tuple):
+        return f"{key[0]}:{key[1]}"
+    return str(key)
+
+
+# ---------------------------------------------------------------------------
+# Gestures
+# ---------------------------------------------------------------------------
+class Track:
+    """One finger of a gesture: a polyline walked at constant speed."""
+
+    __slots__ = ("slot", "points", "cumulative", "last")
+
+    def __init__(self, slot, points):
+        self.slot = slot
+        self.points = points
+        self.cumulative = [0.0]
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            self.cumulative.append(self.cumulative[-1] + ((x1 - x0) ** 2 + (y1 - y0) ** 2) ** 0.5)
+        self.last = None
+
+    def position(self, f):
+        """Point at fraction f (0..1) of the path length."""
+        points = self.points
+        total = self.cumulative[-1]
+        if f >= 1.0 or total == 0.0:
+            return points[-1] if f >= 1.0 else points[0]
+        target = f * total
+        cumulative = self.cumulative
+        i = 1
+        while cumulative[i] < target:
+            i += 1
+        (x0, y0), (x1, y1) = points[i - 1], points[i]
+        seg = cumulative[i] - cumulative[i - 1]
+        t = (target - cumulative[i - 1]) / seg if seg else 1.0
+        return round(x0 + (x1 - x0) * t), round(y0 + (y1 - y0) * t)
+
+
+class Gesture:
+    __slots__ = ("key", "tracks", "start", "duration", "started")
+
+    def __init__(self, key, tracks, start, duration):
+        self.key = key
+        self.tracks = tracks
+        self.start = start
+        self.duration = duration
+        self.started = False
+
+
+def parse_gestures(commands, key, now, stats, scale=None):
+    """Build Gestures from a datagram's EVT_GESTURE/EVT_GESTURE_POINT events.
+
+    Points are rescaled to device pixels like touch events (see map_events()).
+    """
+    if scale is not None:
+        mask, fx, fy = scale
+        commands = [
+            (p[0], p[1],
+             ((p[2] & mask) * fx + SCALE_ROUND) >> SCALE_SHIFT,
+             ((p[3] & mask) * fy + SCALE_ROUND) >> SCALE_SHIFT,
+             ((p[4] & mask) * fx + SCALE_ROUND) >> SCALE_SHIFT,
+             ((p[5] & mask) * fy + SCALE_ROUND) >> SCALE_SHIFT)
+            if p[0] == EVT_GESTURE_POINT else p
+            for p in commands]
+    gestures = []
+    i = 0
+    while i < len(commands):
+        header = commands[i]
+        i += 1
+        if header[0] != EVT_GESTURE:
+            stats.malformed += 1
+            continue
+        _, _, kind, duration, slot, n = header
+        points = commands[i:i + n]
+        i += len(points)
+        if (n < 1 or n > MAX_GESTURE_POINTS or len(points) < n
+                or any(p[0] != EVT_GESTURE_POINT for p in points)):
+            stats.malformed += 1
+            continue
+        path = [(p[2], p[3]) for p in points]
+        if kind == GESTURE_PINCH and n >= 2:
+            tracks = [Track(slot, path), Track(slot + 1, [(p[4], p[5]) for p in points])]
+        elif kind in (GESTURE_SWIPE, GESTURE_DRAG) and n >= 2:
+            tracks = [Track(slot, path)]
+        elif kind == GESTURE_LONG_PRESS:
+            tracks = [Track(slot, path[:1])]
+        else:
+            stats.malformed += 1
+            continue
+        gestures.append(Gesture(key, tracks, now, max(0, duration) / 1000))
+        stats.gestures += 1
+    return gestures
+
+
+class GestureEngine:
+    """Runs gesture commands as touch events sampled at a fixed rate.
+
+    A gesture that needs a slot an earlier gesture of the same session is
+    still using waits until that one has lifted, like a session's texts in
+    TypingEngine, so overlapping pinches never share a finger. Its timing
+    starts when it puts its fingers down.
+
+    step() is called by a timer every interval seconds while any gesture is
+    active; wake() (set by the owner of the timer) is called when the first
+    gesture starts.
+    """
+
+    def __init__(self, rate=120.0):
+        self.interval = 1.0 / rate
+        self.active = []
+        self.wake = None
+
+    def start(self, gestures):
+        was_idle = not self.active
+        self.active.extend(gestures)
+        if was_idle and self.active and self.wake is not None:
+            self.wake()
+
+    def cancel(self, key):
+        """Forget the gestures of a released session; its touches are already up."""
+        self.active = [g for g in self.active if g.key != key]
+
+    def step(self, now):
+        """Return [(session key, events)] for every active gesture at time now."""
+        out = []
+        still_active = []
+        busy = set()  # (session key, slot) taken by an earlier gesture
+        for g in self.active:
+            slots = [(g.key, track.slot) for track in g.tracks]
+            if not busy.isdisjoint(slots):
+                busy.update(slots)
+                still_active.append(g)  # queued behind the earlier gesture
+                continue
+            busy.update(slots)
+            if not g.started:
+                g.start = now
+            f = (now - g.start) / g.duration if g.duration else 1.0
+            events = []
+            for track in g.tracks:
+                x, y = track.position(0.0 if not g.started else f)
+                if not g.started:
+                    events.append((EVT_MOUSE_DOWN, 0, x, y, track.slot, 0))
+                elif (x, y) != track.last:
+                    events.append((EVT_MOUSE_MOVE, 0, x, y, track.slot, 0))
+                track.last = (x, y)
+                if g.started and f >= 1.0:
+                    events.append((EVT_MOUSE_UP, 0, x, y, track.slot, 0))
+            if not g.started:
+                g.started = True
+                still_active.append(g)
+            elif f < 1.0:
+                still_active.append(g)
+            out.append((g.key, events))
+        self.active = still_active
+        return out
+
+
+# ---------------------------------------------------------------------------
+# Text typing
+# ---------------------------------------------------------------------------
+class Typing:
+    __slots__ = ("key", "keys", "interval", "next_due", "pressed")
+
+    def __init__(self, key, keys, interval, start):
+        self.key = key
+        self.keys = keys          # [(keycode, shift)], typed front to back
+        self.interval = interval  # s per key, press and release half each
+        self.next_due = start
+        self.pressed = False
+
+
+def text_keys(kind, data, length, stats):
+    """Expand a text command's payload into [(keycode, shift)]."""
+    keys = []
+    if kind == TEXT_UTF8:
+        for ch in data[:length].decode("utf-8", "replace"):
+            key = ASCII_KEYMAP.get(ch)
+            if key is None:
+                stats.untypable += 1
+            else:
+                keys.append(key)
+    else:
+        for (code,) in struct.iter_unpack("<h", data[:2 * length]):
+            if code & ~TEXT_SHIFT not in TYPABLE_KEYS:
+                stats.untypable += 1
+            else:
+                keys.append((code & ~TEXT_SHIFT, bool(code & TEXT_SHIFT)))
+    return keys
+
+
+def parse_text(commands, key, now, stats, interval):
+    """Build Typings from a datagram's EVT_TEXT/EVT_TEXT_DATA events."""
+    typings = []
+    i = 0
+    while i < len(commands):
+        header = commands[i]
+        i += 1
+        if header[0] != EVT_TEXT:
+            stats.malformed += 1
+            continue
+        _, _, kind, ms, length, _ = header
+        if kind == TEXT_UTF8:
+            n = (length + 7) // 8
+        elif kind == TEXT_KEYCODES:
+            n = (length + 3) // 4
+        else:
+            stats.malformed += 1
+            continue
+        chunks = commands[i:i + n]
+        i += len(chunks)
+        if length < 1 or len(chunks) < n or any(c[0] != EVT_TEXT_DATA for c in chunks):
+            stats.malformed += 1
+            continue
+        data = b"".join(TEXT_DATA.pack(*c[2:]) for c in chunks)
+        keys = text_keys(kind, data, length, stats)
+        if keys:
+            keys.reverse()  # typed with pop()
+            typings.append(Typing(key, keys, max(interval, ms / 1000), now))
+            stats.texts += 1
+    return typings
+
+
+class TypingEngine:
+    """Types text commands as key presses on a fixed-rate timer.
+
+    Every key is pressed on one step and released on a later one, each in a
+    frame of its own (with shift held around shifted characters), so apps
+    see the same down/up pairs as from a keyboard. A session's texts are
+    typed one after another; different sessions type concurrently. Like
+    GestureEngine, step() is called every interval seconds while any text is
+    pending and wake() restarts the timer.
+    """
+
+    def __init__(self, rate=60.0):
+        self.key_interval = 1.0 / rate
+        self.interval = self.key_interval / 2
+        self.active = []
+        self.wake = None
+
+    def start(self, typings):
+        was_idle = not self.active
+        self.active.extend(typings)
+        if was_idle and self.active and self.wake is not None:
+            self.wake()
+
+    def cancel(self, key):
+        """Drop the pending text of a released session; its keys are already up."""
+        self.active = [t for t in self.active if t.key != key]
+
+    def step(self, now):
+        """Return [(session key, events)] for every text with a key press or release due."""
+        out = []
+        still_active = []
+        typing = set()
+        for t in self.active:
+            if t.key in typing:
+                still_active.append(t)  # queued behind the session's earlier text
+                continue
+            typing.add(t.key)
+            if now < t.next_due:
+                still_active.append(t)
+                continue
+            code, shift = t.keys[-1]
+            if not t.pressed:
+                events = [(EVT_KEY_DOWN, 0, code, 0, 0, 0)]
+                if shift:
+                    events.insert(0, (EVT_KEY_DOWN, 0, SHIFT_KEY, 0, 0, 0))
+            else:
+                events = [(EVT_KEY_UP, 0, code, 0, 0, 0)]
+                if shift:
+                    events.append((EVT_KEY_UP, 0, SHIFT_KEY, 0, 0, 0))
+                t.keys.pop()
+            t.pressed = not t.pressed
+            # Keep the cadence, but never try to catch up with a burst
+            t.next_due = max(t.next_due + t.interval / 2, now)
+            if t.keys:
+                still_active.append(t)
+            out.append((t.key, events))
+        self.active = still_active
+        return out
+
+
+# ---------------------------------------------------------------------------
+# Touch resampling and prediction
+# ---------------------------------------------------------------------------
+RESAMPLE_HISTORY = 8
+VELOCITY_WINDOW = 0.05  # s of samples the prediction velocity is averaged over
+# Extrapolation may run this far past predict when samples arrive slower than
+# the output rate; beyond it the finger holds still
+PREDICT_SLACK = 0.025
+
+
+class ResampleTrack:
+    """Received samples of one device slot, on the server clock."""
+
+    __slots__ = ("samples", "min_delay", "last", "predictions")
+
+    def __init__(self):
+        self.samples = collections.deque(maxlen=RESAMPLE_HISTORY)  # (t, x, y)
+        self.min_delay = None
+        self.last = None  # position last injected
+        self.predictions = collections.deque(maxlen=RESAMPLE_HISTORY)  # (t, x, y)
+
+    def add(self, ts, rx, x, y, errors):
+        """Add a sample stamped ts (client ms) and received at rx (s).
+
+        The client's ts spacing is kept and the least delayed sample anchors
+        it to the server clock, so Wi-Fi jitter does not bend the path.
+        """
+        if ts:
+            delay = wrap_ms((int(rx * 1000) & 0xFFFFFFFF) - ts)
+            if self.min_delay is None or delay < self.min_delay:
+                self.min_delay = delay
+            t = rx - (delay - self.min_delay) / 1000
+        else:
+            t = rx
+        samples = self.samples
+        if samples:
+            t = max(t, samples[-1][0])
+            # Score predictions this sample has caught up with
+            pt, px, py = samples[-1]
+            predictions = self.predictions
+            while predictions and predictions[0][0] <= t:
+                when, qx, qy = predictions.popleft()
+                f = (when - pt) / (t - pt) if t > pt else 1.0
+                f = 0.0 if f < 0.0 else f
+                tx, ty = px + (x - px) * f, py + (y - py) * f
+                errors.append(((qx - tx) ** 2 + (qy - ty) ** 2) ** 0.5)
+        samples.append((t, x, y))
+
+    def position(self, target, horizon, width, height):
+        """Position at target time; returns (x, y, predicted)."""
+        samples = self.samples
+        t1, x1, y1 = samples[-1]
+        if target >= t1:
+            if horizon <= 0 or len(samples) < 2:
+                return x1, y1, False
+            # Extrapolate with the velocity over the last VELOCITY_WINDOW
+            t0, x0, y0 = samples[-2]
+            for sample in samples:
+                if sample[0] >= t1 - VELOCITY_WINDOW:
+                    t0, x0, y0 = sample
+                    break
+            if t1 - t0 <= 0:
+                return x1, y1, False
+            dt = min(target - t1, horizon)
+            x = x1 + (x1 - x0) * dt / (t1 - t0)
+            y = y1 + (y1 - y0) * dt / (t1 - t0)
+            return (max(0, min(width - 1, round(x))),
+                    max(0, min(height - 1, round(y))), True)
+        for i in range(len(samples) - 1, 0, -1):
+            t0, x0, y0 = samples[i - 1]
+            if t0 <= target:
+                t1, x1, y1 = samples[i]
+                f = (target - t0) / (t1 - t0) if t1 > t0 else 1.0
+                return round(x0 + (x1 - x0) * f), round(y0 + (y1 - y0) * f), False
+        t0, x0, y0 = samples[0]
+        return x0, y0, False
+
+
+class Resampler:
+    """Re-times touch moves onto a fixed-rate grid, optionally predicted ahead.
+
+    Received moves are held as samples instead of being injected; every
+    interval each touching slot is injected at its position one interval
+    in the past (so there are samples on both sides to interpolate), plus
+    predict seconds of linear extrapolation. Downs and ups pass straight
+    through; an up is preceded by the last real position so the finger
+    lifts where the client lifted it.
+
+    Prediction error is measured when the real samples arrive: the
+    distance (px) from each extrapolated position to where the finger
+    actually was at that time.
+    """
+
+    def __init__(self, rate=120.0, predict_ms=0.0, width=STREAM_WIDTH,
+                 height=STREAM_HEIGHT):
+        self.interval = 1.0 / rate
+        self.predict = predict_ms / 1000
+        self.width = width    # predictions are clamped to the device
+        self.height = height
+        self.active = {}   # device slot -> ResampleTrack
+        self.wake = None
+        self.samples_in = 0
+        self.moves_out = 0
+        self.predicted = 0
+        self.errors = collections.deque(maxlen=DELAY_SAMPLES)
+
+    def absorb(self, events, now):
+        """Take the moves out of events as samples; returns what to inject now."""
+        active = self.active
+        was_idle = not active
+        out = []
+        for evt in events:
+            evt_type = evt[0]
+            if evt_type == EVT_MOUSE_MOVE:
+                track = active.get(evt[4])
+                if track is not None:
+                    track.add(evt[1], now, evt[2], evt[3], self.errors)
+                    self.samples_in += 1
+                    continue
+            elif evt_type == EVT_MOUSE_DOWN:
+                track = active[evt[4]] = ResampleTrack()
+                track.add(evt[1], now, evt[2], evt[3], self.errors)
+                track.last = (evt[2], evt[3])
+            elif evt_type == EVT_MOUSE_UP:
+                track = active.pop(evt[4], None)
+                if track is not None:
+                    _, x, y = track.samples[-1]
+                    if (x, y) != track.last:
+                        out.append((EVT_MOUSE_MOVE, evt[1], x, y, evt[4], 0))
+            out.append(evt)
+        if was_idle and active and self.wake is not None:
+            self.wake()
+        return out
+
+    def step(self, now):
+        """Return the moves for this tick."""
+        target = now - self.interval + self.predict
+        horizon = self.predict + PREDICT_SLACK if self.predict else 0.0
+        events = []
+        for slot, track in self.active.items():
+            x, y, predicted = track.position(target, horizon, self.width,
+                                             self.height)
+            if predicted:
+                track.predictions.append((target, x, y))
+                self.predicted += 1
+            if (x, y) != track.last:
+                track.last = (x, y)
+                events.append((EVT_MOUSE_MOVE, 0, x, y, slot, 0))
+        self.moves_out += len(events)
+        return events
+
+    def report(self):
+        line = (f"resampler: {1 / self.interval:.0f} Hz, predict "
+                f"{self.predict * 1000:.0f} ms, {self.samples_in} moves in, "
+                f"{self.moves_out} out, {self.predicted} predicted")
+        if self.errors:
+            p50, p95, p99 = percentiles(self.errors)
+            line += f", error p50 {p50:.1f} p95 {p95:.1f} p99 {p99:.1f} px"
+        return line
+
+
+# ---------------------------------------------------------------------------
+# Clock sync and per-client latency
+# ---------------------------------------------------------------------------
+# Server times are CLOCK_REALTIME ns, the clock SO_TIMESTAMPNS stamps with.
+# They are reduced mod 2**32 ms before converting to float to keep precision.
+CLOCK_WRAP_NS = 2**32 * 1_000_000
+PING_INTERVAL_NS = 1_000_000_000
+MAX_PENDING_PINGS = 8
+DELAY_SAMPLES = 2048
+
+
+def wrap_ms(delta):
+    """Fold a difference of u32 ms clocks into [-2**31, 2**31)."""
+    delta %= 2**32
+    return delta - 2**32 if delta >= 2**31 else delta
+
+
+class ClientClock:
+    """Offset/drift estimate and rolling delay samples for one v2 sender."""
+
+    def __init__(self, addr, reply):
+        self.addr = addr
+        self.reply = reply  # reply(packet, addr) sends back on the client's transport
+        self.pings = {}   # ping_id -> send time (ns)
+        self.next_ping = 0
+        self.syncs = collections.deque(maxlen=16)  # (rtt_ns, mid_ns, offset_ms)
+        self.offset = None  # client_ms - server_ms at ref_ns
+        self.ref_ns = 0
+        self.drift = 0.0    # offset change per ms of server time
+        self.rtt_ns = 0
+        self.network = collections.deque(maxlen=DELAY_SAMPLES)   # ms
+        self.queueing = collections.deque(maxlen=DELAY_SAMPLES)  # us
+
+    def add_sync(self, t0, t2, client_ms):
+        """Fold in a ping sent at t0 and answered with client_ms, received at t2."""
+        mid = (t0 + t2) // 2
+        offset = (client_ms - (mid % CLOCK_WRAP_NS) / 1e6) % 2**32
+        self.syncs.append((t2 - t0, mid, offset))
+        # The fastest round trip has the least queueing asymmetry in it
+        self.rtt_ns, self.ref_ns, self.offset = min(self.syncs)
+        if len(self.syncs) >= 4:
+            # Least-squares slope of offset over time
+            base_mid, base_off = self.syncs[0][1], self.syncs[0][2]
+            pts = [((m - base_mid) / 1e6, wrap_ms(o - base_off))
+                   for _, m, o in self.syncs]
+            mx = sum(x for x, _ in pts) / len(pts)
+            my = sum(y for _, y in pts) / len(pts)
+            var = sum((x - mx) ** 2 for x, _ in pts)
+            if var > 0:
+                self.drift = sum((x - mx) * (y - my) for x, y in pts) / var
+
+    def one_way_ms(self, ts, rx_ns):
+        """Client-stamp to kernel-receive delay of an event sent at ts."""
+        offset = self.offset + self.drift * (rx_ns - self.ref_ns) / 1e6
+        return wrap_ms((rx_ns % CLOCK_WRAP_NS) / 1e6 + offset - ts)
+
+
+def percentiles(samples, pcts=(50, 95, 99)):
+    vals = sorted(samples)
+    return [vals[min(len(vals) - 1, len(vals) * p // 100)] for p in pcts]
+
+
+class LatencyMonitor:
+    """Clock sync with v2 senders and per-client delay histograms.
+
+    network:  event ts (client clock, corrected by the offset estimate) to
+              kernel receive time of its datagram
+    queueing: kernel receive time to the SYN_REPORT that injected it
+    """
+
+    def __init__(self, max_clients=64):
+        self.max_clients = max_clients
+        self.clients = {}  # sender_id -> ClientClock
+        self.ping_id = 0
+        self.wakeup_ns = 0
+        self.pending = []  # (client, rx_ns) of datagrams in the current wakeup
+
+    def on_datagram(self, data, addr, rx_ns, reply):
+        """Record one datagram. Returns True for clock messages."""
+        rx_ns = rx_ns or self.wakeup_ns
+        head = data[:2]
+        if head == CLOCK_MAGIC:
+            if len(data) >= CLOCK_PONG_MSG.size:
+                _, kind, sender_id, ping_id, client_ms = CLOCK_PONG_MSG.unpack_from(data)
+                client = self.clients.get(sender_id)
+                if kind == CLOCK_PONG and client is not None:
+                    t0 = client.pings.pop(ping_id, None)
+                    if t0 is not None:
+                        client.add_sync(t0, rx_ns, client_ms)
+            return True
+        if head != V2_MAGIC or len(data) < V2_HEADER_SIZE:
+            return False
+
+        _, _, _, sender_id, _, count = V2_HEADER.unpack_from(data)
+        client = self.clients.get(sender_id)
+        if client is None:
+            if len(self.clients) >= self.max_clients:
+                del self.clients[next(iter(self.clients))]
+            client = self.clients[sender_id] = ClientClock(addr, reply)
+        client.addr = addr
+        client.reply = reply
+        if count and client.offset is not None and len(data) >= V2_HEADER_SIZE + EVENT_SIZE:
+            ts = EVENT_STRUCT.unpack_from(data, V2_HEADER_SIZE)[1]
+            client.network.append(client.one_way_ms(ts, rx_ns))
+        self.pending.append((client, rx_ns))
+        return False
+
+    def on_injected(self, done_ns):
+        for client, rx_ns in self.pending:
+            client.queueing.append((done_ns - rx_ns) / 1000)
+        self.pending.clear()
+
+    def ping(self, now_ns):
+        """Ping every client whose interval has elapsed."""
+        for sender_id, client in self.clients.items():
+            if now_ns < client.next_ping or client.addr is None:
+                continue
+            client.next_ping = now_ns + PING_INTERVAL_NS
+            if len(client.pings) >= MAX_PENDING_PINGS:
+                client.pings.clear()
+            self.ping_id = (self.ping_id + 1) & 0xFFFFFFFF
+            client.pings[self.ping_id] = now_ns
+            try:
+                client.reply(CLOCK_PING_MSG.pack(
+                    CLOCK_MAGIC, CLOCK_PING, sender_id, self.ping_id), client.addr)
+            except OSError:
+                pass
+
+    def report(self):
+        """One log line per client with delay percentiles."""
+        lines = []
+        for sender_id, client in self.clients.items():
+            if client.offset is None:
+                lines.append(f"{sender_id:08x}: waiting for clock sync")
+                continue
+            line = (f"{sender_id:08x}: rtt {client.rtt_ns / 1e6:.2f} ms, "
+                    f"drift {client.drift * 1e6:+.0f} ppm")
+            if client.network:
+                p50, p95, p99 = percentiles(client.network)
+                line += f" | network p50 {p50:.1f} p95 {p95:.1f} p99 {p99:.1f} ms"
+            if client.queueing:
+                p50, p95, p99 = percentiles(client.queueing)
+                line += f" | queueing p50 {p50:.0f} p95 {p95:.0f} p99 {p99:.0f} us"
+            lines.append(line)
+        return lines
+
+
+# ---------------------------------------------------------------------------
+# Batched socket ingest
+# ---------------------------------------------------------------------------
+MSG_WAITFORONE = 0x10000
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IoVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+# Kernel receive timestamps (struct timespec, CLOCK_REALTIME) per datagram
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)
+SCM_TIMESTAMPNS = SO_TIMESTAMPNS
+TIMESPEC = struct.Struct("@ll")
+CONTROL_SIZE = socket.CMSG_SPACE(TIMESPEC.size)
+CMSG_DATA_OFFSET = socket.CMSG_LEN(0)
+CMSG_HDR = struct.Struct("@Nii")
+SOCKADDR_SIZE = 128  # sizeof(struct sockaddr_storage)
+
+
+def parse_timestamp(ancdata):
+    """Return the SCM_TIMESTAMPNS time in ns from recvmsg ancillary data, or 0."""
+    for level, ctype, data in ancdata:
+        if level == socket.SOL_SOCKET and ctype == SCM_TIMESTAMPNS:
+            sec, nsec = TIMESPEC.unpack_from(data)
+            return sec * 1_000_000_000 + nsec
+    return 0
+
+
+class DatagramReader:
+    """Blocking single-datagram reads: one recv and one wakeup per packet.
+
+    After each read(), self.addrs and self.stamps hold the source address
+    and kernel receive time (ns, 0 unless timestamps are enabled) of every
+    returned datagram.
+    """
+
+    def __init__(self, sock, max_datagrams, timestamps=False):
+        self.sock = sock
+        self.max_datagrams = max_datagrams
+        self.buf = bytearray(max_datagrams * MAX_DATAGRAM)
+        view = memoryview(self.buf)
+        self.slots = [view[i * MAX_DATAGRAM:(i + 1) * MAX_DATAGRAM]
+                      for i in range(max_datagrams)]
+        self.addrs = []
+        self.stamps = []
+        self.ancbufsize = 0
+        if timestamps:
+            sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+            self.ancbufsize = CONTROL_SIZE
+
+    def _recv(self, slot, flags=0):
+        n, ancdata, _, addr = self.sock.recvmsg_into([slot], self.ancbufsize, flags)
+        self.addrs.append(addr)
+        self.stamps.append(parse_timestamp(ancdata) if ancdata else 0)
+        return slot[:n]
+
+    def read(self):
+        """Return a list of datagram views, valid until the next read()."""
+        self.addrs = []
+        self.stamps = []
+        return [self._recv(self.slots[0])]
+
+
+class DrainReader(DatagramReader):
+    """Block for the first datagram, then drain the queue without blocking."""
+
+    def read(self):
+        self.addrs = []
+        self.stamps = []
+        slots = self.slots
+        datagrams = [self._recv(slots[0])]
+        for slot in slots[1:]:
+            try:
+                datagrams.append(self._recv(slot, socket.MSG_DONTWAIT))
+            except BlockingIOError:
+                break
+        return datagrams
 
-    def on_signal(sig, _frame):
-        log("Shutting down.")
-        sock.close()
-        dev.close()
-        sys.exit(0)
 
-    signal.signal(signal.SIGINT, on_signal)
-    signal.signal(signal.SIGTERM, on_signal)
+class MmsgReader(DatagramReader):
+    """Drain the whole queue with a single recvmmsg(MSG_WAITFORONE) call."""
 
-    event_count = 0
+    def __init__(self, sock, max_datagrams, timestamps=False):
+        super().__init__(sock, max_datagrams, timestamps)
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.recvmmsg = self.libc.recvmmsg
+        self.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr),
+                                  ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        self.recvmmsg.restype = ctypes.c_int
+
+        self.names = bytearray(max_datagrams * SOCKADDR_SIZE)
+        self.control = bytearray(max_datagrams * CONTROL_SIZE)
+        base = ctypes.addressof(
+            (ctypes.c_char * len(self.buf)).from_buffer(self.buf))
+        names = ctypes.addressof(
+            (ctypes.c_char * len(self.names)).from_buffer(self.names))
+        control = ctypes.addressof(
+            (ctypes.c_char * len(self.control)).from_buffer(self.control))
+        self.iov = (_IoVec * max_datagrams)()
+        self.msgs = (_MMsgHdr * max_datagrams)()
+        for i in range(max_datagrams):
+            self.iov[i].iov_base = base + i * MAX_DATAGRAM
+            self.iov[i].iov_len = MAX_DATAGRAM
+            hdr = self.msgs[i].msg_hdr
+            hdr.msg_iov = ctypes.pointer(self.iov[i])
+            hdr.msg_iovlen = 1
+            hdr.msg_name = names + i * SOCKADDR_SIZE
+            hdr.msg_namelen = SOCKADDR_SIZE
+            if timestamps:
+                hdr.msg_control = control + i * CONTROL_SIZE
+                hdr.msg_controllen = CONTROL_SIZE
+        self.used = 0
+
+    def _addr(self, i):
+        """Decode the sockaddr the kernel stored for message i, like recvfrom()."""
+        off = i * SOCKADDR_SIZE
+        family = int.from_bytes(self.names[off:off + 2], sys.byteorder)
+        if family == socket.AF_UNIX:
+            path = bytes(self.names[off + 2:off + self.msgs[i].msg_hdr.msg_namelen])
+            if not path:
+                return None  # unbound sender
+            if path[0] == 0:
+                return path  # abstract address
+            return os.fsdecode(path.split(b"\0", 1)[0])
+        port = int.from_bytes(self.names[off + 2:off + 4], "big")
+        if family == socket.AF_INET6:
+            host = socket.inet_ntop(socket.AF_INET6, self.names[off + 8:off + 24])
+            return (host, port, 0, 0)
+        return (socket.inet_ntoa(self.names[off + 4:off + 8]), port)
+
+    def _stamp(self, i):
+        hdr = self.msgs[i].msg_hdr
+        off = i * CONTROL_SIZE
+        if hdr.msg_controllen < CMSG_DATA_OFFSET + TIMESPEC.size:
+            return 0
+        _, level, ctype = CMSG_HDR.unpack_from(self.control, off)
+        if level != socket.SOL_SOCKET or ctype != SCM_TIMESTAMPNS:
+            return 0
+        sec, nsec = TIMESPEC.unpack_from(self.control, off + CMSG_DATA_OFFSET)
+        return sec * 1_000_000_000 + nsec
+
+    def read(self):
+        # The kernel shrinks namelen/controllen of the messages it filled
+        msgs = self.msgs
+        for i in range(self.used):
+            hdr = msgs[i].msg_hdr
+            hdr.msg_namelen = SOCKADDR_SIZE
+            if self.ancbufsize:
+                hdr.msg_controllen = CONTROL_SIZE
+        while True:
+            n = self.recvmmsg(self.sock.fileno(), msgs, self.max_datagrams,
+                              MSG_WAITFORONE, None)
+            if n >= 0:
+                break
+            err = ctypes.get_errno()
+            if err != errno.EINTR:
+                raise OSError(err, os.strerror(err))
+        self.used = n
+        self.addrs = [self._addr(i) for i in range(n)]
+        if self.ancbufsize:
+            self.stamps = [self._stamp(i) for i in range(n)]
+        else:
+            self.stamps = [0] * n
+        slots = self.slots
+        return [slots[i][:msgs[i].msg_len] for i in range(n)]
+
+
+INGEST_MODES = {
+    "single": DatagramReader,
+    "drain": DrainReader,
+    "mmsg": MmsgReader,
+}
+
+
+def make_reader(sock, mode, max_datagrams, timestamps=False):
+    """Create the datagram reader for an --ingest mode, falling back to drain."""
+    if mode == "mmsg":
+        try:
+            return MmsgReader(sock, max_datagrams, timestamps)
+        except (OSError, AttributeError) as e:
+            log(f"recvmmsg unavailable ({e}), using recvmsg drain")
+            mode = "drain"
+    return INGEST_MODES[mode](sock, max_datagrams, timestamps)
+
+
+# ---------------------------------------------------------------------------
+# Real-time scheduling and busy polling
+# ---------------------------------------------------------------------------
+SO_BUSY_POLL = getattr(socket, "SO_BUSY_POLL", 46)
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+
+def parse_cpus(text):
+    """argparse type for a CPU list such as "3" or "2,3" or "0-1,4"."""
+    cpus = set()
+    try:
+        for part in text.split(","):
+            lo, _, hi = part.partition("-")
+            cpus.update(range(int(lo), int(hi or lo) + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad CPU list: {text!r}")
+    if not cpus:
+        raise argparse.ArgumentTypeError(f"bad CPU list: {text!r}")
+    return cpus
+
+
+def configure_realtime(priority=0, cpus=None, lock_memory=False):
+    """Pin the calling thread to cpus and make it SCHED_FIFO at priority.
+
+    Linux applies both to the calling thread only (pid 0), so the thread
+    that receives and injects can run ahead of the encoder and compositor
+    without the rest of the process. With lock_memory the whole process is
+    locked into RAM (mlockall), so a page fault cannot stall a frame; that
+    includes every mapping, the journal ring among them. Failures (no
+    CAP_SYS_NICE, CPUs outside the cpuset, RLIMIT_MEMLOCK) are logged and
+    the thread carries on as it was.
+    """
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+            log(f"Injection thread pinned to CPU(s) {sorted(cpus)}")
+        except OSError as e:
+            log(f"Could not set CPU affinity {sorted(cpus)}: {e}")
+    if priority:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            log(f"Injection thread running SCHED_FIFO priority {priority}")
+        except OSError as e:
+            log(f"Could not set SCHED_FIFO priority {priority}: {e}")
+    if lock_memory:
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+            log(f"Could not lock memory: {os.strerror(ctypes.get_errno())}")
+
+
+def set_busy_poll(sock, usec):
+    """Let the kernel busy-poll the NIC queue for usec before sleeping in a
+    receive on sock. Needs a driver with NAPI busy polling (not loopback)
+    and CAP_NET_ADMIN above net.core.busy_read."""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_BUSY_POLL, usec)
+    except OSError as e:
+        log(f"Could not set SO_BUSY_POLL {usec} us: {e}")
+
+
+def spin_read(reader, spin):
+    """Poll a non-blocking reader for up to spin seconds.
+
+    Spinning keeps the thread on its CPU, so a packet that arrives within
+    the window is read without a sleep/wakeup round trip through the
+    scheduler. Raises BlockingIOError when the window passes empty.
+    """
+    deadline = time.perf_counter() + spin
     while True:
         try:
-            data, addr = sock.recvfrom(256)
-        except OSError:
-            break
+            return reader.read()
+        except BlockingIOError:
+            if time.perf_counter() >= deadline:
+                raise
+
 
-        if len(data) < EVENT_SIZE:
+def format_histogram(hist):
+    """Render power-of-two buckets as '1:n 2-3:n 4-7:n ...'."""
+    parts = []
+    for i, count in enumerate(hist):
+        if not count:
             continue
+        lo = 1 << i
+        if i == len(hist) - 1:
+            parts.append(f"{lo}+:{count}")
+        elif lo == 1:
+            parts.append(f"1:{count}")
+        else:
+            parts.append(f"{lo}-{2 * lo - 1}:{count}")
+    return " ".join(parts)
+
+
+class InputStats(ProtocolStats):
+    """Session and command counters kept by an Injector, on top of the
+    protocol and injection engine ones."""
+
+    def __init__(self):
+        super().__init__()
+        self.datagrams = 0
+        self.received = [0] * 256  # decoded events by event type
+        # inject() time in power-of-two us buckets: <1, <2, <4, ... 16384+
+        self.inject_hist = [0] * 16
+        self.inject_ns = 0
+        # Client sessions
+        self.unmapped = 0          # moves/ups for a slot the client never put down
+        self.slots_exhausted = 0   # touch-downs with every device slot taken
+        self.sessions_expired = 0  # quiet clients whose touches were released
+        self.gestures = 0          # gesture commands started
+        self.texts = 0             # text commands started
+        self.untypable = 0         # characters/keycodes a text could not type
+
+
+class TransportStats:
+    """Per-ingress counters: one each for UDP, the Unix socket and WebSocket."""
+
+    def __init__(self, name):
+        self.name = name
+        self.datagrams = 0
+        self.bytes = 0
+        self.events = 0     # decoded, before session mapping and coalescing
+        self.errors = 0
+        self.clients = 0    # connected WebSocket clients
+
+    def format(self):
+        line = (f"{self.name}: {self.datagrams} datagrams, {self.bytes} bytes, "
+                f"{self.events} events, {self.errors} errors")
+        if self.name == "ws":
+            line += f", {self.clients} connected"
+        return line
+
 
-        # Process all complete events in the datagram
-        offset = 0
-        while offset + EVENT_SIZE <= len(data):
-            evt_type, ts, arg1, arg2, arg3, arg4 = struct.unpack_from(
-                EVENT_FMT, data, offset
-            )
-            offset += EVENT_SIZE
+# ---------------------------------------------------------------------------
+# Input journal
+# ---------------------------------------------------------------------------
+# A fixed-size file, mmap'ed and written as a ring, so a long session keeps
+# its newest input and the journal survives the server being killed.
+# Positions are byte counts since the journal was created; the record at
+# position p lives at offset JOURNAL_HEADER.size + p % capacity. Records
+# never straddle the end of the ring: the rest of the ring is skipped (a
+# JOURNAL_PAD record, or nothing when less than a record header is left).
+# | magic "WJ" | version(u8)=1 | reserved(u8) | reserved(u32) |
+# | capacity(u64) | start(u64) | end(u64) |                                 header
+# | arrival_ns(u64) | source(u32) | transport(u8) | length(u16) | datagram |  record
+JOURNAL_MAGIC = b"WJ"
+JOURNAL_VERSION = 1
+JOURNAL_HEADER = struct.Struct("<2sBBIQQQ")
+JOURNAL_RECORD = struct.Struct("<QIBH")
+JOURNAL_TRANSPORTS = ("udp", "unix", "ws")
+JOURNAL_PAD = 0xFF  # transport byte of a padding record
 
+
+class Journal:
+    """Append-only ring of received datagrams with arrival time and source.
+
+    Datagrams are journaled as received (before decoding), so a replay
+    reproduces protocol framing, redundancy trailers and bad packets too.
+    """
+
+    def __init__(self, path, capacity):
+        size = JOURNAL_HEADER.size + capacity
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            header = os.pread(fd, JOURNAL_HEADER.size, 0)
+            resume = False
+            if len(header) == JOURNAL_HEADER.size:
+                magic, version, _, _, old_capacity, start, end = \
+                    JOURNAL_HEADER.unpack(header)
+                resume = (magic == JOURNAL_MAGIC and version == JOURNAL_VERSION
+                          and old_capacity == capacity)
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.capacity = capacity
+        if resume:
+            self.start, self.end = start, end
+        else:
+            self.start = self.end = 0
+        self.records = 0
+        self.overwritten = 0
+        self.sources = {}  # session key -> 32-bit source id
+        self._sync()
+
+    def source(self, key):
+        """32-bit id of a datagram's source, stable across a session."""
+        source = self.sources.get(key)
+        if source is None:
+            if len(self.sources) >= 1024:
+                self.sources.clear()
+            source = self.sources[key] = zlib.crc32(format_client(key).encode())
+        return source
+
+    def _sync(self):
+        JOURNAL_HEADER.pack_into(self.map, 0, JOURNAL_MAGIC, JOURNAL_VERSION, 0, 0,
+                                 self.capacity, self.start, self.end)
+
+    def append(self, arrival_ns, source, transport, data):
+        size = JOURNAL_RECORD.size + len(data)
+        capacity = self.capacity
+        if size > capacity:
+            return
+        end = self.end
+        room = capacity - end % capacity
+        pad = room < size
+        if pad:
+            end += room
+        # Drop the oldest records this one (and any padding) overwrites
+        start = self.start
+        while start < end + size - capacity:
+            if start >= self.end:
+                start = end
+                break
+            start, datagram = self._next(start)
+            if datagram:
+                self.overwritten += 1
+        if pad and room >= JOURNAL_RECORD.size:
+            JOURNAL_RECORD.pack_into(self.map, JOURNAL_HEADER.size + self.end % capacity,
+                                     0, 0, JOURNAL_PAD, room - JOURNAL_RECORD.size)
+        offset = JOURNAL_HEADER.size + end % capacity
+        JOURNAL_RECORD.pack_into(self.map, offset, arrival_ns, source, transport, len(data))
+        self.map[offset + JOURNAL_RECORD.size:offset + size] = data
+        self.start = start
+        self.end = end + size
+        self.records += 1
+        self._sync()
+
+    def _next(self, pos):
+        """Position of the record after the one at pos, and whether the one
+        at pos holds a datagram rather than padding."""
+        capacity = self.capacity
+        room = capacity - pos % capacity
+        if room < JOURNAL_RECORD.size:
+            return pos + room, False
+        _, _, transport, length = JOURNAL_RECORD.unpack_from(
+            self.map, JOURNAL_HEADER.size + pos % capacity)
+        return pos + JOURNAL_RECORD.size + length, transport != JOURNAL_PAD
+
+    def close(self):
+        self._sync()
+        self.map.flush()
+        self.map.close()
+        log(f"Journal: {self.records} datagrams appended, "
+            f"{self.overwritten} oldest overwritten")
+
+
+def read_journal(path):
+    """Yield (arrival_ns, source, transport, datagram) from a journal, oldest first."""
+    with open(path, "rb") as f:
+        buf = f.read()
+    if len(buf) < JOURNAL_HEADER.size:
+        raise ValueError(f"{path}: not an input journal")
+    magic, version, _, _, capacity, start, end = JOURNAL_HEADER.unpack_from(buf)
+    if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+        raise ValueError(f"{path}: not an input journal (version {version})")
+    if len(buf) < JOURNAL_HEADER.size + capacity:
+        raise ValueError(f"{path}: truncated journal")
+    pos = start
+    while pos < end:
+        room = capacity - pos % capacity
+        if room < JOURNAL_RECORD.size:
+            pos += room
+            continue
+        offset = JOURNAL_HEADER.size + pos % capacity
+        arrival_ns, source, transport, length = JOURNAL_RECORD.unpack_from(buf, offset)
+        pos += JOURNAL_RECORD.size + length
+        if transport == JOURNAL_PAD:
+            continue
+        data_start = offset + JOURNAL_RECORD.size
+        yield arrival_ns, source, transport, buf[data_start:data_start + length]
+
+
+# ---------------------------------------------------------------------------
+# Injector
+# ---------------------------------------------------------------------------
+class Injector:
+    """Decodes datagrams from every transport and injects them as frames.
+
+    One Injector owns the injection engine (and through it the device), the
+    v2 sender table and the client sessions. All transports must feed it
+    from the same thread.
+
+    Touch coordinates arrive in client_size pixels, or normalized to
+    0..65535 when a v2 packet sets V2_FLAG_NORMALIZED, and are rescaled to
+    the device size. A size message from this host (see resize()) changes
+    the device size; make_device(width, height) then builds the new device.
+    """
+
+    def __init__(self, dev, stats, monitor=None, sessions=None, report_every=500,
+                 gestures=None, resampler=None, size=(STREAM_WIDTH, STREAM_HEIGHT),
+                 client_size=(STREAM_WIDTH, STREAM_HEIGHT), make_device=None,
+                 journal=None, typing=None):
+        self.engine = InjectionEngine(dev, stats)
+        self.stats = stats
+        self.monitor = monitor
+        self.gestures = gestures
+        self.typing = typing
+        self.resampler = resampler
+        self.sessions = sessions if sessions is not None else SessionTable()
+        self.senders = SenderTable()
+        self.report_every = report_every
+        self.transports = []
+        self.client_size = client_size
+        self.make_device = make_device
+        self.journal = journal
+        self.set_size(*size)
+
+    def set_size(self, width, height):
+        """Precompute the fixed-point factors for a device of width x height."""
+        self.size = (width, height)
+        cw, ch = self.client_size
+        if (cw, ch) == (width, height):
+            self.pixel_scale = None
+        else:
+            self.pixel_scale = (-1, scale_factor(cw - 1, width - 1),
+                                scale_factor(ch - 1, height - 1))
+        self.normalized_scale = (NORMALIZED_MAX,
+                                 scale_factor(NORMALIZED_MAX, width - 1),
+                                 scale_factor(NORMALIZED_MAX, height - 1))
+        if self.resampler is not None:
+            self.resampler.width = width
+            self.resampler.height = height
+
+    def add_transport(self, name):
+        source = TransportStats(name)
+        self.transports.append(source)
+        return source
+
+    def feed(self, datagrams, addrs, stamps, source, reply=None, session_key=None):
+        """Inject one wakeup's worth of datagrams from a transport.
+
+        addrs/stamps are aligned with datagrams; reply(packet, addr) answers
+        clock pings. session_key overrides the per-sender session, for
+        transports that know their client (a WebSocket connection).
+        """
+        stats = self.stats
+        stats.datagrams += len(datagrams)
+        source.datagrams += len(datagrams)
+        now = time.monotonic()
+        monitor = self.monitor
+        sessions = self.sessions
+        events = []
+        commands = [] if self.gestures is not None or self.typing is not None else None
+        new_size = None
+        journal = self.journal
+        if journal is not None:
+            rx_ns = time.time_ns()
+            transport = JOURNAL_TRANSPORTS.index(source.name)
+        if monitor is not None:
+            monitor.wakeup_ns = time.time_ns()
+        for i, data in enumerate(datagrams):
+            source.bytes += len(data)
+            if journal is not None:
+                journal.append(stamps[i] or rx_ns,
+                               journal.source(addrs[i] if session_key is None else session_key),
+                               transport, data)
+            if monitor is not None and monitor.on_datagram(data, addrs[i], stamps[i], reply):
+                continue
+            start = len(events)
+            key, flags = decode_datagram(data, events, self.senders, stats)
+            source.events += len(events) - start
+            received = stats.received
+            for j in range(start, len(events)):
+                received[events[j][0]] += 1
+            if session_key is not None:
+                key = session_key
+            elif key is None:
+                if len(events) == start:
+                    if data[:2] == SIZE_MAGIC and len(data) >= SIZE_MSG.size:
+                        if self.trusted(source, addrs[i]):
+                            new_size = SIZE_MSG.unpack_from(data)[1:]
+                        else:
+                            stats.malformed += 1
+                    continue
+                key = addrs[i]
+            scale = (self.normalized_scale if flags & V2_FLAG_NORMALIZED
+                     else self.pixel_scale)
+            sessions.map_events(key, events, start, now, stats, commands, scale)
+            if commands:
+                self.start_commands(commands, key, now, scale)
+                commands.clear()
+        if monitor is not None:
+            monitor.ping(monitor.wakeup_ns)
+        stats.sessions_expired += sessions.expire(now, events)
+        self.inject(events)
+        if new_size is not None:
+            self.resize(*new_size)
+
+    def start_commands(self, commands, key, now, scale):
+        """Hand a datagram's gesture and text commands to their engines."""
+        stats = self.stats
+        gestures = [c for c in commands if c[0] in GESTURE_EVENTS]
+        if gestures and self.gestures is not None:
+            self.gestures.start(parse_gestures(gestures, key, now, stats, scale))
+        texts = [c for c in commands if c[0] in TEXT_EVENTS]
+        if texts and self.typing is not None:
+            self.typing.start(parse_text(texts, key, now, stats,
+                                         self.typing.key_interval))
+
+    @staticmethod
+    def trusted(source, addr):
+        """Size messages are only taken from this host, never from browsers."""
+        if source.name == "unix":
+            return True
+        return source.name == "udp" and addr is not None and addr[0] in LOOPBACK_HOSTS
+
+    def resize(self, width, height):
+        """Switch to a width x height screen, recreating the device if needed.
+
+        Everything held is released on the old device first, since touches
+        in progress cannot be carried across a change of axis ranges.
+        """
+        if (width, height) == self.size:
+            return
+        if not 2 <= width <= 0x7FFF or not 2 <= height <= 0x7FFF:
+            log(f"Ignoring screen size {width}x{height}")
+            return
+        events = []
+        for key in list(self.sessions.sessions):
+            self.sessions.release(key, events)
+        if self.gestures is not None:
+            self.gestures.active.clear()
+        if self.typing is not None:
+            self.typing.active.clear()
+        self.inject(events)
+        if self.make_device is not None:
             try:
-                handle_event(dev, evt_type, arg1, arg2, arg3, arg4)
-                event_count += 1
+                dev = self.make_device(width, height)
             except Exception as e:
-                log(f"Event injection error: {e}")
+                log(f"Could not recreate the device at {width}x{height}: {e}")
+                return
+            self.engine.close()
+            self.engine.set_device(dev)
+        log(f"Screen size {self.size[0]}x{self.size[1]} -> {width}x{height}")
+        self.set_size(width, height)
+
+    def step_gestures(self):
+        """Inject the next sample of every running gesture."""
+        now = time.monotonic()
+        events = []
+        for key, gesture_events in self.gestures.step(now):
+            start = len(events)
+            events.extend(gesture_events)
+            self.sessions.map_events(key, events, start, now, self.stats)
+        self.inject(events, resample=False)
+
+    def step_typing(self):
+        """Inject the next due key press or release of every pending text.
+
+        Each session's keys go into a frame of their own, so a press is
+        never merged with another text's release of the same key.
+        """
+        now = time.monotonic()
+        for key, key_events in self.typing.step(now):
+            self.sessions.map_events(key, key_events, 0, now, self.stats)
+            self.inject(key_events, resample=False)
+
+    def step_resampler(self):
+        """Inject the resampled position of every touching slot."""
+        self.inject(self.resampler.step(time.monotonic()), resample=False)
+
+    def tick(self):
+        """Release quiet clients and send due pings while no input arrives."""
+        events = []
+        self.stats.sessions_expired += self.sessions.expire(time.monotonic(), events)
+        if self.monitor is not None:
+            self.monitor.ping(time.time_ns())
+        self.inject(events)
+
+    def release(self, key):
+        """Lift everything held by a session whose client disconnected."""
+        events = []
+        self.sessions.release(key, events)
+        if self.gestures is not None:
+            self.gestures.cancel(key)
+        if self.typing is not None:
+            self.typing.cancel(key)
+        self.inject(events)
+
+    def inject(self, events, resample=True):
+        stats = self.stats
+        monitor = self.monitor
+        if resample and self.resampler is not None and events:
+            events = self.resampler.absorb(events, time.monotonic())
+        if not events:
+            if monitor is not None:
+                monitor.pending.clear()
+            return
+        before = stats.events
+        t0 = time.perf_counter_ns()
+        self.engine.inject(events)
+        elapsed = time.perf_counter_ns() - t0
+        stats.inject_ns += elapsed
+        inject_hist = stats.inject_hist
+        inject_hist[min((elapsed // 1000).bit_length(), len(inject_hist) - 1)] += 1
+        if monitor is not None:
+            monitor.on_injected(time.time_ns())
+
+        # Log periodically, even when a batch jumps past the boundary
+        report_every = self.report_every
+        if report_every and stats.events // report_every > before // report_every:
+            self.report()
+
+    def report(self):
+        stats = self.stats
+        log(f"  {stats.events} events injected in {stats.frames} frames, "
+            f"{stats.coalesced} stale moves coalesced, "
+            f"{stats.unknown} of unknown type ignored")
+        log(f"  events/wakeup: {format_histogram(stats.wakeup_hist)}")
+        if stats.v2_packets:
+            log(f"  v2: {stats.duplicates} duplicate, {stats.late} late, "
+                f"{stats.seq_gaps} sequence gaps, {stats.malformed} malformed, "
+                f"{stats.short} short, "
+                f"{stats.recovered} state events recovered by redundancy")
+        log(f"  sessions: {len(self.sessions.sessions)} clients, "
+            f"{stats.unmapped} unmapped, {stats.slots_exhausted} over slot limit, "
+            f"{stats.sessions_expired} released after going quiet, "
+            f"{stats.gestures} gestures, {stats.texts} texts "
+            f"({stats.untypable} untypable characters)")
+        if len(self.transports) > 1:
+            for source in self.transports:
+                log(f"  {source.format()}")
+        if self.resampler is not None:
+            log(f"  {self.resampler.report()}")
+        if self.monitor is not None:
+            for line in self.monitor.report():
+                log(f"  latency {line}")
+
+
+# ---------------------------------------------------------------------------
+# Metrics endpoint
+# ---------------------------------------------------------------------------
+# Prometheus text exposition of the counters the injector already keeps. The
+# endpoint runs on the event loop thread, the only one that writes them, so
+# the hot path stays plain integer increments with no locks.
+EVENT_TYPE_NAMES = {
+    EVT_MOUSE_MOVE: "touch_move", EVT_MOUSE_DOWN: "touch_down",
+    EVT_MOUSE_UP: "touch_up", EVT_KEY_DOWN: "key_down", EVT_KEY_UP: "key_up",
+    EVT_GESTURE: "gesture", EVT_GESTURE_POINT: "gesture_point",
+    EVT_TEXT: "text", EVT_TEXT_DATA: "text_data",
+}
+
+
+def format_metrics(injector):
+    """Render the injector's counters in the Prometheus text format."""
+    stats = injector.stats
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP input_{name} {help_text}")
+        lines.append(f"# TYPE input_{name} {kind}")
+        for labels, value in samples:
+            lines.append(f"input_{name}{labels} {value}")
+
+    def histogram(name, help_text, hist, bound, total):
+        samples = []
+        cumulative = 0
+        for i, count in enumerate(hist[:-1]):
+            cumulative += count
+            samples.append((f'_bucket{{le="{bound(i):g}"}}', cumulative))
+        samples.append(('_bucket{le="+Inf"}', cumulative + hist[-1]))
+        samples.append(("_sum", total))
+        samples.append(("_count", cumulative + hist[-1]))
+        metric(name, "histogram", help_text, samples)
+
+    metric("datagrams_total", "counter", "Datagrams received per transport.",
+           [(f'{{transport="{t.name}"}}', t.datagrams) for t in injector.transports])
+    metric("bytes_total", "counter", "Bytes received per transport.",
+           [(f'{{transport="{t.name}"}}', t.bytes) for t in injector.transports])
+    other = sum(n for t, n in enumerate(stats.received) if t not in EVENT_TYPE_NAMES)
+    metric("events_received_total", "counter", "Decoded events per event type.",
+           [(f'{{type="{name}"}}', stats.received[t])
+            for t, name in EVENT_TYPE_NAMES.items()] + [('{type="unknown"}', other)])
+    metric("malformed_total", "counter", "Datagrams with a bad header or command.",
+           [("", stats.malformed)])
+    metric("short_total", "counter", "Datagrams cut off inside an event.",
+           [("", stats.short)])
+    metric("v2_dropped_total", "counter", "v2 packets dropped by sequencing.",
+           [('{reason="duplicate"}', stats.duplicates), ('{reason="late"}', stats.late)])
+    metric("v2_seq_gaps_total", "counter", "v2 packets never received.",
+           [("", stats.seq_gaps)])
+    metric("recovered_total", "counter", "State events recovered from redundancy trailers.",
+           [("", stats.recovered)])
+    metric("events_injected_total", "counter", "Events written to the device.",
+           [("", stats.events)])
+    metric("frames_total", "counter", "SYN_REPORT frames written to the device.",
+           [("", stats.frames)])
+    metric("coalesced_total", "counter", "Stale touch moves dropped before injection.",
+           [("", stats.coalesced)])
+    metric("injection_errors_total", "counter", "Events the device rejected.",
+           [("", stats.errors)])
+    metric("unmapped_total", "counter", "Moves/ups for a slot the client never put down.",
+           [("", stats.unmapped)])
+    metric("slots_exhausted_total", "counter", "Touch-downs with every device slot taken.",
+           [("", stats.slots_exhausted)])
+    metric("commands_total", "counter", "Gesture and text commands started.",
+           [('{kind="gesture"}', stats.gestures), ('{kind="text"}', stats.texts)])
+    metric("active_slots", "gauge", "Touch slots currently down on the device.",
+           [("", len(injector.engine.active_slots))])
+    metric("sessions", "gauge", "Client sessions.",
+           [("", len(injector.sessions.sessions))])
+    histogram("events_per_wakeup", "Events per injected batch.",
+              stats.wakeup_hist, lambda i: (2 << i) - 1, stats.batched)
+    histogram("inject_seconds", "Time to inject one batch.",
+              stats.inject_hist, lambda i: (1 << i) / 1e6, stats.inject_ns / 1e9)
+    return "\n".join(lines) + "\n"
+
+
+def make_metrics_handler(injector):
+    """Minimal HTTP/1.0 server answering GET /metrics."""
+
+    async def handler(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+                status = "200 OK"
+                body = format_metrics(injector).encode()
+            else:
+                status = "404 Not Found"
+                body = b"Not found\n"
+            writer.write(f"HTTP/1.0 {status}\r\n"
+                         "Content-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return handler
+
+
+# ---------------------------------------------------------------------------
+# asyncio ingress: UDP, Unix datagram socket and WebSocket into one Injector
+# ---------------------------------------------------------------------------
+TICK_INTERVAL = 0.25
+SPIN_ROUNDS = 16  # batches one readable callback may spin for
+
+
+def add_datagram_transport(loop, injector, sock, name, mode, batch, timestamps,
+                           spin=0.0):
+    """Drain sock from the event loop whenever it is readable.
+
+    With spin > 0 the callback keeps polling for spin seconds after each
+    batch, so a follow-up packet does not wait for the next loop wakeup.
+    """
+    sock.setblocking(False)
+    reader = make_reader(sock, mode, batch, timestamps)
+    source = injector.add_transport(name)
+    reply = sock.sendto
+
+    def on_readable():
+        # Bounded, so a steady stream cannot starve timers and WebSockets
+        for rounds in range(SPIN_ROUNDS if spin else 1):
+            try:
+                datagrams = spin_read(reader, spin) if rounds else reader.read()
+            except BlockingIOError:
+                return
+            except OSError as e:
+                source.errors += 1
+                log(f"{name} read error: {e}")
+                return
+            injector.feed(datagrams, reader.addrs, reader.stamps, source, reply)
+
+    loop.add_reader(sock.fileno(), on_readable)
+    return reader
+
+
+def add_fixed_rate_timer(loop, engine, step):
+    """Call step() every engine.interval while engine.active, on absolute
+    deadlines so the cadence does not drift. engine.wake() restarts it."""
+    handle = None
+
+    def run(deadline):
+        nonlocal handle
+        step()
+        if not engine.active:
+            handle = None
+            return
+        deadline += engine.interval
+        now = loop.time()
+        if deadline < now:
+            deadline = now  # fell behind: resume the cadence, do not burst
+        handle = loop.call_at(deadline, run, deadline)
+
+    def wake():
+        nonlocal handle
+        if handle is None:
+            handle = loop.call_soon(run, loop.time())
+
+    engine.wake = wake
+
+
+def make_ws_handler(injector):
+    """WebSocket endpoint for browsers: each binary message is one datagram.
+
+    The connection is the client session, so closing the page lifts its
+    touches at once instead of after --session-timeout.
+    """
+    source = injector.add_transport("ws")
+
+    async def handler(websocket, path=None):
+        addr = getattr(websocket, "remote_address", None) or ("?", 0)
+        key = f"ws://{addr[0]}:{addr[1]}"
+        loop = asyncio.get_running_loop()
+
+        async def send(packet):
+            try:
+                await websocket.send(packet)
+            except websockets.exceptions.ConnectionClosed:
+                pass
+
+        def reply(packet, _addr):
+            loop.create_task(send(packet))
+
+        source.clients += 1
+        log(f"WebSocket client connected: {addr[0]}:{addr[1]}")
+        try:
+            async for msg in websocket:
+                if isinstance(msg, bytes):
+                    injector.feed([msg], [addr], [0], source, reply, key)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            source.clients -= 1
+            injector.release(key)
+            log(f"WebSocket client disconnected: {addr[0]}:{addr[1]}")
+
+    return handler
+
+
+async def serve_async(args, injector):
+    """Serve every configured transport until SIGINT/SIGTERM."""
+    loop = asyncio.get_running_loop()
+    batch = max(1, args.batch)
+    closers = []
+    if injector.gestures is not None:
+        add_fixed_rate_timer(loop, injector.gestures, injector.step_gestures)
+    if injector.typing is not None:
+        add_fixed_rate_timer(loop, injector.typing, injector.step_typing)
+    if injector.resampler is not None:
+        add_fixed_rate_timer(loop, injector.resampler, injector.step_resampler)
+
+    spin = max(0, args.spin_us) / 1e6
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((args.host, args.port))
+    closers.append(sock.close)
+    if args.busy_poll_us:
+        set_busy_poll(sock, args.busy_poll_us)
+    reader = add_datagram_transport(loop, injector, sock, "udp", args.ingest,
+                                    batch, args.latency_stats, spin)
+    log(f"UDP   → {args.host}:{args.port} ({type(reader).__name__}, up to "
+        f"{reader.max_datagrams} datagrams per wakeup"
+        + (f", spinning {args.spin_us} us" if spin else "") + ")")
+
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.unlink(args.unix)
+        usock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        usock.bind(args.unix)
+        closers.append(usock.close)
+        closers.append(lambda: os.unlink(args.unix))
+        add_datagram_transport(loop, injector, usock, "unix", args.ingest,
+                               batch, args.latency_stats, spin)
+        log(f"Unix  → {args.unix}")
+
+    if args.ws_port:
+        ws_srv = await websockets.serve(make_ws_handler(injector), args.host,
+                                        args.ws_port, ping_interval=20,
+                                        ping_timeout=60)
+        closers.append(ws_srv.close)
+        log(f"WS    → ws://{args.host}:{args.ws_port}")
+
+    if args.metrics_port:
+        metrics_srv = await asyncio.start_server(make_metrics_handler(injector),
+                                                 args.metrics_host, args.metrics_port)
+        closers.append(metrics_srv.close)
+        log(f"HTTP  → http://{args.metrics_host}:{args.metrics_port}/metrics")
+
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async def ticker():
+        while True:
+            await asyncio.sleep(TICK_INTERVAL)
+            injector.tick()
+
+    tick_task = loop.create_task(ticker())
+    await stop.wait()
+    log("Shutting down.")
+    tick_task.cancel()
+    for close in closers:
+        try:
+            close()
+        except OSError:
+            pass
+
+
+def parse_size(text):
+    """argparse type for WIDTHxHEIGHT."""
+    try:
+        width, height = (int(v) for v in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    if not 2 <= width <= 0x7FFF or not 2 <= height <= 0x7FFF:
+        raise argparse.ArgumentTypeError(f"size out of range: {text}")
+    return width, height
+
+
+def announce_size(host, port, size):
+    """Tell a running input server on this host the new screen size."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.sendto(SIZE_MSG.pack(SIZE_MAGIC, *size), (host, port))
+    sock.close()
+    log(f"Announced screen size {size[0]}x{size[1]} to {host}:{port}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="UDP input event receiver + uinput injector")
+    ap.add_argument("--host", default="0.0.0.0", help="Bind address (default: 0.0.0.0)")
+    ap.add_argument("--port", type=int, default=9001, help="UDP listen port (default: 9001)")
+    ap.add_argument("--unix", metavar="PATH", default=None,
+                    help="Also accept datagrams on a Unix socket at PATH, for "
+                         "processes on this host (default: off)")
+    ap.add_argument("--ws-port", type=int, default=0,
+                    help="Also accept browser input over WebSocket on this "
+                         "port (default: off)")
+    ap.add_argument("--ingest", choices=sorted(INGEST_MODES), default="mmsg",
+                    help="Socket read strategy: single datagram per wakeup, "
+                         "recvmsg drain, or recvmmsg (default: mmsg)")
+    ap.add_argument("--batch", type=int, default=64,
+                    help="Max datagrams read per wakeup (default: 64)")
+    ap.add_argument("--writer", choices=["raw", "evdev"], default="raw",
+                    help="uinput writer: one os.write() per frame, or "
+                         "python-evdev per-event writes (default: raw)")
+    ap.add_argument("--device", choices=DEVICE_BACKENDS,
+                    default="uinput",
+                    help="Injection backend (default: uinput)")
+    ap.add_argument("--record-file", metavar="FILE", default=None,
+                    help="With --device record: write events to FILE")
+    ap.add_argument("--latency-stats", action="store_true",
+                    help="Clock-sync with v2 senders and log per-client network "
+                         "and queueing delay percentiles (default: off)")
+    ap.add_argument("--session-timeout", type=float, default=5.0,
+                    help="Release the touches and keys of a client silent for "
+                         "this many seconds, 0 = never (default: 5)")
+    ap.add_argument("--gesture-rate", type=float, default=120.0,
+                    help="Samples per second for swipe/pinch/long-press/drag "
+                         "commands, 0 = ignore them (default: 120)")
+    ap.add_argument("--type-rate", type=float, default=60.0,
+                    help="Keys per second typed for text commands, 0 = ignore "
+                         "them (default: 60)")
+    ap.add_argument("--resample-rate", type=float, default=0.0,
+                    help="Re-time touch moves onto a fixed rate in Hz, e.g. "
+                         "120 (default: 0 = inject as received)")
+    ap.add_argument("--predict-ms", type=float, default=0.0,
+                    help="With --resample-rate: extrapolate moves up to this "
+                         "many ms ahead to hide latency (default: 0)")
+    ap.add_argument("--size", type=parse_size, default=(STREAM_WIDTH, STREAM_HEIGHT),
+                    metavar="WxH",
+                    help="Screen size the touch device is created for; changed "
+                         "at runtime with --announce-size (default: "
+                         f"{STREAM_WIDTH}x{STREAM_HEIGHT})")
+    ap.add_argument("--client-size", type=parse_size,
+                    default=(STREAM_WIDTH, STREAM_HEIGHT), metavar="WxH",
+                    help="Pixel space of clients that do not send normalized "
+                         f"coordinates (default: {STREAM_WIDTH}x{STREAM_HEIGHT})")
+    ap.add_argument("--rt-priority", type=int, default=0, metavar="N",
+                    help="Run receive and injection SCHED_FIFO at priority N "
+                         "(1-99, needs CAP_SYS_NICE) so encoder load cannot "
+                         "delay input (default: 0 = normal scheduling)")
+    ap.add_argument("--cpus", type=parse_cpus, default=None, metavar="LIST",
+                    help="Pin receive and injection to these CPUs, e.g. 3 or "
+                         "2-3 (default: any)")
+    ap.add_argument("--mlock", action="store_true",
+                    help="Lock all server memory into RAM (mlockall) so page "
+                         "faults cannot stall injection. Pins the whole "
+                         "--journal ring (--journal-mb MB) as well; needs "
+                         "CAP_IPC_LOCK or a large enough RLIMIT_MEMLOCK "
+                         "(default: off)")
+    ap.add_argument("--spin-us", type=int, default=0,
+                    help="After each batch, poll the sockets for this many us "
+                         "before sleeping again; burns CPU (default: 0 = off)")
+    ap.add_argument("--busy-poll-us", type=int, default=0,
+                    help="Set SO_BUSY_POLL on the UDP socket so the kernel "
+                         "polls the NIC for this many us (default: 0 = off)")
+    ap.add_argument("--journal", metavar="FILE", default=None,
+                    help="Append every received datagram with its arrival time "
+                         "and source to FILE, for input_replay.py (default: off)")
+    ap.add_argument("--journal-mb", type=int, default=64,
+                    help="Journal ring size; the oldest input is overwritten "
+                         "when full (default: 64)")
+    ap.add_argument("--metrics-port", type=int, default=0,
+                    help="Serve Prometheus metrics at http://HOST:PORT/metrics "
+                         "(default: 0 = off)")
+    ap.add_argument("--metrics-host", default="127.0.0.1",
+                    help="Address of the metrics endpoint (default: 127.0.0.1)")
+    ap.add_argument("--announce-size", type=parse_size, default=None, metavar="WxH",
+                    help="Do not serve: tell the input server on 127.0.0.1:--port "
+                         "that the screen is now WxH, and exit")
+    args = ap.parse_args()
+
+    if args.announce_size:
+        announce_size("127.0.0.1", args.port, args.announce_size)
+        return
+
+    if args.ws_port and websockets is None:
+        ap.error("--ws-port requires: pip install websockets")
+
+    log("=== Input Server ===")
 
-            if event_count % 500 == 0 and event_count > 0:
-                log(f"  {event_count} events injected")
+    width, height = args.size
+    dev = create_device(args.device, args.writer, args.record_file, width, height)
+    # Only a real uinput device can be recreated at a new size
+    make_device = None
+    if args.device == "uinput":
+        make_device = functools.partial(create_device, args.device, args.writer, None)
+    monitor = LatencyMonitor() if args.latency_stats else None
+    sessions = SessionTable(max(0.0, args.session_timeout))
+    gestures = GestureEngine(args.gesture_rate) if args.gesture_rate > 0 else None
+    typing = TypingEngine(args.type_rate) if args.type_rate > 0 else None
+    resampler = None
+    if args.resample_rate > 0:
+        resampler = Resampler(args.resample_rate, max(0.0, min(50.0, args.predict_ms)))
+    journal = None
+    if args.journal:
+        journal = Journal(args.journal, max(1, args.journal_mb) << 20)
+        log(f"Journal: {args.journal} ({max(1, args.journal_mb)} MB ring)")
+    injector = Injector(dev, InputStats(), monitor, sessions, gestures=gestures,
+                        resampler=resampler, size=args.size,
+                        client_size=args.client_size, make_device=make_device,
+                        journal=journal, typing=typing)
+    log(f"Screen {width}x{height}, pixel clients {args.client_size[0]}x"
+        f"{args.client_size[1]}")
+    # The event loop thread is the only one that receives and injects
+    configure_realtime(max(0, min(99, args.rt_priority)), args.cpus, args.mlock)
+    try:
+        asyncio.run(serve_async(args, injector))
+    finally:
+        injector.engine.close()
+        if journal is not None:
+            journal.close()
 
 
 if __name__ == "__main__":
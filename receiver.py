@@ -12,9 +12,15 @@ Usage:
     python3 receiver.py --sender-host 192.168.86.33        # send input to sender
     python3 receiver.py --save game.ts                     # save + play
     python3 receiver.py --save game.ts --no-play           # save only
+    python3 receiver.py --present yuv420p                  # YUV texture path
+
+Press Insert in the window to type the local clipboard on the remote side.
 """
 
 import argparse
+import collections
+import ctypes
+import multiprocessing
 import os
 import signal
 import socket
@@ -24,28 +30,40 @@ import sys
 import threading
 import time
 
-STREAM_WIDTH = 1280
-STREAM_HEIGHT = 720
-FRAME_SIZE = STREAM_WIDTH * STREAM_HEIGHT * 3  # RGB24
+from input_link import (EVENT_FMT, EVT_KEY_DOWN, EVT_KEY_UP, EVT_MOUSE_DOWN,
+                        EVT_MOUSE_MOVE, EVT_MOUSE_UP, MAX_TEXT_BYTES, STREAM_HEIGHT,
+                        STREAM_WIDTH, InputLink, text_chunk_bytes)
 
-# Binary event protocol: 13 bytes per event, little-endian
-# | type(u8) | timestamp(u32) | arg1(i16) | arg2(i16) | arg3(i16) | arg4(i16) |
-EVENT_FMT = "<BIhhhh"
-EVENT_SIZE = struct.calcsize(EVENT_FMT)
+FRAME_SIZE = STREAM_WIDTH * STREAM_HEIGHT * 3  # RGB24
 
-# Event type constants
-EVT_MOUSE_MOVE = 0
-EVT_MOUSE_DOWN = 1
-EVT_MOUSE_UP = 2
-EVT_KEY_DOWN = 3
-EVT_KEY_UP = 4
+# Gesture commands, played back by input_server.py (must match input_server.py):
+# EVT_GESTURE (kind, duration ms, slot, n) followed by n EVT_GESTURE_POINT
+# (x, y[, x2, y2]) events in the same datagram
+EVT_GESTURE = 5
+EVT_GESTURE_POINT = 6
+GESTURE_SWIPE = 1
+GESTURE_PINCH = 2
+GESTURE_LONG_PRESS = 3
+GESTURE_DRAG = 4
+
+# Text commands, typed by input_server.py (must match input_server.py):
+# EVT_TEXT (kind, ms per key, length) followed by EVT_TEXT_DATA events that
+# carry 8 UTF-8 bytes each, in the same datagram
+EVT_TEXT = 7
+EVT_TEXT_DATA = 8
+TEXT_UTF8 = 1
+
+# Mouse wheel pinch: finger spread (px) and duration of one notch
+WHEEL_PINCH_NEAR = 40
+WHEEL_PINCH_FAR = 140
+WHEEL_PINCH_MS = 120
 
 
 def log(msg):
     print(f"[receiver] {msg}", flush=True)
 
 
-def build_ffmpeg_decode_cmd() -> list[str]:
+def build_ffmpeg_decode_cmd(pix_fmt="rgb24") -> list[str]:
     return [
         "ffmpeg",
         "-loglevel", "warning",
@@ -55,26 +73,106 @@ def build_ffmpeg_decode_cmd() -> list[str]:
         "-probesize", "32768",
         "-i", "pipe:0",
         "-f", "rawvideo",
-        "-pix_fmt", "rgb24",
+        "-pix_fmt", pix_fmt,
         "-s", f"{STREAM_WIDTH}x{STREAM_HEIGHT}",
         "-vsync", "drop",
         "pipe:1",
     ]
 
 
-def make_event(evt_type, arg1=0, arg2=0, arg3=0, arg4=0):
-    ts = int(time.monotonic() * 1000) & 0xFFFFFFFF
-    return struct.pack(EVENT_FMT, evt_type, ts, arg1, arg2, arg3, arg4)
+def i16(v):
+    """Wrap v into an i16 field; normalized coordinates use all 16 bits."""
+    return ((v + 0x8000) & 0xFFFF) - 0x8000
 
 
-def map_mouse_coords(pos, window_size):
-    """Map window pixel coordinates to stream resolution."""
+def make_event(evt_type, arg1=0, arg2=0, arg3=0, arg4=0):
+    ts = int(time.monotonic() * 1000) & 0xFFFFFFFF
+    return struct.pack(EVENT_FMT, evt_type, ts, i16(arg1), i16(arg2),
+                       i16(arg3), i16(arg4))
+
+
+def make_gesture(kind, duration_ms, slot, points):
+    """Pack a gesture command: a header event followed by its points.
+
+    points are (x, y) tuples, or (x, y, x2, y2) for the two pinch fingers.
+    """
+    parts = [make_event(EVT_GESTURE, kind, duration_ms, slot, len(points))]
+    parts.extend(make_event(EVT_GESTURE_POINT, *p) for p in points)
+    return b"".join(parts)
+
+
+def make_texts(text, ms_per_key=0, max_bytes=MAX_TEXT_BYTES):
+    """Pack text as text commands, one per max_bytes of UTF-8.
+
+    Send each command in a datagram of its own; input_server.py types them
+    in order.
+    """
+    data = text.encode("utf-8")
+    commands = []
+    while data:
+        end = min(len(data), max_bytes)
+        while end < len(data) and data[end] & 0xC0 == 0x80:
+            end -= 1  # do not split a multi-byte character
+        chunk, data = data[:end], data[end:]
+        padded = chunk + b"\0" * (-len(chunk) % 8)
+        parts = [make_event(EVT_TEXT, TEXT_UTF8, ms_per_key, len(chunk))]
+        parts.extend(make_event(EVT_TEXT_DATA, *struct.unpack_from("<hhhh", padded, i))
+                     for i in range(0, len(padded), 8))
+        commands.append(b"".join(parts))
+    return commands
+
+
+def paste_clipboard(input_link):
+    """Type the local clipboard on the remote side (Insert key)."""
+    import pygame
+    try:
+        if not pygame.scrap.get_init():
+            pygame.scrap.init()
+        text = pygame.scrap.get_text()  # pygame 2.2+
+    except (AttributeError, pygame.error) as e:
+        log(f"Clipboard unavailable: {e}")
+        return
+    text = (text or "").replace("\r\n", "\n")
+    max_bytes = text_chunk_bytes(input_link.version, input_link.redundancy)
+    for command in make_texts(text, max_bytes=max_bytes):
+        input_link.send(command)
+    if text:
+        log(f"Pasted {len(text)} characters")
+
+
+def make_wheel_pinch(sx, sy, notches, space=(STREAM_WIDTH, STREAM_HEIGHT)):
+    """Pinch around (sx, sy): spread fingers to zoom in, close them to zoom out.
+
+    Every notch moves the fingers WHEEL_PINCH_FAR - WHEEL_PINCH_NEAR further,
+    so several notches make one wider pinch. space is the coordinate space
+    of sx/sy (see InputLink.space); the finger spread is given in stream
+    pixels and scaled to it.
+    """
+    spread = WHEEL_PINCH_NEAR + (WHEEL_PINCH_FAR - WHEEL_PINCH_NEAR) * abs(notches)
+    near = WHEEL_PINCH_NEAR * space[0] // STREAM_WIDTH
+    far = spread * space[0] // STREAM_WIDTH
+    start, end = (near, far) if notches > 0 else (far, near)
+
+    def fingers(spread):
+        x0 = max(0, sx - spread)
+        x1 = min(space[0] - 1, sx + spread)
+        return (x0, sy, x1, sy)
+
+    # Slots 1 and 2, so the pinch never collides with the mouse finger (slot 0)
+    return make_gesture(GESTURE_PINCH, WHEEL_PINCH_MS, 1,
+                        [fingers(start), fingers(end)])
+
+
+def map_mouse_coords(pos, window_size, space=(STREAM_WIDTH, STREAM_HEIGHT)):
+    """Map window pixel coordinates to the input coordinate space
+    (stream resolution, or NORMALIZED_SPACE)."""
     wx, wy = pos
     ww, wh = window_size
-    sx = int(wx * STREAM_WIDTH / ww)
-    sy = int(wy * STREAM_HEIGHT / wh)
-    sx = max(0, min(STREAM_WIDTH - 1, sx))
-    sy = max(0, min(STREAM_HEIGHT - 1, sy))
+    width, height = space
+    sx = int(wx * width / ww)
+    sy = int(wy * height / wh)
+    sx = max(0, min(width - 1, sx))
+    sy = max(0, min(height - 1, sy))
     return sx, sy
 
 
@@ -141,194 +239,989 @@ def build_keymap():
     return m
 
 
-def input_sender_loop(udp_sock, sender_addr, keymap, running_event):
-    """Pygame event loop: capture mouse/keyboard and send UDP packets."""
+class InputDispatcher:
+    """Turn pygame input events into input packets, timing each dispatch.
+
+    A dispatch is timed from when the main loop last found the event queue
+    empty (or from waking up, if it was blocked), so the figure bounds how
+    long an event waited on the receiver: queueing, packing and sendto().
+
+    Wheel notches that arrive while the previous wheel pinch is still
+    running are added up and sent as one pinch when it ends; call tick()
+    regularly to send them.
+    """
+
+    def __init__(self, input_link, keymap, presenter):
+        self.input_link = input_link
+        self.keymap = keymap
+        self.presenter = presenter
+        self.touching = False  # finger-on-screen state (left mouse button)
+        self.latencies = collections.deque(maxlen=512)  # ms, most recent sends
+        self.wheel_notches = 0  # not sent yet; > 0 zooms in
+        self.wheel_pos = (0, 0)
+        self.pinch_end = 0.0    # monotonic time the last wheel pinch is over
+
+    def handle(self, event, since):
+        """Send event if it maps to input; since is a perf_counter() time."""
+        if self._send(event):
+            self.latencies.append((time.perf_counter() - since) * 1000)
+
+    def _send(self, event):
+        import pygame
+
+        input_link = self.input_link
+        if event.type == pygame.MOUSEMOTION:
+            # Only send drag events while finger is down (left button held)
+            if not self.touching:
+                return False
+            sx, sy = map_mouse_coords(event.pos, self.presenter.size(), input_link.space)
+            input_link.send(make_event(EVT_MOUSE_MOVE, sx, sy, 0, 0))
+
+        elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self.touching = True
+            sx, sy = map_mouse_coords(event.pos, self.presenter.size(), input_link.space)
+            input_link.send(make_event(EVT_MOUSE_DOWN, sx, sy, 0, 0))
+
+        elif event.type == pygame.MOUSEWHEEL and event.y and not self.touching:
+            # Server-side pinch: one small packet instead of a move stream
+            self.wheel_notches += event.y
+            self.wheel_pos = pygame.mouse.get_pos()
+            return self.send_pinch()
+
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.touching = False
+            sx, sy = map_mouse_coords(event.pos, self.presenter.size(), input_link.space)
+            input_link.send(make_event(EVT_MOUSE_UP, sx, sy, 0, 0))
+
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_INSERT:
+            paste_clipboard(input_link)
+
+        elif event.type in (pygame.KEYDOWN, pygame.KEYUP):
+            evdev_code = self.keymap.get(event.key, 0)
+            if not evdev_code:
+                return False
+            evt_type = EVT_KEY_DOWN if event.type == pygame.KEYDOWN else EVT_KEY_UP
+            input_link.send(make_event(evt_type, evdev_code, 0, 0, 0))
+
+        else:
+            return False
+        return True
+
+    def send_pinch(self):
+        """Send the pending wheel notches as one pinch unless one still runs."""
+        now = time.monotonic()
+        if not self.wheel_notches or now < self.pinch_end:
+            return False
+        input_link = self.input_link
+        sx, sy = map_mouse_coords(self.wheel_pos, self.presenter.size(), input_link.space)
+        input_link.send(make_wheel_pinch(sx, sy, self.wheel_notches, input_link.space))
+        self.wheel_notches = 0
+        self.pinch_end = now + WHEEL_PINCH_MS / 1000
+        return True
+
+    def wheel_due(self):
+        """Monotonic time pending wheel notches are to be sent, or None."""
+        return self.pinch_end if self.wheel_notches else None
+
+    def tick(self):
+        self.send_pinch()
+
+    def summary(self):
+        """(p50, p99, max) dispatch latency in ms over the recent sends."""
+        if not self.latencies:
+            return 0.0, 0.0, 0.0
+        vals = sorted(self.latencies)
+        return (vals[len(vals) // 2], vals[min(len(vals) - 1, len(vals) * 99 // 100)],
+                vals[-1])
+
+
+# ---------------------------------------------------------------------------
+# Frame presentation
+# ---------------------------------------------------------------------------
+# rgb:           ffmpeg converts to RGB24, pygame blits (and scales in software)
+# yuv420p, nv12: ffmpeg hands over its 4:2:0 planes, half the pipe traffic and
+#                no swscale; they are uploaded to an SDL2 streaming texture and
+#                the renderer scales them to the window (on the GPU if it can)
+PRESENT_MODES = ("rgb", "yuv420p", "nv12")
+
+# SDL_PIXELFORMAT_IYUV / _NV12 fourccs and SDL_TEXTUREACCESS_STREAMING
+SDL_PIXELFORMATS = {"yuv420p": 0x56555949, "nv12": 0x3231564E}
+SDL_TEXTUREACCESS_STREAMING = 1
+
+WINDOW_TITLE = "Waydroid Stream"
+
+OVERLAY_POS = (8, 8)  # top-left corner of the debug overlay, window pixels
+
+
+class SDLRendererInfo(ctypes.Structure):
+    _fields_ = [("name", ctypes.c_char_p), ("flags", ctypes.c_uint32),
+                ("num_texture_formats", ctypes.c_uint32),
+                ("texture_formats", ctypes.c_uint32 * 16),
+                ("max_texture_width", ctypes.c_int),
+                ("max_texture_height", ctypes.c_int)]
+
+
+def load_sdl2():
+    """The SDL2 library pygame runs on, for the calls pygame does not wrap.
+
+    It must be the very library pygame loaded (bundled in pygame wheels),
+    not just any libSDL2, since renderers and textures cannot cross copies.
+    """
+    import ctypes.util
+    import glob
     import pygame
 
-    while running_event.is_set():
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running_event.clear()
-                return
+    candidates = []
+    try:
+        with open("/proc/self/maps") as f:
+            candidates += sorted({line.split()[-1] for line in f if "/libSDL2-2" in line})
+    except OSError:
+        pass  # not Linux
+    base = os.path.dirname(pygame.__file__)
+    candidates += glob.glob(os.path.join(base, "SDL2.dll"))
+    candidates += glob.glob(os.path.join(base, ".dylibs", "libSDL2*"))
+    system = ctypes.util.find_library("SDL2")
+    if system:
+        candidates.append(system)
+    for path in candidates:
+        try:
+            return ctypes.CDLL(path)
+        except OSError:
+            continue
+    raise OSError("SDL2 library not found")
 
-            if event.type == pygame.VIDEORESIZE:
-                # Window resized — no packet needed, just let pygame handle it
-                continue
 
-            screen = pygame.display.get_surface()
-            if screen is None:
-                continue
-            win_size = screen.get_size()
+class SurfacePresenter:
+    """RGB24 frames shown through pygame surfaces over the frame buffers."""
 
-            if sender_addr is None:
-                continue
+    pix_fmt = "rgb24"
 
-            if event.type == pygame.MOUSEMOTION:
-                sx, sy = map_mouse_coords(event.pos, win_size)
-                pkt = make_event(EVT_MOUSE_MOVE, sx, sy, event.rel[0], event.rel[1])
-                udp_sock.sendto(pkt, sender_addr)
+    def __init__(self, buffers=3):
+        import pygame
+        self.screen = pygame.display.set_mode((STREAM_WIDTH, STREAM_HEIGHT),
+                                              pygame.RESIZABLE)
+        pygame.display.set_caption(WINDOW_TITLE)
+        self.set_buffers([bytearray(FRAME_SIZE) for _ in range(buffers)])
+        self.scaled = None  # reused scale target, in the frames' pixel format
+
+    def set_buffers(self, bufs):
+        """Present from bufs (writable, one frame each) from now on."""
+        import pygame
+        self.bufs = bufs
+        self.views = [memoryview(buf) for buf in bufs]
+        # Views of the buffers, not copies: each shows whatever its buffer holds
+        self.surfaces = [pygame.image.frombuffer(buf, (STREAM_WIDTH, STREAM_HEIGHT), "RGB")
+                         for buf in bufs]
 
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                sx, sy = map_mouse_coords(event.pos, win_size)
-                pkt = make_event(EVT_MOUSE_DOWN, sx, sy, event.button, 0)
-                udp_sock.sendto(pkt, sender_addr)
+    def size(self):
+        return self.screen.get_size()
 
-            elif event.type == pygame.MOUSEBUTTONUP:
-                sx, sy = map_mouse_coords(event.pos, win_size)
-                pkt = make_event(EVT_MOUSE_UP, sx, sy, event.button, 0)
-                udp_sock.sendto(pkt, sender_addr)
+    def present(self, index, overlay=None):
+        """Show the frame in buffer index; returns the bytes copied on the way.
 
-            elif event.type == pygame.KEYDOWN:
-                evdev_code = keymap.get(event.key, 0)
-                if evdev_code:
-                    pkt = make_event(EVT_KEY_DOWN, evdev_code, 0, 0, 0)
-                    udp_sock.sendto(pkt, sender_addr)
+        The buffer may be refilled as soon as this returns.
+        """
+        import pygame
+        screen = self.screen
+        surface = self.surfaces[index]
+        win_size = screen.get_size()
+        copied = win_size[0] * win_size[1] * screen.get_bytesize()
+        if win_size == (STREAM_WIDTH, STREAM_HEIGHT):
+            screen.blit(surface, (0, 0))
+        else:
+            if self.scaled is None or self.scaled.get_size() != win_size:
+                self.scaled = pygame.Surface(win_size, 0, surface)
+            pygame.transform.scale(surface, win_size, self.scaled)
+            screen.blit(self.scaled, (0, 0))
+            copied += win_size[0] * win_size[1] * 3
+        self.show(overlay)
+        return copied
+
+    def show(self, overlay=None):
+        """Flip the window, with overlay on top of the last frame."""
+        import pygame
+        if overlay is not None:
+            self.screen.blit(overlay, OVERLAY_POS)
+        pygame.display.flip()
+
+
+class TexturePresenter:
+    """4:2:0 frames uploaded to an SDL2 YUV streaming texture.
+
+    pygame._sdl2 renderers only create RGB textures, so the texture is made
+    with ctypes calls into the same SDL2 library, on pygame's own renderer.
+    The window is a pygame._sdl2 Window rather than pygame.display (a window
+    with a display surface cannot get a renderer); pygame.event still works.
+    The renderer scales to the window size.
+    """
+
+    def __init__(self, pix_fmt, buffers=3):
+        from pygame._sdl2.video import Renderer, Window
+
+        sdl = self.sdl = load_sdl2()
+        sdl.SDL_GetWindowFromID.restype = ctypes.c_void_p
+        sdl.SDL_GetWindowFromID.argtypes = [ctypes.c_uint32]
+        sdl.SDL_GetRenderer.restype = ctypes.c_void_p
+        sdl.SDL_GetRenderer.argtypes = [ctypes.c_void_p]
+        sdl.SDL_CreateTexture.restype = ctypes.c_void_p
+        sdl.SDL_CreateTexture.argtypes = [ctypes.c_void_p, ctypes.c_uint32,
+                                          ctypes.c_int, ctypes.c_int, ctypes.c_int]
+        sdl.SDL_UpdateTexture.argtypes = [ctypes.c_void_p, ctypes.c_void_p,
+                                          ctypes.c_void_p, ctypes.c_int]
+        sdl.SDL_RenderCopy.argtypes = [ctypes.c_void_p, ctypes.c_void_p,
+                                       ctypes.c_void_p, ctypes.c_void_p]
+        sdl.SDL_SetHint.argtypes = [ctypes.c_char_p, ctypes.c_char_p]
+        sdl.SDL_GetRendererInfo.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        sdl.SDL_GetError.restype = ctypes.c_char_p
+
+        self.pix_fmt = pix_fmt
+        self.window = Window(WINDOW_TITLE, (STREAM_WIDTH, STREAM_HEIGHT), resizable=True)
+        # No vsync: present() must not wait for a refresh with input pending
+        self.renderer = Renderer(self.window, vsync=False)
+        sdl.SDL_SetHint(b"SDL_RENDER_SCALE_QUALITY", b"linear")
+        self.sdl_renderer = sdl.SDL_GetRenderer(sdl.SDL_GetWindowFromID(self.window.id))
+        self.texture = sdl.SDL_CreateTexture(
+            self.sdl_renderer, SDL_PIXELFORMATS[pix_fmt], SDL_TEXTUREACCESS_STREAMING,
+            STREAM_WIDTH, STREAM_HEIGHT)
+        if not self.sdl_renderer or not self.texture:
+            error = sdl.SDL_GetError().decode(errors="replace")
+            self.window.destroy()
+            raise RuntimeError(error)
+
+        # Y plane, then U and V (yuv420p) or interleaved UV (nv12): SDL takes
+        # the planes contiguous with a pitch of the Y plane's width
+        self.set_buffers([bytearray(STREAM_WIDTH * STREAM_HEIGHT * 3 // 2)
+                          for _ in range(buffers)])
+        self.overlay = None          # last overlay surface and its texture
+        self.overlay_texture = None
+
+        # A software renderer converts YUV on the CPU; say which one we got
+        info = SDLRendererInfo()
+        sdl.SDL_GetRendererInfo(self.sdl_renderer, ctypes.byref(info))
+        self.renderer_name = (info.name or b"?").decode(errors="replace")
+
+    def set_buffers(self, bufs):
+        """Present from bufs (writable, one frame each) from now on."""
+        self.bufs = bufs
+        self.views = [memoryview(buf) for buf in bufs]
+        self.pixels = [ctypes.addressof((ctypes.c_char * len(buf)).from_buffer(buf))
+                       for buf in bufs]
+
+    def size(self):
+        return self.window.size
+
+    def present(self, index, overlay=None):
+        """Upload and show the frame in buffer index; returns the bytes copied.
+
+        The texture keeps its own copy, so the buffer may be refilled as soon
+        as this returns.
+        """
+        sdl = self.sdl
+        if sdl.SDL_UpdateTexture(self.texture, None, self.pixels[index], STREAM_WIDTH):
+            raise RuntimeError(sdl.SDL_GetError().decode(errors="replace"))
+        self.show(overlay)
+        return len(self.bufs[index])
+
+    def show(self, overlay=None):
+        """Redraw the last frame, with overlay on top."""
+        from pygame._sdl2.video import Texture
+        sdl = self.sdl
+        if sdl.SDL_RenderCopy(self.sdl_renderer, self.texture, None, None):
+            raise RuntimeError(sdl.SDL_GetError().decode(errors="replace"))
+        if overlay is not None:
+            if overlay is not self.overlay:
+                self.overlay = overlay
+                self.overlay_texture = Texture.from_surface(self.renderer, overlay)
+            self.overlay_texture.draw(dstrect=OVERLAY_POS + overlay.get_size())
+        self.renderer.present()
+
+
+def make_presenter(mode, buffers=3):
+    """Open the window for --present mode, falling back to the RGB surface path."""
+    if mode != "rgb":
+        try:
+            presenter = TexturePresenter(mode, buffers)
+            log(f"Presenting {mode} through an SDL2 YUV texture "
+                f"({presenter.renderer_name} renderer)")
+            return presenter
+        except Exception as e:
+            log(f"YUV texture presentation unavailable ({e}); using rgb")
+    return SurfacePresenter(buffers)
+
+
+class LatestFrame:
+    """Latest-frame-wins handoff of frame buffers from a reader to the display.
+
+    The reader fills a free buffer and publishes it; a published frame the
+    display has not taken yet goes back to the free list and counts as
+    skipped. With three buffers (one being filled, one published, one on
+    screen) the reader never waits for the display, so a slow present drops
+    frames instead of backing up the decoder pipe.
+    """
+
+    def __init__(self, count):
+        if count < 3:
+            raise ValueError("latest-frame-wins needs at least 3 buffers")
+        self.lock = threading.Lock()
+        self.free = list(range(count))
+        self.latest = None
+        self.skipped = 0  # frames replaced before the display took them
+
+    def writable(self):
+        """A buffer index for the reader to fill."""
+        with self.lock:
+            return self.free.pop()
+
+    def publish(self, index):
+        """Make index the newest frame; returns False if it replaced one."""
+        with self.lock:
+            replaced = self.latest
+            self.latest = index
+            if replaced is None:
+                return True
+            self.free.append(replaced)
+            self.skipped += 1
+            return False
+
+    def take(self):
+        """The newest frame's buffer index, or None; release() it when shown."""
+        with self.lock:
+            index, self.latest = self.latest, None
+            return index
+
+    def release(self, index):
+        with self.lock:
+            self.free.append(index)
+
+
+class DebugOverlay:
+    """A few lines of stats drawn over the video (--overlay, toggled with Pause)."""
+
+    INTERVAL = 0.25  # seconds between re-renders; each one means a new texture
+
+    def __init__(self, visible):
+        import pygame
+        self.visible = visible
+        self.font = pygame.font.Font(None, 20)
+        self.surface = None
+        self.updated = 0.0
 
-            elif event.type == pygame.KEYUP:
-                evdev_code = keymap.get(event.key, 0)
-                if evdev_code:
-                    pkt = make_event(EVT_KEY_UP, evdev_code, 0, 0, 0)
-                    udp_sock.sendto(pkt, sender_addr)
+    def due(self, now):
+        return self.visible and now - self.updated >= self.INTERVAL
 
-        time.sleep(0.002)
+    def update(self, lines, now):
+        import pygame
+        rendered = [self.font.render(line, True, (255, 255, 255)) for line in lines]
+        width = max(r.get_width() for r in rendered) + 8
+        height = sum(r.get_height() for r in rendered) + 8
+        # Opaque, so redrawing it over itself on a stalled stream stays clean
+        surface = pygame.Surface((width, height))
+        y = 4
+        for r in rendered:
+            surface.blit(r, (4, y))
+            y += r.get_height()
+        self.surface = surface
+        self.updated = now
+
+    def current(self):
+        """Surface to draw, or None while hidden."""
+        return self.surface if self.visible else None
+
+
+# ---------------------------------------------------------------------------
+# In-process decoding (--decoder pyav)
+# ---------------------------------------------------------------------------
+class StreamReader:
+    """The sender's TCP stream as a file: tees to the save file, logs throughput.
+
+    Feeds ffmpeg's stdin, or is handed to PyAV as the input file. Bytes given
+    as first are returned before anything is received, without being saved
+    or counted again. read() returns b"" at the end of the stream.
+    """
+
+    def __init__(self, conn, save_file, running_event, first=b""):
+        self.conn = conn
+        self.save_file = save_file
+        self.running_event = running_event
+        self.pending = first
+        self.total_bytes = 0
+        self.start_time = self.last_report = time.monotonic()
+
+    def read(self, size=-1):
+        if size is None or size <= 0:
+            size = 65536
+        if self.pending:
+            data, self.pending = self.pending[:size], self.pending[size:]
+            return data
+        if not self.running_event.is_set():
+            return b""
+        try:
+            data = self.conn.recv(size)
+        except OSError:
+            if self.running_event.is_set():
+                log("Connection lost.")
+            return b""
+        if not data:
+            log("Sender disconnected.")
+            self.running_event.clear()
+            return b""
+        self.total_bytes += len(data)
 
+        if self.save_file is not None:
+            self.save_file.write(data)
 
-def receive_and_decode(conn, save_file, ffmpeg_proc, screen, running_event,
-                       udp_sock, sender_addr, keymap):
-    """Main loop: receive TCP stream, optionally save, feed ffmpeg, render frames."""
+        now = time.monotonic()
+        if now - self.last_report >= 5.0:
+            elapsed = now - self.start_time
+            mb = self.total_bytes / (1024 * 1024)
+            mbps = (self.total_bytes * 8) / (elapsed * 1_000_000)
+            log(f"  {mb:.1f} MB received | {mbps:.2f} Mbps | {elapsed:.0f}s")
+            self.last_report = now
+        return data
+
+
+class PyAVDecoder:
+    """Decode the stream inside the receiver with PyAV (libavformat/libavcodec).
+
+    Replaces the ffmpeg subprocess and both of its pipes: the demuxer reads
+    the TCP stream directly, and each decoded frame's planes are copied, as
+    numpy views, straight into a presenter buffer. Short probing and
+    low-delay decoding as in build_ffmpeg_decode_cmd(); threads are slice
+    threads, which unlike frame threads do not hold frames back. Decode and
+    copy time are accumulated for report().
+    """
+
+    def __init__(self, pix_fmt, threads=0):
+        # Imported here so main() can fall back to ffmpeg when they are missing
+        import av
+        import numpy
+        self.av = av
+        self.numpy = numpy
+
+        self.pix_fmt = pix_fmt
+        self.threads = threads
+        self.decoded = 0
+        self.decode_s = 0.0   # packet.decode(), demuxing and network waits excluded
+        self.copy_s = 0.0     # pixel format conversion (rgb24) and plane copies
+
+    def frames(self, stream, running_event):
+        """Yield decoded av.VideoFrames from a file-like stream until it ends."""
+        av = self.av
+
+        # No fflags=nobuffer: on a stream that cannot seek back it discards
+        # the packets read while probing, the first keyframe among them
+        container = av.open(stream, options={
+            "analyzeduration": "100000", "probesize": "32768"})
+        try:
+            video = container.streams.video[0]
+            ctx = video.codec_context
+            ctx.flags |= av.codec.context.Flags.low_delay
+            ctx.thread_type = "SLICE"
+            ctx.thread_count = self.threads
+            for packet in container.demux(video):
+                if not running_event.is_set():
+                    return
+                t0 = time.perf_counter()
+                decoded = packet.decode()
+                self.decode_s += time.perf_counter() - t0
+                for frame in decoded:
+                    self.decoded += 1
+                    yield frame
+        finally:
+            container.close()
+
+    def plane_views(self, buf):
+        """Per-plane (rows, row bytes) numpy views of a presenter buffer."""
+        numpy = self.numpy
+
+        w, h = STREAM_WIDTH, STREAM_HEIGHT
+        shapes = {
+            "rgb24": [(h, w * 3)],
+            "yuv420p": [(h, w), (h // 2, w // 2), (h // 2, w // 2)],
+            "nv12": [(h, w), (h // 2, w)],
+        }[self.pix_fmt]
+        flat = numpy.frombuffer(buf, numpy.uint8)
+        views = []
+        offset = 0
+        for rows, cols in shapes:
+            views.append(flat[offset:offset + rows * cols].reshape(rows, cols))
+            offset += rows * cols
+        return views
+
+    def copy_frame(self, frame, dest):
+        """Copy frame into plane_views(), converting and scaling if needed."""
+        numpy = self.numpy
+
+        t0 = time.perf_counter()
+        if (frame.format.name != self.pix_fmt or frame.width != STREAM_WIDTH
+                or frame.height != STREAM_HEIGHT):
+            frame = frame.reformat(STREAM_WIDTH, STREAM_HEIGHT, self.pix_fmt)
+        for plane, view in zip(frame.planes, dest):
+            rows, cols = view.shape
+            src = numpy.frombuffer(plane, numpy.uint8).reshape(-1, plane.line_size)
+            view[:] = src[:rows, :cols]  # drop the decoder's row padding
+        self.copy_s += time.perf_counter() - t0
+
+    def report(self):
+        n = max(1, self.decoded)
+        return (f"pyav: {self.decoded} frames | decode {self.decode_s * 1000 / n:.2f} "
+                f"ms/frame | copy {self.copy_s * 1000 / n:.2f} ms/frame")
+
+
+# ---------------------------------------------------------------------------
+# Decode process (--decode-process)
+# ---------------------------------------------------------------------------
+# TCP ingest and decoding run in a worker process, so they do not share the
+# viewer's GIL with input handling and presentation. Frames are handed over
+# in a shared memory ring the viewer presents from directly:
+# | latest(u64) | bytes_in(u64) | reading(u64) | pending(u64) | pad | slots
+RING_SLOTS = 3    # one being written, the newest frame, one being presented
+RING_OFFSET = 64  # slots start on a cache line
+RING_U64 = struct.Struct("<Q")
+
+
+class FrameRing:
+    """Decoded frames in shared memory, written by the decode process.
+
+    Header words: latest is (frames written << 8 | slot of the newest one),
+    reading is the slot the viewer is presenting from, plus one (0 = none),
+    pending is 1 while a wakeup for the newest frame is unanswered, and
+    bytes_in counts the stream bytes the decode process has received.
+
+    The slots change hands like LatestFrame's buffers, under lock, a
+    multiprocessing.Lock shared by both processes: the writer fills a slot
+    that is neither the newest nor the one being presented, and the viewer
+    only claims the newest. The lock's semaphore orders the frame data
+    before the header words that hand it over, so the writer never waits
+    for the viewer and a presented frame is never written to.
+    """
+
+    def __init__(self, frame_size, lock, name=None):
+        from multiprocessing import shared_memory
+
+        self.lock = lock
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=self.owner, size=RING_OFFSET + RING_SLOTS * frame_size)
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        self.slots = [self.buf[RING_OFFSET + i * frame_size:RING_OFFSET + (i + 1) * frame_size]
+                      for i in range(RING_SLOTS)]
+        self.slot = RING_SLOTS - 1  # writer: slot of the last frame written
+
+    def _get(self, offset):
+        return RING_U64.unpack_from(self.buf, offset)[0]
+
+    def _set(self, offset, value):
+        RING_U64.pack_into(self.buf, offset, value)
+
+    def begin(self):
+        """Writer: the slot to write the next frame into."""
+        with self.lock:
+            latest = self._get(0)
+            busy = (latest & 0xFF if latest >> 8 else None, self._get(16) - 1)
+        slot = (self.slot + 1) % RING_SLOTS
+        while slot in busy:
+            slot = (slot + 1) % RING_SLOTS
+        self.slot = slot
+        return slot
+
+    def commit(self, n):
+        """Writer: publish frame n from the slot begin() gave out.
+
+        Returns True if the viewer needs a wakeup: it has taken every
+        earlier frame, or was already woken for the one this replaces.
+        """
+        with self.lock:
+            self._set(0, (n + 1) << 8 | self.slot)
+            wake = not self._get(24)
+            self._set(24, 1)
+        return wake
+
+    def take(self, seen):
+        """Viewer: claim the newest frame if more than seen were written.
+
+        Returns (frames written, slot), slot None if there is no newer frame.
+        """
+        with self.lock:
+            word = self._get(0)
+            if word >> 8 <= seen:
+                return seen, None
+            self._set(16, (word & 0xFF) + 1)
+            self._set(24, 0)
+        return word >> 8, word & 0xFF
+
+    def release(self):
+        """Viewer: done presenting the claimed slot."""
+        with self.lock:
+            self._set(16, 0)
+
+    def bytes_in(self):
+        return self._get(8)
+
+    def set_bytes_in(self, total):
+        self._set(8, total)
+
+    def close(self):
+        """Detach; the creating side also removes the segment."""
+        for view in self.slots:
+            view.release()
+        self.buf.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingFrames:
+    """The viewer's side of a FrameRing, with LatestFrame's take()/release().
+
+    take() claims the slot of the newest frame, counting the ones written
+    since the last take() and never shown as skipped; release() gives it back.
+    """
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.seen = 0      # frames written when we last took one
+        self.skipped = 0
+
+    def take(self):
+        latest, slot = self.ring.take(self.seen)
+        if slot is not None:
+            self.skipped += latest - self.seen - 1
+            self.seen = latest
+        return slot
+
+    def release(self, slot):
+        self.ring.release()
+
+
+def decode_worker(conn, save_path, first, ring_name, ring_lock, frame_size, pix_fmt,
+                  decoder_name, decode_threads, notify):
+    """Decode process: read the stream from conn and decode it into the ring.
+
+    Sends an empty message on notify when a frame is ready and the viewer
+    has no wakeup pending, and exits when the stream or the decoder ends,
+    which closes notify for the viewer.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the viewer handles Ctrl+C
+    ring = FrameRing(frame_size, ring_lock, ring_name)
+    running = threading.Event()
+    running.set()
+    save_file = open(save_path, "ab") if save_path else None
+    stream = StreamReader(conn, save_file, running, first)
+    ffmpeg_proc = None
+    dest = None
+    n = 0
+    try:
+        if decoder_name == "pyav":
+            decoder = PyAVDecoder(pix_fmt, decode_threads)
+            dest = [decoder.plane_views(slot) for slot in ring.slots]
+            report = time.monotonic()
+            for frame in decoder.frames(stream, running):
+                decoder.copy_frame(frame, dest[ring.begin()])
+                if ring.commit(n):
+                    notify.send_bytes(b"")
+                n += 1
+                now = time.monotonic()
+                if now - report >= 5.0:
+                    ring.set_bytes_in(stream.total_bytes)
+                    log(f"  {decoder.report()}")
+                    report = now
+        else:
+            ffmpeg_proc = subprocess.Popen(build_ffmpeg_decode_cmd(pix_fmt),
+                                           stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                           stderr=subprocess.DEVNULL)
+
+            def feed():
+                try:
+                    while True:
+                        data = stream.read(65536)
+                        if not data:
+                            break
+                        ffmpeg_proc.stdin.write(data)
+                        ring.set_bytes_in(stream.total_bytes)
+                    ffmpeg_proc.stdin.close()  # let ffmpeg flush its last frames
+                except (BrokenPipeError, ValueError):
+                    log("ffmpeg decode pipe broken.")
+
+            threading.Thread(target=feed, daemon=True).start()
+            stdout = ffmpeg_proc.stdout
+            while True:
+                view = ring.slots[ring.begin()]
+                offset = 0
+                while offset < frame_size:
+                    got = stdout.readinto(view[offset:])
+                    if not got:
+                        break
+                    offset += got
+                if offset < frame_size:
+                    break
+                if ring.commit(n):
+                    notify.send_bytes(b"")
+                n += 1
+    except (BrokenPipeError, EOFError):
+        pass  # viewer went away
+    except Exception as e:  # av.FFmpegError and friends, after a bad stream
+        log(f"Decode error: {e}")
+    finally:
+        running.clear()
+        ring.set_bytes_in(stream.total_bytes)
+        log(f"Decode process done: {n} frames.")
+        if ffmpeg_proc is not None:
+            ffmpeg_proc.kill()
+            ffmpeg_proc.wait()
+        if save_file is not None:
+            save_file.close()
+        del dest
+        ring.close()
+
+
+class DisplayStats:
+    """Totals of one receive_and_decode() session, for benchmarks."""
+
+    def __init__(self):
+        self.shown = 0
+        self.skipped = 0
+        self.dispatch_ms = []  # most recent input dispatch latencies
+
+
+# ---------------------------------------------------------------------------
+# Receiving
+# ---------------------------------------------------------------------------
+def receive_and_decode(conn, save_file, ffmpeg_proc, presenter, running_event,
+                       input_link, keymap, overlay_visible=False, decoder=None,
+                       first=b"", decode_process=False, stats=None):
+    """Main loop: receive TCP stream, optionally save, decode, render frames.
+
+    Frames come from ffmpeg_proc, or with decoder (a PyAVDecoder) are decoded
+    in-process from the TCP stream, starting with first (bytes main() has
+    already received and saved). With decode_process the stream is read and
+    decoded (by ffmpeg, or PyAV with decoder) in a decode_worker() process.
+    Session totals go to stats, a DisplayStats, if given.
+    """
     import pygame
 
-    start_time = time.monotonic()
-    total_bytes = 0
-    last_report = start_time
+    stream = StreamReader(conn, save_file, running_event, first)
 
     # Start input sender on the main thread (pygame events must be on main thread)
     # So we read frames in a background thread instead
-    frame_buf = bytearray(FRAME_SIZE)
-    frame_offset = 0
-
     def tcp_reader():
         """Read TCP data, write to save file and ffmpeg stdin."""
-        nonlocal total_bytes, last_report
-        try:
-            while running_event.is_set():
-                data = conn.recv(65536)
-                if not data:
-                    log("Sender disconnected.")
+        while True:
+            data = stream.read(65536)
+            if not data:
+                running_event.clear()
+                return
+            if ffmpeg_proc is not None and ffmpeg_proc.stdin:
+                try:
+                    ffmpeg_proc.stdin.write(data)
+                except BrokenPipeError:
+                    log("ffmpeg decode pipe broken.")
                     running_event.clear()
                     return
-                total_bytes += len(data)
-
-                if save_file is not None:
-                    save_file.write(data)
 
-                if ffmpeg_proc is not None and ffmpeg_proc.stdin:
-                    try:
-                        ffmpeg_proc.stdin.write(data)
-                    except BrokenPipeError:
-                        log("ffmpeg decode pipe broken.")
-                        running_event.clear()
-                        return
+    # Decoded frames are read on their own thread, straight into one of the
+    # presenter's buffers, and handed over latest-frame-wins: the display
+    # shows the newest complete frame and older unshown ones are skipped, so
+    # ffmpeg's output is always drained at decode speed. The main thread only
+    # waits on pygame events, and a new frame is one of them, so input is
+    # handled as soon as it arrives instead of after the next pipe read.
+    frame_event = pygame.event.custom_type()
+    frames_in = LatestFrame(len(presenter.views))
+    frame_reads = 0     # readinto() calls, several per frame when the pipe runs dry
+
+    def frame_reader():
+        nonlocal frame_reads
+        stdout = ffmpeg_proc.stdout
+        while running_event.is_set():
+            index = frames_in.writable()
+            view = presenter.views[index]
+            offset = 0
+            while offset < len(view):
+                try:
+                    n = stdout.readinto(view[offset:])
+                except (OSError, ValueError):
+                    n = 0
+                frame_reads += 1
+                if not n:
+                    log("Decoder output ended.")
+                    return
+                offset += n
+            if frames_in.publish(index):
+                pygame.event.post(pygame.event.Event(frame_event))
 
+    def frame_decoder():
+        dest = [decoder.plane_views(buf) for buf in presenter.bufs]
+        report = time.monotonic()
+        try:
+            for frame in decoder.frames(stream, running_event):
+                index = frames_in.writable()
+                decoder.copy_frame(frame, dest[index])
+                if frames_in.publish(index):
+                    pygame.event.post(pygame.event.Event(frame_event))
                 now = time.monotonic()
-                if now - last_report >= 5.0:
-                    elapsed = now - start_time
-                    mb = total_bytes / (1024 * 1024)
-                    mbps = (total_bytes * 8) / (elapsed * 1_000_000)
-                    log(f"  {mb:.1f} MB received | {mbps:.2f} Mbps | {elapsed:.0f}s")
-                    last_report = now
-        except (ConnectionResetError, BrokenPipeError):
-            log("Connection lost.")
+                if now - report >= 5.0:
+                    log(f"  {decoder.report()}")
+                    report = now
+        except Exception as e:  # av.FFmpegError and friends, after a bad stream
+            log(f"Decode error: {e}")
+        log("Decoder output ended.")
+        running_event.clear()
+
+    worker = None
+    if decode_process:
+        if save_file is not None:
+            save_file.flush()  # the decode process appends to it
+        ctx = multiprocessing.get_context("spawn")  # no fork of a process running SDL
+        ring = FrameRing(len(presenter.bufs[0]), ctx.Lock())
+        notify_in, notify_out = ctx.Pipe(duplex=False)
+        worker = ctx.Process(
+            target=decode_worker, daemon=True,
+            args=(conn, save_file.name if save_file else None, first, ring.name,
+                  ring.lock, len(presenter.bufs[0]), presenter.pix_fmt,
+                  "pyav" if decoder is not None else "ffmpeg",
+                  decoder.threads if decoder is not None else 0, notify_out))
+        worker.start()
+        notify_out.close()
+        own_bufs = presenter.bufs
+        presenter.set_buffers(ring.slots)
+        frames_in = RingFrames(ring)
+
+        def ring_watcher():
+            """Turn the decode process's wakeups into pygame events."""
+            while True:
+                try:
+                    notify_in.recv_bytes()
+                except (EOFError, OSError):
+                    break
+                pygame.event.post(pygame.event.Event(frame_event))
             running_event.clear()
 
-    reader_thread = threading.Thread(target=tcp_reader, daemon=True)
-    reader_thread.start()
-
-    # Main thread: read decoded frames from ffmpeg stdout + handle pygame events
-    frame_offset = 0
-    touching = False  # track finger-on-screen state (left mouse button)
+        reader_thread = threading.Thread(target=ring_watcher, daemon=True)
+        reader_thread.start()
+    elif decoder is not None:
+        reader_thread = threading.Thread(target=frame_decoder, daemon=True)
+        reader_thread.start()
+    else:
+        reader_thread = threading.Thread(target=tcp_reader, daemon=True)
+        reader_thread.start()
+        if ffmpeg_proc is not None and ffmpeg_proc.stdout is not None:
+            threading.Thread(target=frame_reader, daemon=True).start()
+
+    dispatcher = InputDispatcher(input_link, keymap, presenter) if input_link else None
+    overlay = DebugOverlay(overlay_visible)
+    frames = 0
+    frame_copied = 0    # bytes copied in user space on the way to the window
+    skipped = 0
+    present_ms = collections.deque(maxlen=64)
+    shown = collections.deque(maxlen=64)  # present times, for the overlay's fps
+    frame_report = time.monotonic()
+    last_empty = time.perf_counter()  # when the event queue was last drained
     while running_event.is_set():
-        # Handle pygame events (must be on main thread)
-        for event in pygame.event.get():
+        # Sleep until an input event, a decoded frame, a redundancy repeat or
+        # a held-back wheel pinch
+        timeout_ms = 100
+        if input_link is not None and input_link.repeat_due:
+            due = input_link.repeat_due[0] - time.monotonic()
+            timeout_ms = max(1, min(timeout_ms, int(due * 1000) + 1))
+        if dispatcher is not None and dispatcher.wheel_due() is not None:
+            due = dispatcher.wheel_due() - time.monotonic()
+            timeout_ms = max(1, min(timeout_ms, int(due * 1000) + 1))
+        waited = time.perf_counter()
+        first = pygame.event.wait(timeout_ms)
+        woke = time.perf_counter()
+        events = pygame.event.get()
+        if first.type != pygame.NOEVENT:
+            events.insert(0, first)
+        # Events that woke us arrived just now; the rest queued up while the
+        # previous iteration ran, at the earliest when it drained the queue
+        since = woke if woke - waited > 0.001 else last_empty
+        last_empty = time.perf_counter()
+
+        for event in events:
             if event.type == pygame.QUIT:
                 running_event.clear()
                 break
-
-            if event.type == pygame.VIDEORESIZE:
-                continue
-
-            if sender_addr is None:
-                continue
-
-            win_size = screen.get_size()
-
-            if event.type == pygame.MOUSEMOTION:
-                # Only send drag events while finger is down (left button held)
-                if touching:
-                    sx, sy = map_mouse_coords(event.pos, win_size)
-                    pkt = make_event(EVT_MOUSE_MOVE, sx, sy, 0, 0)
-                    udp_sock.sendto(pkt, sender_addr)
-
-            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                touching = True
-                sx, sy = map_mouse_coords(event.pos, win_size)
-                pkt = make_event(EVT_MOUSE_DOWN, sx, sy, 0, 0)
-                udp_sock.sendto(pkt, sender_addr)
-
-            elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
-                touching = False
-                sx, sy = map_mouse_coords(event.pos, win_size)
-                pkt = make_event(EVT_MOUSE_UP, sx, sy, 0, 0)
-                udp_sock.sendto(pkt, sender_addr)
-
-            elif event.type == pygame.KEYDOWN:
-                evdev_code = keymap.get(event.key, 0)
-                if evdev_code:
-                    pkt = make_event(EVT_KEY_DOWN, evdev_code, 0, 0, 0)
-                    udp_sock.sendto(pkt, sender_addr)
-
-            elif event.type == pygame.KEYUP:
-                evdev_code = keymap.get(event.key, 0)
-                if evdev_code:
-                    pkt = make_event(EVT_KEY_UP, evdev_code, 0, 0, 0)
-                    udp_sock.sendto(pkt, sender_addr)
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_PAUSE:
+                overlay.visible = not overlay.visible
+                overlay.updated = 0.0
+            elif dispatcher is not None:
+                dispatcher.handle(event, since)
 
         if not running_event.is_set():
             break
 
-        # Try to read a frame from ffmpeg stdout (non-blocking-ish via small reads)
-        if ffmpeg_proc is None or ffmpeg_proc.stdout is None:
-            time.sleep(0.01)
-            continue
+        if input_link is not None:
+            input_link.tick()
+        if dispatcher is not None:
+            dispatcher.tick()
 
-        try:
-            needed = FRAME_SIZE - frame_offset
-            chunk = ffmpeg_proc.stdout.read(needed)
-            if not chunk:
-                # ffmpeg exited or EOF
-                time.sleep(0.01)
-                continue
-            frame_buf[frame_offset:frame_offset + len(chunk)] = chunk
-            frame_offset += len(chunk)
-        except Exception:
-            time.sleep(0.01)
+        now = time.monotonic()
+        if overlay.due(now):
+            p50, p99, worst = dispatcher.summary() if dispatcher else (0.0, 0.0, 0.0)
+            span = shown[-1] - shown[0] if shown else 0.0
+            fps = (len(shown) - 1) / span if span > 0 else 0.0
+            pms = sorted(present_ms)
+            overlay.update([
+                f"input  p50 {p50:.2f}  p99 {p99:.2f}  max {worst:.2f} ms",
+                f"video  {fps:.1f} fps  present "
+                f"{pms[len(pms) // 2] if pms else 0:.1f} ms  "
+                f"skipped {frames_in.skipped}",
+            ], now)
+            if not shown or now - shown[-1] > overlay.INTERVAL:
+                presenter.show(overlay.current())  # stalled stream: refresh the stats
+
+        index = frames_in.take()
+        if index is None:
             continue
-
-        if frame_offset >= FRAME_SIZE:
-            # Full frame ready — render it
-            try:
-                surface = pygame.image.frombuffer(bytes(frame_buf), (STREAM_WIDTH, STREAM_HEIGHT), "RGB")
-                win_size = screen.get_size()
-                if win_size != (STREAM_WIDTH, STREAM_HEIGHT):
-                    surface = pygame.transform.scale(surface, win_size)
-                screen.blit(surface, (0, 0))
-                pygame.display.flip()
-            except Exception as e:
-                log(f"Render error: {e}")
-            frame_offset = 0
+        t0 = time.perf_counter()
+        try:
+            frame_copied += presenter.present(index, overlay.current())
+        except Exception as e:
+            log(f"Render error: {e}")
+        present_ms.append((time.perf_counter() - t0) * 1000)
+        frames_in.release(index)
+        frames += 1
+        shown.append(time.monotonic())
+
+        if stats is not None:
+            stats.shown += 1
+
+        if now - frame_report >= 5.0:
+            p50, p99, worst = dispatcher.summary() if dispatcher else (0.0, 0.0, 0.0)
+            reads = ""
+            if decoder is None and worker is None:
+                reads = f"{frame_reads / frames:.1f} reads/frame | "
+            log(f"  {frames / (now - frame_report):.1f} fps | {reads}"
+                f"{frame_copied // frames} bytes copied/frame | "
+                f"{frames_in.skipped - skipped} skipped | "
+                f"input dispatch p50 {p50:.2f} p99 {p99:.2f} max {worst:.2f} ms")
+            frames = frame_reads = frame_copied = 0
+            skipped = frames_in.skipped
+            frame_report = now
+
+    if stats is not None:
+        stats.skipped = frames_in.skipped
+        stats.dispatch_ms = list(dispatcher.latencies) if dispatcher else []
+
+    if worker is not None:
+        try:
+            conn.shutdown(socket.SHUT_RDWR)  # ends the worker's recv()
+        except OSError:
+            pass
+        worker.join(timeout=3)
+        if worker.is_alive():
+            worker.terminate()
+            worker.join()
+        reader_thread.join(timeout=2)
+        notify_in.close()
+        presenter.set_buffers(own_bufs)
+        total_bytes = ring.bytes_in()
+        ring.close()
+        return total_bytes
 
     reader_thread.join(timeout=2)
-    return total_bytes
+    return stream.total_bytes
 
 
 def receive_stream_no_play(conn, save_file, start_time):
@@ -403,6 +1296,37 @@ def main():
                     help="Sender IP for input forwarding (UDP port 9001)")
     ap.add_argument("--input-port", type=int, default=9001,
                     help="UDP port for input forwarding (default: 9001)")
+    ap.add_argument("--input-protocol", type=int, choices=[1, 2], default=2,
+                    help="Input protocol: 2 = sequenced packets, 1 = legacy "
+                         "bare events (default: 2)")
+    ap.add_argument("--input-redundancy", type=int, default=0, metavar="N",
+                    help="Repeat the last N down/up/key events in every input "
+                         "packet, plus N follow-up packets (default: 0 = off)")
+    ap.add_argument("--input-coords", choices=["normalized", "pixel"],
+                    default="normalized",
+                    help="Touch coordinates for protocol 2: normalized 16-bit, "
+                         "independent of the sender's screen size, or "
+                         f"{STREAM_WIDTH}x{STREAM_HEIGHT} pixels "
+                         "(default: normalized)")
+    ap.add_argument("--present", choices=PRESENT_MODES, default="rgb",
+                    help="Frame path: rgb = RGB24 from ffmpeg, scaled by pygame; "
+                         "yuv420p/nv12 = 4:2:0 planes into an SDL2 texture, "
+                         "scaled by the renderer, falling back to rgb "
+                         "(default: rgb)")
+    ap.add_argument("--decoder", choices=["ffmpeg", "pyav"], default="ffmpeg",
+                    help="ffmpeg = decode in an ffmpeg subprocess over pipes; "
+                         "pyav = decode in-process with PyAV, falling back to "
+                         "ffmpeg if it is not installed (default: ffmpeg)")
+    ap.add_argument("--decode-threads", type=int, default=0, metavar="N",
+                    help="PyAV slice decoding threads, 0 = one per CPU "
+                         "(default: 0)")
+    ap.add_argument("--decode-process", action="store_true",
+                    help="Receive and decode in a separate process that hands "
+                         "frames over in shared memory, leaving this one to "
+                         "input and presentation (default: off)")
+    ap.add_argument("--overlay", action="store_true",
+                    help="Show input dispatch latency and frame stats over the "
+                         "video; Pause toggles it (default: off)")
     args = ap.parse_args()
 
     log("=== Game Stream Receiver ===")
@@ -417,20 +1341,32 @@ def main():
 
     # Set up UDP socket for input events
     udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sender_addr = (args.sender_host, args.input_port) if args.sender_host else None
+    input_link = None
+    if args.sender_host:
+        input_link = InputLink(udp_sock, (args.sender_host, args.input_port),
+                               args.input_protocol,
+                               max(0, min(16, args.input_redundancy)),
+                               args.input_coords == "normalized")
+        input_link.start_clock_responder()
 
     # Init pygame if playing
-    screen = None
+    presenter = None
     keymap = {}
     if args.play:
         import pygame
         pygame.init()
-        screen = pygame.display.set_mode(
-            (STREAM_WIDTH, STREAM_HEIGHT), pygame.RESIZABLE
-        )
-        pygame.display.set_caption("Waydroid Stream")
+        presenter = make_presenter(args.present)
         keymap = build_keymap()
 
+    decoder = None
+    if args.play and args.decoder == "pyav":
+        try:
+            decoder = PyAVDecoder(presenter.pix_fmt, max(0, args.decode_threads))
+            log(f"Decoding in-process with PyAV ({presenter.pix_fmt})")
+        except ImportError as e:
+            log(f"PyAV not available ({e}), decoding with ffmpeg "
+                "(pip install av)")
+
     srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     srv.bind((args.host, args.port))
@@ -481,33 +1417,39 @@ def main():
             log("Ready for next connection.\n")
             continue
 
-        # Play mode: start ffmpeg decode subprocess
-        cmd = build_ffmpeg_decode_cmd()
-        log(f"Starting decoder: {' '.join(cmd)}")
-        ffmpeg_proc = subprocess.Popen(
-            cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL,
-        )
-
-        # Write the first chunk
         total_bytes = len(first)
         if save_file is not None:
             save_file.write(first)
-        if ffmpeg_proc.stdin:
-            try:
-                ffmpeg_proc.stdin.write(first)
-            except BrokenPipeError:
-                ffmpeg_proc = None
+
+        # Play mode: start ffmpeg decode subprocess, unless PyAV decodes in-process
+        # or the decode process does either
+        ffmpeg_proc = None
+        if decoder is None and not args.decode_process:
+            cmd = build_ffmpeg_decode_cmd(presenter.pix_fmt)
+            log(f"Starting decoder: {' '.join(cmd)}")
+            ffmpeg_proc = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+
+            # Write the first chunk
+            if ffmpeg_proc.stdin:
+                try:
+                    ffmpeg_proc.stdin.write(first)
+                except BrokenPipeError:
+                    ffmpeg_proc = None
+            first = b""
 
         running = threading.Event()
         running.set()
 
         try:
             total_bytes += receive_and_decode(
-                conn, save_file, ffmpeg_proc, screen, running,
-                udp_sock, sender_addr, keymap,
+                conn, save_file, ffmpeg_proc, presenter, running,
+                input_link, keymap, args.overlay, decoder, first,
+                args.decode_process,
             )
         except (ConnectionResetError, BrokenPipeError):
             log("Connection lost.")
@@ -26,6 +26,7 @@ INPUT_PORT="${INPUT_PORT:-9001}"
 
 WESTON_PID=""
 INPUT_SERVER_PID=""
+INPUT_SERVER_SCRIPT=""
 WESTON_SOCKET="waydroid-stream"
 
 log() { echo "[sender] $(date +%T) $*" >&2; }
@@ -130,8 +131,16 @@ start_input_server() {
         return 0
     fi
 
+    # The touch device must match the captured screen. Headless knows it up
+    # front; portal capture announces it once the stream starts.
+    local size_args=()
+    if [ "$CAPTURE_METHOD" = "headless" ]; then
+        size_args=(--size "${HEADLESS_WIDTH}x${HEADLESS_HEIGHT}")
+    fi
+    INPUT_SERVER_SCRIPT="$server_script"
+
     log "Starting input server on port $INPUT_PORT..."
-    python3 "$server_script" --port "$INPUT_PORT" &
+    python3 "$server_script" --port "$INPUT_PORT" ${size_args[@]+"${size_args[@]}"} &
     INPUT_SERVER_PID=$!
     log "Input server PID: $INPUT_SERVER_PID"
 }
@@ -252,7 +261,8 @@ capture_headless() {
 capture_portal() {
     log "Starting PipeWire portal capture..."
     log "A screen-share dialog will appear — select the Waydroid window."
-    export STREAM_HOST STREAM_PORT FRAMERATE BITRATE
+    export STREAM_HOST STREAM_PORT FRAMERATE BITRATE INPUT_PORT
+    export INPUT_SERVER_SCRIPT
 
     exec python3 - <<'PYEOF'
 """Set up an xdg-desktop-portal ScreenCast session, obtain a PipeWire node,
@@ -261,12 +271,14 @@ over TCP to the receiver."""
 import dbus
 import dbus.mainloop.glib
 from gi.repository import GLib
-import os, sys
+import os, subprocess, sys
 
 RECEIVER_HOST = os.environ.get("STREAM_HOST", "192.168.86.33")
 RECEIVER_PORT = os.environ.get("STREAM_PORT", "9000")
 FRAMERATE      = os.environ.get("FRAMERATE", "30")
 BITRATE        = os.environ.get("BITRATE", "4000")
+INPUT_PORT     = os.environ.get("INPUT_PORT", "9001")
+INPUT_SERVER_SCRIPT = os.environ.get("INPUT_SERVER_SCRIPT", "")
 
 dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
 loop = GLib.MainLoop()
@@ -334,6 +346,14 @@ def on_start(response, results):
     node_id = str(streams[0][0])
     print(f"[portal] PipeWire node: {node_id}", file=sys.stderr)
 
+    # Recreate the input server's touch device at the shared window's size
+    size = streams[0][1].get("size")
+    if size and INPUT_SERVER_SCRIPT:
+        width, height = int(size[0]), int(size[1])
+        print(f"[portal] Stream size: {width}x{height}", file=sys.stderr)
+        subprocess.run([sys.executable, INPUT_SERVER_SCRIPT, "--port", INPUT_PORT,
+                        "--announce-size", f"{width}x{height}"])
+
     pw_fd = screencast.OpenPipeWireRemote(session_path,
                 dbus.Dictionary({}, signature="sv"))
     fd = pw_fd.take()
@@ -3,7 +3,8 @@
 
 Accepts the sender's MPEGTS/H.264 stream over TCP, remuxes to fragmented MP4,
 and serves it to browsers via WebSocket + Media Source Extensions. Touch and
-mouse input from the browser is forwarded to the input server via UDP.
+mouse input from the browser is forwarded to the input server via UDP or a
+Unix socket, or sent by the page straight to its WebSocket endpoint.
 
 Requirements:
     pip install websockets
@@ -11,16 +12,20 @@ Requirements:
 
 Usage:
     python3 web_receiver.py --sender-host 192.168.86.33
+    python3 web_receiver.py --input-unix /run/waydroid-input.sock   # same host
+    python3 web_receiver.py --input-ws-port 9002    # page → input_server directly
     # Open http://<this-machine-ip>:8080 on your phone
 """
 
 import argparse
 import asyncio
 import http.server
+import json
 import socket
 import struct
 import sys
 import threading
+import time
 
 try:
     import websockets
@@ -28,17 +33,23 @@ except ImportError:
     print("Required: pip install websockets", file=sys.stderr)
     sys.exit(1)
 
-STREAM_WIDTH = 1280
-STREAM_HEIGHT = 720
-
-EVENT_FMT = "<BIhhhh"
-EVENT_SIZE = struct.calcsize(EVENT_FMT)
+from input_link import (CLOCK_MAGIC, CLOCK_PING, CLOCK_PING_FMT, CLOCK_PONG,
+                        CLOCK_PONG_FMT, EVENT_SIZE, STREAM_HEIGHT, STREAM_WIDTH,
+                        V2_HEADER_SIZE, V2_MAGIC, InputLink, text_chunk_bytes)
 
 
 def log(msg):
     print(f"[web] {msg}", flush=True)
 
 
+def page_events(msg):
+    """Return the packed events of a browser message (v2 packet or bare events)."""
+    if msg[:2] == V2_MAGIC and len(msg) >= V2_HEADER_SIZE:
+        count = msg[V2_HEADER_SIZE - 1]
+        return msg[V2_HEADER_SIZE:V2_HEADER_SIZE + count * EVENT_SIZE]
+    return msg[:len(msg) - len(msg) % EVENT_SIZE]
+
+
 def find_moof_offset(data):
     """Return byte offset of the first 'moof' box in fMP4 data, or -1."""
     offset = 0
@@ -76,7 +87,7 @@ video{width:100vw;height:100vh;object-fit:contain;background:#000}
 <video id="v" autoplay muted playsinline></video>
 <script>
 const SW=__STREAM_W__,SH=__STREAM_H__;
-const EVT_MOVE=0,EVT_DOWN=1,EVT_UP=2;
+const EVT_MOVE=0,EVT_DOWN=1,EVT_UP=2,EVT_TEXT=7,EVT_TEXT_DATA=8,TEXT_UTF8=1;
 const hud=document.getElementById('hud'),video=document.getElementById('v');
 let ws,sourceBuffer,queue=[],touching=false;
 
@@ -102,7 +113,45 @@ function mapXY(cx,cy){
   return[Math.max(0,Math.min(SW-1,sx)),Math.max(0,Math.min(SH-1,sy))];
 }
 
-function send(e){if(ws&&ws.readyState===1)ws.send(e)}
+/* Protocol v2: 13-byte header (magic "WI", version, flags, sender id, seq,
+   count) in front of the events, so the server can drop late/duplicate
+   packets. A fresh sender id per page load marks a restarted sender. */
+const SENDER_ID=(Math.random()*0x100000000)>>>0;
+let seq=0;
+function pkt(evts){
+  const b=new Uint8Array(13+13*evts.length),d=new DataView(b.buffer);
+  b[0]=0x57;b[1]=0x49;d.setUint8(2,2);d.setUint8(3,0);
+  d.setUint32(4,SENDER_ID,true);d.setUint32(8,seq,true);seq=(seq+1)>>>0;
+  d.setUint8(12,evts.length);
+  evts.forEach((e,i)=>b.set(new Uint8Array(e),13+13*i));
+  return b.buffer;
+}
+
+/* With --input-ws-port the page sends input straight to input_server.py's
+   WebSocket endpoint on this host instead of through this server and UDP,
+   and answers its clock pings ("WC" kind 1) with a pong (kind 2). */
+const INPUT_WS_PORT=__INPUT_WS_PORT__;
+let iws=null;
+function connectInput(){
+  iws=new WebSocket('ws://'+location.hostname+':'+INPUT_WS_PORT);
+  iws.binaryType='arraybuffer';
+  iws.onmessage=e=>{
+    const d=new DataView(e.data);
+    if(d.byteLength<11||d.getUint8(0)!==0x57||d.getUint8(1)!==0x43||d.getUint8(2)!==1)return;
+    const b=new ArrayBuffer(15),p=new DataView(b);
+    p.setUint8(0,0x57);p.setUint8(1,0x43);p.setUint8(2,2);
+    p.setUint32(3,d.getUint32(3,true),true);p.setUint32(7,d.getUint32(7,true),true);
+    p.setUint32(11,(performance.now()|0)>>>0,true);
+    iws.send(b);
+  };
+  iws.onclose=()=>setTimeout(connectInput,2000);
+  iws.onerror=()=>iws.close();
+}
+
+function send(e){
+  const s=INPUT_WS_PORT?iws:ws;
+  if(s&&s.readyState===1)s.send(pkt([e]));
+}
 
 /* --- Touch --- */
 video.addEventListener('touchstart',e=>{
@@ -126,6 +175,39 @@ video.addEventListener('touchcancel',e=>{
   send(mkEvt(EVT_UP,x,y));
 },{passive:false});
 
+/* --- Text: typed by input_server.py as key presses (EVT_TEXT header, then
+   8 UTF-8 bytes per EVT_TEXT_DATA event), so a paste is one packet --- */
+const MAX_TEXT_BYTES=__MAX_TEXT_BYTES__;
+function sendText(str){
+  let data=new TextEncoder().encode(str);
+  while(data.length){
+    let end=Math.min(data.length,MAX_TEXT_BYTES);
+    while(end<data.length&&(data[end]&0xC0)===0x80)end--;
+    const n=Math.ceil(end/8),b=new ArrayBuffer(13*(n+1)),d=new DataView(b);
+    d.setUint8(0,EVT_TEXT);d.setUint32(1,(performance.now()|0)>>>0,true);
+    d.setInt16(5,TEXT_UTF8,true);d.setInt16(9,end,true);
+    const bytes=new Uint8Array(b);
+    for(let i=0;i<n;i++){
+      const o=13*(i+1);
+      d.setUint8(o,EVT_TEXT_DATA);d.setUint32(o+1,(performance.now()|0)>>>0,true);
+      bytes.set(data.subarray(8*i,Math.min(end,8*i+8)),o+5);
+    }
+    const s=INPUT_WS_PORT?iws:ws;
+    if(s&&s.readyState===1)s.send(pkt(Array.from({length:n+1},(_,i)=>b.slice(13*i,13*i+13))));
+    data=data.subarray(end);
+  }
+}
+const TEXT_KEYS={Enter:'\n',Tab:'\t',Backspace:'\b'};
+document.addEventListener('paste',e=>{
+  const t=(e.clipboardData||window.clipboardData).getData('text');
+  if(t){e.preventDefault();sendText(t.replace(/\r\n/g,'\n'))}
+});
+document.addEventListener('keydown',e=>{
+  if(e.ctrlKey||e.metaKey||e.altKey)return;
+  const t=e.key.length===1?e.key:TEXT_KEYS[e.key];
+  if(t){e.preventDefault();sendText(t)}
+});
+
 /* --- Mouse (desktop testing) --- */
 video.addEventListener('mousedown',e=>{
   if(e.button)return;touching=true;
@@ -189,6 +271,10 @@ function connect(){
       }else{queue.push(e.data)}
       if(video.paused)video.play().catch(()=>{});
       info('▶ Playing');
+    }else{
+      const m=JSON.parse(e.data);
+      if(m.type==='ping')ws.send(JSON.stringify(
+        {type:'pong',id:m.id,ts:(performance.now()|0)>>>0}));
     }
   };
 
@@ -198,6 +284,7 @@ function connect(){
 
 if(!window.MediaSource){info('ERROR: MediaSource not supported')}
 else{connect()}
+if(INPUT_WS_PORT)connectInput();
 </script>
 </body>
 </html>"""
@@ -211,10 +298,18 @@ class StreamServer:
         self.args = args
         self.clients = set()
         self.init_segment = None
-        self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sender_addr = (
-            (args.sender_host, args.input_port) if args.sender_host else None
-        )
+        if args.input_unix:
+            # Co-located input_server.py: skip the UDP stack. Autobind so
+            # clock pings can be answered.
+            self.udp_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.udp_sock.bind("")
+            self.sender_addr = args.input_unix
+        else:
+            self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sender_addr = (
+                (args.sender_host, args.input_port) if args.sender_host else None
+            )
+        self.links = {}  # sender_id -> browser WebSocket, for clock pings
 
     # ---- WebSocket ----
     async def ws_handler(self, websocket, path=None):
@@ -226,17 +321,74 @@ class StreamServer:
             except Exception:
                 return
         self.clients.add(websocket)
+        # The WebSocket hop is reliable; only the UDP hop to input_server.py
+        # needs sequencing and redundancy, so each browser gets its own link
+        link = None
+        if self.sender_addr:
+            link = InputLink(self.udp_sock, self.sender_addr,
+                             redundancy=self.args.input_redundancy)
+            self.links[link.sender_id] = websocket
+        loop = asyncio.get_running_loop()
         try:
             async for msg in websocket:
-                if (isinstance(msg, bytes) and self.sender_addr
-                        and len(msg) >= EVENT_SIZE):
-                    self.udp_sock.sendto(msg, self.sender_addr)
+                if link is None:
+                    continue
+                if isinstance(msg, bytes):
+                    if len(msg) >= EVENT_SIZE and link.send(page_events(msg)):
+                        for due in link.repeat_due:
+                            loop.call_at(loop.time() + due - time.monotonic(),
+                                         link.tick)
+                else:
+                    self.on_page_pong(link, msg)
         except websockets.exceptions.ConnectionClosed:
             pass
         finally:
             self.clients.discard(websocket)
+            if link is not None:
+                self.links.pop(link.sender_id, None)
             log(f"Browser disconnected: {addr}")
 
+    # ---- Clock sync relay ----
+    # Pings from input_server.py --latency-stats for a browser's sender id
+    # are relayed to its page over the WebSocket as {"type": "ping", "id": n};
+    # the page answers with its performance.now() clock, the one it stamps
+    # events with, and the pong goes back over UDP.
+    def on_udp_readable(self):
+        """Relay clock pings from input_server.py to the matching page."""
+        size = struct.calcsize(CLOCK_PING_FMT)
+        while True:
+            try:
+                data = self.udp_sock.recv(64, socket.MSG_DONTWAIT)
+            except OSError:
+                return  # queue drained
+            if len(data) < size:
+                continue
+            magic, kind, sender_id, ping_id = struct.unpack_from(CLOCK_PING_FMT, data)
+            websocket = self.links.get(sender_id)
+            if magic == CLOCK_MAGIC and kind == CLOCK_PING and websocket is not None:
+                asyncio.ensure_future(self._send_text(
+                    websocket, json.dumps({"type": "ping", "id": ping_id})))
+
+    async def _send_text(self, websocket, text):
+        try:
+            await websocket.send(text)
+        except Exception:
+            pass
+
+    def on_page_pong(self, link, text):
+        try:
+            msg = json.loads(text)
+            if msg.get("type") != "pong":
+                return
+            pong = struct.pack(CLOCK_PONG_FMT, CLOCK_MAGIC, CLOCK_PONG, link.sender_id,
+                               int(msg["id"]) & 0xFFFFFFFF, int(msg["ts"]) & 0xFFFFFFFF)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return
+        try:
+            self.udp_sock.sendto(pong, self.sender_addr)
+        except OSError:
+            pass
+
     async def broadcast(self, data):
         dead = set()
         for ws in self.clients:
@@ -321,11 +473,14 @@ class StreamServer:
 
     # ---- Run everything ----
     async def run(self):
+        max_text_bytes = text_chunk_bytes(redundancy=self.args.input_redundancy)
         html = (
             HTML_PAGE
             .replace("__WS_PORT__", str(self.args.ws_port))
+            .replace("__INPUT_WS_PORT__", str(self.args.input_ws_port))
             .replace("__STREAM_W__", str(STREAM_WIDTH))
             .replace("__STREAM_H__", str(STREAM_HEIGHT))
+            .replace("__MAX_TEXT_BYTES__", str(max_text_bytes))
         )
 
         handler_cls = _make_http_handler(html)
@@ -344,8 +499,15 @@ class StreamServer:
         )
         log(f"TCP   → 0.0.0.0:{self.args.port}  (waiting for sender)")
 
-        if self.sender_addr:
+        if self.args.input_ws_port:
+            log(f"Input → browsers direct to input_server ws://<page host>:"
+                f"{self.args.input_ws_port}")
+        elif self.args.input_unix:
+            log(f"Input → Unix {self.sender_addr}")
+            asyncio.get_running_loop().add_reader(self.udp_sock, self.on_udp_readable)
+        elif self.sender_addr:
             log(f"Input → UDP {self.sender_addr[0]}:{self.sender_addr[1]}")
+            asyncio.get_running_loop().add_reader(self.udp_sock, self.on_udp_readable)
         else:
             log("Input forwarding: off (use --sender-host to enable)")
 
@@ -381,7 +543,17 @@ def main():
                     help="Sender IP for input forwarding (UDP)")
     ap.add_argument("--input-port", type=int, default=9001,
                     help="UDP port for input forwarding (default: 9001)")
+    ap.add_argument("--input-redundancy", type=int, default=0, metavar="N",
+                    help="Repeat the last N down/up/key events in every input "
+                         "packet, plus N follow-up packets (default: 0 = off)")
+    ap.add_argument("--input-unix", metavar="PATH", default=None,
+                    help="Forward input to input_server.py --unix PATH on this "
+                         "host instead of UDP (default: off)")
+    ap.add_argument("--input-ws-port", type=int, default=0,
+                    help="Have the page send input directly to input_server.py "
+                         "--ws-port on this host (default: 0 = via this server)")
     args = ap.parse_args()
+    args.input_redundancy = max(0, min(16, args.input_redundancy))
 
     log("=== Web Game Stream Receiver ===")
     server = StreamServer(args)
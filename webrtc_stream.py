@@ -22,13 +22,14 @@ Usage:
 
 import argparse
 import asyncio
+import collections
 import json
 import logging
 import os
 import signal
-import struct
 import subprocess
 import sys
+import threading
 
 try:
     import gi
@@ -49,7 +50,9 @@ except ImportError:
     sys.exit(1)
 
 try:
-    from evdev import UInput, AbsInfo, ecodes
+    from input_engine import (EVENT_SIZE, STREAM_WIDTH, STREAM_HEIGHT,
+                              InjectionEngine, ProtocolStats, SenderTable,
+                              create_device, decode_datagram)
 except ImportError:
     print("Required: pip install evdev", file=sys.stderr)
     sys.exit(1)
@@ -57,44 +60,9 @@ except ImportError:
 # ---------------------------------------------------------------------------
 # Constants
 # ---------------------------------------------------------------------------
-STREAM_WIDTH = 1280
-STREAM_HEIGHT = 720
 FRAMERATE = 30
 BITRATE = 4000000  # 4 Mbps
 
-EVENT_FMT = "<BIhhhh"
-EVENT_SIZE = struct.calcsize(EVENT_FMT)
-
-EVT_MOUSE_MOVE = 0
-EVT_MOUSE_DOWN = 1
-EVT_MOUSE_UP = 2
-EVT_KEY_DOWN = 3
-EVT_KEY_UP = 4
-
-MAX_TOUCH_SLOTS = 10
-
-KEYBOARD_KEYS = [
-    ecodes.KEY_ESC, ecodes.KEY_1, ecodes.KEY_2, ecodes.KEY_3, ecodes.KEY_4,
-    ecodes.KEY_5, ecodes.KEY_6, ecodes.KEY_7, ecodes.KEY_8, ecodes.KEY_9,
-    ecodes.KEY_0, ecodes.KEY_MINUS, ecodes.KEY_EQUAL, ecodes.KEY_BACKSPACE,
-    ecodes.KEY_TAB, ecodes.KEY_Q, ecodes.KEY_W, ecodes.KEY_E, ecodes.KEY_R,
-    ecodes.KEY_T, ecodes.KEY_Y, ecodes.KEY_U, ecodes.KEY_I, ecodes.KEY_O,
-    ecodes.KEY_P, ecodes.KEY_LEFTBRACE, ecodes.KEY_RIGHTBRACE, ecodes.KEY_ENTER,
-    ecodes.KEY_LEFTCTRL, ecodes.KEY_A, ecodes.KEY_S, ecodes.KEY_D, ecodes.KEY_F,
-    ecodes.KEY_G, ecodes.KEY_H, ecodes.KEY_J, ecodes.KEY_K, ecodes.KEY_L,
-    ecodes.KEY_SEMICOLON, ecodes.KEY_APOSTROPHE, ecodes.KEY_GRAVE,
-    ecodes.KEY_LEFTSHIFT, ecodes.KEY_BACKSLASH, ecodes.KEY_Z, ecodes.KEY_X,
-    ecodes.KEY_C, ecodes.KEY_V, ecodes.KEY_B, ecodes.KEY_N, ecodes.KEY_M,
-    ecodes.KEY_COMMA, ecodes.KEY_DOT, ecodes.KEY_SLASH, ecodes.KEY_RIGHTSHIFT,
-    ecodes.KEY_LEFTALT, ecodes.KEY_SPACE, ecodes.KEY_RIGHTCTRL,
-    ecodes.KEY_RIGHTALT, ecodes.KEY_UP, ecodes.KEY_DOWN, ecodes.KEY_LEFT,
-    ecodes.KEY_RIGHT, ecodes.KEY_DELETE, ecodes.KEY_HOME, ecodes.KEY_END,
-    ecodes.KEY_PAGEUP, ecodes.KEY_PAGEDOWN,
-    ecodes.KEY_F1, ecodes.KEY_F2, ecodes.KEY_F3, ecodes.KEY_F4,
-    ecodes.KEY_F5, ecodes.KEY_F6, ecodes.KEY_F7, ecodes.KEY_F8,
-    ecodes.KEY_F9, ecodes.KEY_F10, ecodes.KEY_F11, ecodes.KEY_F12,
-]
-
 
 def log(msg):
     print(f"[webrtc] {msg}", flush=True)
@@ -166,47 +134,62 @@ function mapXY(cx,cy){
   return[Math.max(0,Math.min(SW-1,sx)),Math.max(0,Math.min(SH-1,sy))];
 }
 
-function sendEvt(e){if(dc&&dc.readyState==='open')dc.send(e)}
+/* Protocol v2: 13-byte header (magic "WI", version, flags, sender id, seq,
+   count) in front of the events, so the server can drop late/duplicate
+   packets. A fresh sender id per page load marks a restarted sender. */
+const SENDER_ID=(Math.random()*0x100000000)>>>0;
+let seq=0;
+function pkt(evts){
+  const b=new Uint8Array(13+13*evts.length),d=new DataView(b.buffer);
+  b[0]=0x57;b[1]=0x49;d.setUint8(2,2);d.setUint8(3,0);
+  d.setUint32(4,SENDER_ID,true);d.setUint32(8,seq,true);seq=(seq+1)>>>0;
+  d.setUint8(12,evts.length);
+  evts.forEach((e,i)=>b.set(new Uint8Array(e),13+13*i));
+  return b.buffer;
+}
+
+/* One packet per input callback, so fingers that move together land in
+   the same injected frame */
+function sendEvts(evts){if(evts.length&&dc&&dc.readyState==='open')dc.send(pkt(evts))}
+function sendEvt(e){sendEvts([e])}
 
 /* --- Multi-touch handlers --- */
 video.addEventListener('touchstart',e=>{
   e.preventDefault();
+  const evts=[];
   for(const t of e.changedTouches){
     const slot=allocSlot(t.identifier);
     if(slot<0)continue;
     const[x,y]=mapXY(t.clientX,t.clientY);
-    sendEvt(mkEvt(EVT_DOWN,x,y,slot));
+    evts.push(mkEvt(EVT_DOWN,x,y,slot));
   }
+  sendEvts(evts);
 },{passive:false});
 video.addEventListener('touchmove',e=>{
   e.preventDefault();
+  const evts=[];
   for(const t of e.changedTouches){
     const slot=idToSlot.get(t.identifier);
     if(slot===undefined)continue;
     const[x,y]=mapXY(t.clientX,t.clientY);
-    sendEvt(mkEvt(EVT_MOVE,x,y,slot));
-  }
-},{passive:false});
-video.addEventListener('touchend',e=>{
-  e.preventDefault();
-  for(const t of e.changedTouches){
-    const slot=idToSlot.get(t.identifier);
-    if(slot===undefined)continue;
-    const[x,y]=mapXY(t.clientX,t.clientY);
-    sendEvt(mkEvt(EVT_UP,x,y,slot));
-    freeSlot(t.identifier);
+    evts.push(mkEvt(EVT_MOVE,x,y,slot));
   }
+  sendEvts(evts);
 },{passive:false});
-video.addEventListener('touchcancel',e=>{
+function touchUp(e){
   e.preventDefault();
+  const evts=[];
   for(const t of e.changedTouches){
     const slot=idToSlot.get(t.identifier);
     if(slot===undefined)continue;
     const[x,y]=mapXY(t.clientX,t.clientY);
-    sendEvt(mkEvt(EVT_UP,x,y,slot));
+    evts.push(mkEvt(EVT_UP,x,y,slot));
     freeSlot(t.identifier);
   }
-},{passive:false});
+  sendEvts(evts);
+}
+video.addEventListener('touchend',touchUp,{passive:false});
+video.addEventListener('touchcancel',touchUp,{passive:false});
 
 /* --- Mouse (desktop testing, slot 0) --- */
 let mouseDown=false;
@@ -304,81 +287,58 @@ connect();
 
 
 # ---------------------------------------------------------------------------
-# Multi-touch uinput device
+# Data channel input
 # ---------------------------------------------------------------------------
 class InputInjector:
-    """Virtual touchscreen with multi-touch type B protocol (10 slots)."""
-
-    def __init__(self):
-        capabilities = {
-            ecodes.EV_ABS: [
-                (ecodes.ABS_X, AbsInfo(value=0, min=0, max=STREAM_WIDTH - 1,
-                                       fuzz=0, flat=0, resolution=0)),
-                (ecodes.ABS_Y, AbsInfo(value=0, min=0, max=STREAM_HEIGHT - 1,
-                                       fuzz=0, flat=0, resolution=0)),
-                (ecodes.ABS_MT_SLOT, AbsInfo(value=0, min=0, max=MAX_TOUCH_SLOTS - 1,
-                                             fuzz=0, flat=0, resolution=0)),
-                (ecodes.ABS_MT_TRACKING_ID, AbsInfo(value=0, min=-1,
-                                                     max=MAX_TOUCH_SLOTS - 1,
-                                                     fuzz=0, flat=0, resolution=0)),
-                (ecodes.ABS_MT_POSITION_X, AbsInfo(value=0, min=0,
-                                                    max=STREAM_WIDTH - 1,
-                                                    fuzz=0, flat=0, resolution=0)),
-                (ecodes.ABS_MT_POSITION_Y, AbsInfo(value=0, min=0,
-                                                    max=STREAM_HEIGHT - 1,
-                                                    fuzz=0, flat=0, resolution=0)),
-            ],
-            ecodes.EV_KEY: [ecodes.BTN_TOUCH] + KEYBOARD_KEYS,
-        }
-        self.dev = UInput(events=capabilities, name="webrtc-stream-touch",
-                          vendor=0x1234, product=0x5678,
-                          input_props=[ecodes.INPUT_PROP_DIRECT])
-        self.active_slots = set()
-        log(f"Created virtual touchscreen: {self.dev.device.path}")
-
-    def handle_event(self, evt_type, arg1, arg2, arg3, arg4):
-        slot = max(0, min(MAX_TOUCH_SLOTS - 1, arg3))
-
-        if evt_type == EVT_MOUSE_MOVE:
-            self.dev.write(ecodes.EV_ABS, ecodes.ABS_MT_SLOT, slot)
-            self.dev.write(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_X, arg1)
-            self.dev.write(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_Y, arg2)
-            if slot == 0:
-                self.dev.write(ecodes.EV_ABS, ecodes.ABS_X, arg1)
-                self.dev.write(ecodes.EV_ABS, ecodes.ABS_Y, arg2)
-            self.dev.syn()
-
-        elif evt_type == EVT_MOUSE_DOWN:
-            self.active_slots.add(slot)
-            self.dev.write(ecodes.EV_ABS, ecodes.ABS_MT_SLOT, slot)
-            self.dev.write(ecodes.EV_ABS, ecodes.ABS_MT_TRACKING_ID, slot)
-            self.dev.write(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_X, arg1)
-            self.dev.write(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_Y, arg2)
-            if len(self.active_slots) == 1:
-                self.dev.write(ecodes.EV_KEY, ecodes.BTN_TOUCH, 1)
-            if slot == 0:
-                self.dev.write(ecodes.EV_ABS, ecodes.ABS_X, arg1)
-                self.dev.write(ecodes.EV_ABS, ecodes.ABS_Y, arg2)
-            self.dev.syn()
-
-        elif evt_type == EVT_MOUSE_UP:
-            self.active_slots.discard(slot)
-            self.dev.write(ecodes.EV_ABS, ecodes.ABS_MT_SLOT, slot)
-            self.dev.write(ecodes.EV_ABS, ecodes.ABS_MT_TRACKING_ID, -1)
-            if not self.active_slots:
-                self.dev.write(ecodes.EV_KEY, ecodes.BTN_TOUCH, 0)
-            self.dev.syn()
-
-        elif evt_type == EVT_KEY_DOWN:
-            self.dev.write(ecodes.EV_KEY, arg1, 1)
-            self.dev.syn()
-
-        elif evt_type == EVT_KEY_UP:
-            self.dev.write(ecodes.EV_KEY, arg1, 0)
-            self.dev.syn()
+    """Data channel input: v2 sequencing, then input_engine.py injection.
+
+    The virtual touchscreen, slot tracking and frame batching are the same
+    InjectionEngine that input_server.py uses, and so is the v2 decoding.
+    """
+
+    def __init__(self, writer="raw"):
+        self.stats = ProtocolStats()
+        self.engine = InjectionEngine(create_device("uinput", writer,
+                                                    name="webrtc-stream-touch"),
+                                      self.stats)
+        # Messages waiting for injection; filled from the data channel thread
+        self.pending = collections.deque()
+        # Held while decoding and injecting, so the sender table and the
+        # engine are only ever touched by one thread
+        self.inject_lock = threading.Lock()
+        # Protocol v2 sequencing, per sender id
+        self.senders = SenderTable(max_senders=16)
+
+    def submit(self, raw):
+        """Queue a v2 or legacy message and inject everything that is pending.
+
+        Whoever holds the inject lock drains the whole queue into one
+        engine batch, so messages that pile up behind a slow injection are
+        coalesced to the newest position per slot and written as one frame.
+
+        The data channel is reliable and ordered, but the page may reconnect
+        with a new sender id, and the same checks as input_server.py keep a
+        repeated DOWN from corrupting active_slots.
+        """
+        self.pending.append(raw)
+        while self.pending and self.inject_lock.acquire(blocking=False):
+            try:
+                batch = []
+                while self.pending:
+                    decode_datagram(memoryview(self.pending.popleft()), batch,
+                                    self.senders, self.stats)
+                self.engine.inject(batch)
+            finally:
+                self.inject_lock.release()
 
     def close(self):
-        self.dev.close()
+        stats = self.stats
+        log(f"Input: {stats.events} events injected in {stats.frames} frames, "
+            f"{stats.coalesced} stale moves coalesced, "
+            f"{stats.unknown} of unknown type ignored, {stats.errors} errors, "
+            f"{stats.duplicates} duplicate / {stats.late} late packets dropped, "
+            f"{stats.seq_gaps} sequence gaps, {stats.malformed} malformed")
+        self.engine.close()
 
 
 # ---------------------------------------------------------------------------
@@ -600,17 +560,9 @@ class WebRTCStream:
         raw = data.get_data()
         if raw is None or len(raw) < EVENT_SIZE:
             return
-        offset = 0
-        while offset + EVENT_SIZE <= len(raw):
-            evt_type, _ts, arg1, arg2, arg3, arg4 = struct.unpack_from(
-                EVENT_FMT, raw, offset
-            )
-            offset += EVENT_SIZE
-            if self.input_injector:
-                try:
-                    self.input_injector.handle_event(evt_type, arg1, arg2, arg3, arg4)
-                except Exception as e:
-                    log(f"Input injection error: {e}")
+        if self.input_injector is None:
+            return
+        self.input_injector.submit(raw)
 
     def _on_bus_error(self, bus, msg):
         err, debug = msg.parse_error()
@@ -683,7 +635,7 @@ class StreamServer:
 
         # Create uinput device
         try:
-            self.input_injector = InputInjector()
+            self.input_injector = InputInjector(self.args.input_writer)
         except Exception as e:
             log(f"WARNING: Could not create uinput device: {e}")
             log("  Input injection will be disabled")
@@ -794,6 +746,9 @@ def main():
     ap.add_argument("--capture-method", default=None,
                     help="Capture method: test, headless, pipewire "
                          "(default: env CAPTURE_METHOD or test)")
+    ap.add_argument("--input-writer", choices=["raw", "evdev"], default="raw",
+                    help="uinput writer: one os.write() per frame, or "
+                         "python-evdev per-event writes (default: raw)")
     args = ap.parse_args()
 
     if args.capture_method is None: